@@ -1,7 +1,41 @@
-from flask import Flask, request, redirect
+from flask import Flask, Response, request, redirect
+from werkzeug.exceptions import HTTPException
+import html
 import json
+import os
+import sys
+
+# Make the shared `ivnet` package importable when Vercel loads this file directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet import batch, config, views
+from ivnet.codec import JSONProvider
+from ivnet.clusters import ClusterPyramid
+from ivnet.ingest import QueueFull, ShardedIngest
+from ivnet.live import Broadcaster
+from ivnet.logs import get_logger
+from ivnet.metrics import RequestMetrics
+from ivnet.query import QueryError, get_int
+from ivnet.ratelimit import BatchCharge, RateLimiter
+from ivnet.retention import Sweeper
+from ivnet.schema import Schema, SchemaError, check_length
+from ivnet.sessions import SessionIndex
+from ivnet.spatial import GridIndex
+from ivnet.static import StaticAsset, serve
+from ivnet.store import open_store
+from ivnet.thinning import Thinner
 
 app = Flask(__name__)
+# request.get_json(), jsonify and returned dicts go through orjson when installed
+app.json = JSONProvider(app)
+# Bodies over IVNET_MAX_BODY_BYTES are refused with a 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_BODY_BYTES
+# JSON lines on stdout, written by a background thread (see ivnet/logs.py)
+log = get_logger('api')
+# Per-route counts, latency histograms and byte totals for /metrics; its
+# hooks go first so the timing covers the ones below
+request_metrics = RequestMetrics()
+request_metrics.instrument(app)
 
 # Add security headers for location access
 @app.before_request
@@ -10,6 +44,12 @@ def force_https():
     if not request.is_secure and request.host != 'localhost:5000' and request.host != '127.0.0.1:5000':
         return redirect(request.url.replace('http://', 'https://'), code=301)
 
+@app.before_request
+def sync_pending_writes():
+    # Reads must see every fix that has already been acknowledged
+    if request.method == 'GET':
+        ingest.sync()
+
 @app.after_request
 def after_request(response):
     # Enable location access for HTTPS
@@ -24,41 +64,66 @@ def after_request(response):
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     return response
 
-# Simple in-memory storage
-locations = []
+# Persistent segment store (survives restarts, unless DATA_DIR is ephemeral; see ivnet/store.py)
+locations = open_store('locations')
+if config.EPHEMERAL:
+    log.warning('storage_not_persistent', path=config.DATA_DIR,
+                hint='fixes are lost when this instance is recycled; set IVNET_DATA_DIR to a persistent volume')
+# All writes go through sharded buffers so concurrent requests never race on ids
+ingest = ShardedIngest(locations)
+# Grid index for area queries, kept current on every append
+area_index = GridIndex(locations)
+# Per-zoom map clusters, also kept current on every append
+cluster_pyramid = ClusterPyramid(locations)
+# Running per-session totals (first/last seen, distance, top speed)
+session_index = SessionIndex(locations)
+# One shared ring of encoded fixes feeds every /live stream
+live_feed = Broadcaster(locations)
+# Expires the oldest fixes past IVNET_RETAIN_POINTS / IVNET_RETAIN_SECONDS (off by default)
+retention = Sweeper(locations)
+# Near-duplicate fixes from the same session (periodic re-sends) are not stored
+thinner = Thinner()
+store_fixes = thinner.wrap(ingest.append_many)
+# Posted fixes keep only known, well-typed fields, with strings capped (see ivnet/schema.py)
+schema = Schema()
+# Token bucket per session (or address) on the ingest routes; past it, a 429 with Retry-After
+limiter = RateLimiter()
+
+MANIFEST = {
+    "name": "🌎 ivnet Location Tracker",
+    "short_name": "ivnet Tracker",
+    "description": "Professional location tracking system",
+    "start_url": "/tracker",
+    "display": "standalone",
+    "background_color": "#6c757d",
+    "theme_color": "#495057",
+    "orientation": "portrait",
+    "scope": "/",
+    "categories": ["utilities", "productivity"],
+    "icons": [
+        {
+            "src": "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'%3E%3Ccircle cx='50' cy='50' r='45' fill='%236c757d'/%3E%3Ctext x='50' y='65' font-size='50' text-anchor='middle' fill='white'%3E🌎%3C/text%3E%3C/svg%3E",
+            "sizes": "192x192",
+            "type": "image/svg+xml",
+            "purpose": "any maskable"
+        },
+        {
+            "src": "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'%3E%3Ccircle cx='50' cy='50' r='45' fill='%236c757d'/%3E%3Ctext x='50' y='65' font-size='50' text-anchor='middle' fill='white'%3E%3C/text%3E%3C/svg%3E",
+            "sizes": "512x512",
+            "type": "image/svg+xml",
+            "purpose": "any maskable"
+        }
+    ]
+}
+
+# Serialized like Flask's own dict responses: sorted keys, compact, trailing newline
+MANIFEST_JSON = StaticAsset(json.dumps(MANIFEST, sort_keys=True, separators=(',', ':')) + '\n', 'application/json')
 
 @app.route('/manifest.json')
 def manifest():
-    return {
-        "name": "🌎 ivnet Location Tracker",
-        "short_name": "ivnet Tracker",
-        "description": "Professional location tracking system",
-        "start_url": "/tracker",
-        "display": "standalone",
-        "background_color": "#6c757d",
-        "theme_color": "#495057",
-        "orientation": "portrait",
-        "scope": "/",
-        "categories": ["utilities", "productivity"],
-        "icons": [
-            {
-                "src": "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'%3E%3Ccircle cx='50' cy='50' r='45' fill='%236c757d'/%3E%3Ctext x='50' y='65' font-size='50' text-anchor='middle' fill='white'%3E🌎%3C/text%3E%3C/svg%3E",
-                "sizes": "192x192",
-                "type": "image/svg+xml",
-                "purpose": "any maskable"
-            },
-            {
-                "src": "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'%3E%3Ccircle cx='50' cy='50' r='45' fill='%236c757d'/%3E%3Ctext x='50' y='65' font-size='50' text-anchor='middle' fill='white'%3E%3C/text%3E%3C/svg%3E",
-                "sizes": "512x512",
-                "type": "image/svg+xml",
-                "purpose": "any maskable"
-            }
-        ]
-    }
+    return serve(MANIFEST_JSON)
 
-@app.route('/sw.js')
-def service_worker():
-    return '''
+SERVICE_WORKER = StaticAsset('''
     const CACHE_NAME = 'ivnet-tracker-v1';
     const urlsToCache = [
         '/tracker',
@@ -85,11 +150,13 @@ def service_worker():
             )
         );
     });
-    ''', 200, {'Content-Type': 'application/javascript'}
+    ''', 'application/javascript')
 
-@app.route('/')
-def home():
-    return '''
+@app.route('/sw.js')
+def service_worker():
+    return serve(SERVICE_WORKER)
+
+HOME_PAGE = StaticAsset('''
     <html>
     <head>
         <meta charset="UTF-8">
@@ -134,11 +201,13 @@ def home():
         </script>
     </body>
     </html>
-    '''
+    ''', 'text/html; charset=utf-8')
 
-@app.route('/tracker')
-def tracker():
-    return '''
+@app.route('/')
+def home():
+    return serve(HOME_PAGE)
+
+TRACKER_PAGE = StaticAsset('''
     <html>
     <head>
         <meta charset="UTF-8">
@@ -625,11 +694,19 @@ def tracker():
         </script>
     </body>
     </html>
-    '''
+    ''', 'text/html; charset=utf-8')
 
-@app.route('/dashboard')
-def dashboard():
-    return f'''
+@app.route('/tracker')
+def tracker():
+    return serve(TRACKER_PAGE)
+
+# Cards per dashboard page unless ?limit= says otherwise
+DASHBOARD_PAGE_SIZE = 50
+DASHBOARD_MAX_PAGE_SIZE = 500
+
+BUTTON_STYLE = "padding: 12px 20px; margin: 5px; border: none; border-radius: 8px; cursor: pointer; background: linear-gradient(45deg, #007bff, #0056b3); color: white; font-weight: bold;"
+
+DASHBOARD_HEAD = f'''
     <html>
     <head>
         <meta charset="UTF-8">
@@ -647,57 +724,237 @@ def dashboard():
             <h1 style="text-align: center;">🌎 ivnet Dashboard</h1>
             
             <div style="text-align: center; margin: 30px 0;">
-                <button onclick="location.href='/tracker'" style="padding: 12px 20px; margin: 5px; border: none; border-radius: 8px; cursor: pointer; background: linear-gradient(45deg, #007bff, #0056b3); color: white; font-weight: bold;">🔙 Back to Tracker</button>
-                <button onclick="location.reload()" style="padding: 12px 20px; margin: 5px; border: none; border-radius: 8px; cursor: pointer; background: linear-gradient(45deg, #007bff, #0056b3); color: white; font-weight: bold;">🔄 Refresh</button>
+                <button onclick="location.href='/tracker'" style="{BUTTON_STYLE}">🔙 Back to Tracker</button>
+                <button onclick="location.reload()" style="{BUTTON_STYLE}">🔄 Refresh</button>
             </div>
             
             <div style="text-align: center; padding: 20px;">
-                <h2>📍 Total Locations: {len(locations)}</h2>
+                <h2>📍 Total Locations: <span id="total">{{total}}</span></h2>
                 <p>Server Status: <span style="color: #00ff00;">ONLINE</span></p>
             </div>
             
-            <div>
-                {'<p style="text-align: center; padding: 40px;">No locations tracked yet. Use the tracker!</p>' if len(locations) == 0 else ''.join([f'<div style="border: 1px solid rgba(255,255,255,0.2); margin: 15px 0; padding: 20px; border-radius: 10px; background: rgba(255,255,255,0.1);"><h3>📍 Location #{i+1}</h3><p>Coordinates: {loc.get("latitude", "Unknown")}, {loc.get("longitude", "Unknown")}</p><p>Time: {loc.get("timestamp", "Unknown")}</p><p>Device: {loc.get("platform", "Unknown")}</p></div>' for i, loc in enumerate(reversed(locations))])}
+            <div id="cards">
+                '''
+
+DASHBOARD_TAIL = '''
             </div>
         </div>
         
         <script>
+            // Live feed: count every new fix, and on the first page show it as a new top card
+            if (window.EventSource) {
+                const cards = document.getElementById('cards');
+                const total = document.getElementById('total');
+                const template = document.createElement('template');
+                template.innerHTML = '<div class="card" style="border: 1px solid rgba(255,255,255,0.2); margin: 15px 0; padding: 20px; border-radius: 10px; background: rgba(255,255,255,0.1);"><h3></h3><p></p><p></p><p></p></div>';
+                const feed = new EventSource('/live?after_id=' + LIVE.after_id);
+                let count = LIVE.total;
+
+                function show(loc) {
+                    const card = template.content.firstChild.cloneNode(true);
+                    const lines = card.querySelectorAll('p');
+                    const field = name => (loc[name] === undefined ? 'Unknown' : loc[name]);
+                    lines[0].textContent = `Coordinates: ${field('latitude')}, ${field('longitude')}`;
+                    lines[1].textContent = `Time: ${field('timestamp')}`;
+                    lines[2].textContent = `Device: ${field('platform')}`;
+                    const empty = cards.querySelector(':scope > p');
+                    if (empty) empty.remove();
+                    cards.insertBefore(card, cards.firstChild);
+                    const shown = cards.querySelectorAll('.card');
+                    if (shown.length > LIVE.limit) shown[shown.length - 1].remove();
+                    // Cards are numbered newest first, so everything moves down one
+                    cards.querySelectorAll('.card h3').forEach((heading, i) => {
+                        heading.textContent = `📍 Location #${i + 1}`;
+                    });
+                }
+
+                feed.onmessage = event => {
+                    total.textContent = ++count;
+                    if (LIVE.page === 1) show(JSON.parse(event.data));
+                };
+                feed.addEventListener('gap', event => {
+                    count += JSON.parse(event.data).missed;
+                    total.textContent = count;
+                });
+                feed.addEventListener('reset', () => location.reload());
+            }
+
             // Register Service Worker
-            if ('serviceWorker' in navigator) {{
+            if ('serviceWorker' in navigator) {
                 navigator.serviceWorker.register('/sw.js')
                     .then(registration => console.log('SW registered'))
                     .catch(error => console.log('SW registration failed'));
-            }}
+            }
         </script>
     </body>
     </html>
     '''
 
+def render_dashboard(total, page, limit):
+    """Yield the dashboard HTML in pieces, so the head is sent before any card is rendered"""
+    yield DASHBOARD_HEAD.replace('{total}', str(total))
+    if total == 0:
+        yield '<p style="text-align: center; padding: 40px;">No locations tracked yet. Use the tracker!</p>'
+    else:
+        offset = (page - 1) * limit
+        # Cards stay numbered newest-first across the whole history
+        # Fix fields are whatever the client posted, so they are escaped
+        for i, loc in enumerate(locations.latest(limit, offset), offset):
+            yield f'<div class="card" style="border: 1px solid rgba(255,255,255,0.2); margin: 15px 0; padding: 20px; border-radius: 10px; background: rgba(255,255,255,0.1);"><h3>📍 Location #{i+1}</h3><p>Coordinates: {html.escape(str(loc.get("latitude", "Unknown")))}, {html.escape(str(loc.get("longitude", "Unknown")))}</p><p>Time: {html.escape(str(loc.get("timestamp", "Unknown")))}</p><p>Device: {html.escape(str(loc.get("platform", "Unknown")))}</p></div>'
+        pages = (total + limit - 1) // limit
+        newer = f'''<button onclick="location.href='/dashboard?page={page - 1}&limit={limit}'" style="{BUTTON_STYLE}">⬅️ Newer</button>''' if page > 1 else ''
+        older = f'''<button onclick="location.href='/dashboard?page={page + 1}&limit={limit}'" style="{BUTTON_STYLE}">Older ➡️</button>''' if page < pages else ''
+        yield f'<div style="text-align: center; margin: 20px 0;">{newer}<span style="margin: 0 15px;">Page {page} of {pages}</span>{older}</div>'
+    # Everything stored so far is on the page; the live feed picks up after it
+    yield f'<script>const LIVE = {json.dumps({"after_id": len(locations), "total": total, "page": page, "limit": limit})};</script>'
+    yield DASHBOARD_TAIL
+
+@app.route('/dashboard')
+def dashboard():
+    page = get_int(request.args, 'page', 1, minimum=1)
+    limit = get_int(request.args, 'limit', DASHBOARD_PAGE_SIZE, minimum=1, maximum=DASHBOARD_MAX_PAGE_SIZE)
+    return Response(render_dashboard(locations.live, page, limit), mimetype='text/html')
+
+@app.route('/live')
+def live():
+    # Server-Sent Events: one message per newly stored fix (see ivnet/live.py)
+    return views.live_response(live_feed, request.args, request.headers.get('Last-Event-ID'))
+
 @app.route('/save', methods=['POST'])
 def save():
+    check_length(request.content_length)
     try:
         data = request.get_json()
         if data:
-            # Add server timestamp
-            import datetime
-            data['server_timestamp'] = datetime.datetime.now().isoformat()
-            locations.append(data)
-            print(f"Location saved: {data.get('latitude', 'Unknown')}, {data.get('longitude', 'Unknown')}")
-            return {"status": "success", "message": "Location saved successfully", "total_locations": len(locations)}
+            fix = schema.normalize(data)
+            limiter.check_client(request.environ, fix.get('sessionId'))
+            # The store stamps the server timestamp on append
+            store_fixes([fix])
+            log.sampled('location_saved', latitude=fix.get('latitude'), longitude=fix.get('longitude'))
+            return {"status": "success", "message": "Location saved successfully", "total_locations": ingest.live}
         else:
             return {"status": "error", "message": "No data received"}, 400
+    except SchemaError as e:
+        return {"status": "error", "message": str(e)}, 400
+    except (HTTPException, QueueFull):
+        raise  # malformed JSON, rate limits and a full queue are answered by the handlers below
     except Exception as e:
-        print(f"Error saving location: {str(e)}")
+        log.error('location_save_failed', exc_info=True, error=str(e))
         return {"status": "error", "message": str(e)}, 500
 
+@app.route('/save/batch', methods=['POST'])
+def save_batch():
+    # Accepts a JSON array or an NDJSON body (Content-Type: application/x-ndjson)
+    # Each record takes a token from its own session (or the sender's address)
+    charge = BatchCharge(limiter, schema.normalize, request.environ)
+    try:
+        results = batch.ingest(request.stream, request.mimetype, store_fixes, validate=charge)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+    saved = sum(1 for result in results if result['status'] == 'success')
+    charge.check(saved)
+    log.info('batch_saved', saved=saved, received=len(results))
+    return {"status": "success", "saved": saved, "failed": len(results) - saved, "results": results, "total_locations": ingest.live}
+
+@app.route('/track', methods=['POST'])
+def track():
+    # Posted by ivnet_location_tracker.html: fetch() on load and every 30s, sendBeacon (text/plain) on unload
+    check_length(request.content_length)
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return {"status": "error", "message": "No data received"}, 400
+    location = data.get('location')
+    if isinstance(location, dict):
+        # Lift the coordinates to the top level, where the store and the thinner
+        # expect them; the rest of `location` is not a known field and is dropped
+        for key in ('latitude', 'longitude', 'accuracy', 'altitude'):
+            if key in location:
+                data.setdefault(key, location[key])
+    try:
+        fix = schema.normalize(data)
+    except SchemaError as e:
+        return {"status": "error", "message": str(e)}, 400
+    limiter.check_client(request.environ, fix.get('sessionId'))
+    location_id = store_fixes([fix])[0]
+    if fix.get('event') == 'page_unload':
+        doomed = thinner.close(fix.get('sessionId'))
+        if doomed:
+            ingest.sync()  # the session's last fixes may still be queued
+            locations.delete(doomed)
+    return {"status": "success", "id": location_id}
+
+@app.errorhandler(QueryError)
+def bad_query(e):
+    return {"status": "error", "message": str(e)}, 400
+
+@app.errorhandler(400)
+@app.errorhandler(415)
+def bad_request(e):
+    # Unparseable JSON, or a body that isn't application/json
+    return {"status": "error", "message": e.description}, e.code
+
+@app.errorhandler(413)
+def too_large(e):
+    return {"status": "error", "message": e.description}, 413
+
+@app.errorhandler(429)
+def rate_limited(e):
+    return {"status": "error", "message": e.description}, 429, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(QueueFull)
+def queue_full(e):
+    # Shed load while the write queue drains; clients retry shortly
+    return {"status": "error", "message": "Server busy, retry shortly"}, 503, {"Retry-After": "1"}
+
+@app.route('/api/locations')
+def get_locations():
+    # Streams everything by default; ?after_id=&limit=&from=&to= pages through it
+    return views.locations_response(locations, request.args)
+
+@app.route('/api/export')
+def export_locations():
+    # ?format=csv|geojson|ndjson&from=&to=&session=&gzip=
+    return views.export_response(locations, request.args, request.headers.get('Accept-Encoding'))
+
+@app.route('/api/locations/delta')
+def locations_delta():
+    # Polling: ?since=<id> or ?version=<v> (or If-None-Match) returns only newer fixes, 304 if none
+    return views.delta_response(locations, request.args, request.if_none_match)
+
+@app.route('/api/locations/within')
+def locations_within():
+    # ?bbox=min_lon,min_lat,max_lon,max_lat or ?lat=&lon=&radius_m=
+    return views.within_response(locations, area_index, request.args)
+
+@app.route('/api/clusters')
+def get_clusters():
+    # ?zoom=<z>&bbox=min_lon,min_lat,max_lon,max_lat
+    return views.clusters_response(cluster_pyramid, request.args)
+
+@app.route('/api/sessions')
+def get_sessions():
+    # ?active_since=<time>&limit=<n>
+    return views.sessions_response(session_index, request.args)
+
+@app.route('/api/sessions/<session_id>')
+def get_session(session_id):
+    return views.session_response(session_index, locations, session_id)
+
+@app.route('/api/sessions/<session_id>/analytics')
+def get_session_analytics(session_id):
+    # ?dwell_speed_mps=&dwell_radius_m=&dwell_min_s=&steps=1 (needs numpy)
+    return views.analytics_response(locations, session_id, request.args)
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format
+    return views.metrics_response(request_metrics, locations, ingest, thinner, retention, limiter, live_feed)
+
 @app.route('/test')
 def test():
-    return {"status": "online", "locations": len(locations), "protocol_required": "https", "current_protocol": request.scheme}
+    return {"status": "online", "locations": locations.live, "thinning": thinner.stats(), "retention": retention.stats(), "rate_limit": limiter.stats(), "protocol_required": "https", "current_protocol": request.scheme}
 
-@app.route('/location-test')
-def location_test():
-    """Simple page for testing location access"""
-    return '''
+LOCATION_TEST_PAGE = StaticAsset('''
     <html>
     <head>
         <meta charset="UTF-8">
@@ -749,7 +1006,12 @@ def location_test():
         </script>
     </body>
     </html>
-    '''
+    ''', 'text/html; charset=utf-8')
+
+@app.route('/location-test')
+def location_test():
+    """Simple page for testing location access"""
+    return serve(LOCATION_TEST_PAGE)
 
 if __name__ == '__main__':
     app.run()
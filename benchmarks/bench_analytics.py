@@ -0,0 +1,125 @@
+"""Trajectory analytics: NumPy (ivnet/analytics.py) vs a pure-Python loop.
+
+    python benchmarks/bench_analytics.py [--points 100000] [--others 100000]
+
+One session of --points fixes (walks with stops every few minutes) is
+stored among --others fixes from other sessions. "load" is getting the
+session's coordinates and times out of the store; "steps" is distance,
+speed and bearing per step plus dwell detection.
+"""
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet import analytics  # noqa: E402
+from ivnet.spatial import METERS_PER_DEGREE, haversine_m  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+
+def walk(points, rng):
+    lat, lon, at = 52.5, 13.4, 1.7e12
+    heading = 0.0
+    for i in range(points):
+        if (i // 20) % 2:  # alternate 10 minutes walking and 10 minutes standing
+            heading += rng.gauss(0, 0.3)
+            lat += 42 * math.cos(heading) / METERS_PER_DEGREE
+            lon += 42 * math.sin(heading) / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+        at += 30000
+        yield {'sessionId': 'walker', 'latitude': lat + rng.gauss(0, 5e-5), 'longitude': lon, 'timestamp': at}
+
+
+def python_load(store, session_id):
+    lat, lon, seconds, ids = [], [], [], []
+    for fix in store:
+        if fix.get('sessionId') == session_id and fix.latitude is not None and fix.longitude is not None:
+            ids.append(fix.id)
+            lat.append(fix.latitude)
+            lon.append(fix.longitude)
+            seconds.append(fix.timestamp / 1e3)
+    return ids, lat, lon, seconds
+
+
+def python_analyze(ids, lat, lon, seconds):
+    speed_mps, radius_m, min_seconds = analytics.DWELL_SPEED_MPS, analytics.DWELL_RADIUS_M, analytics.DWELL_MIN_SECONDS
+    distances, speeds, bearings, still = [], [], [], []
+    for i in range(1, len(lat)):
+        distance = haversine_m(lat[i - 1], lon[i - 1], lat[i], lon[i])
+        elapsed = seconds[i] - seconds[i - 1]
+        speed = distance / elapsed if elapsed > 0 else None
+        phi1, phi2 = math.radians(lat[i - 1]), math.radians(lat[i])
+        dlambda = math.radians(lon[i] - lon[i - 1])
+        y = math.sin(dlambda) * math.cos(phi2)
+        x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)
+        distances.append(distance)
+        speeds.append(speed)
+        bearings.append(math.degrees(math.atan2(y, x)) % 360)
+        still.append(speed <= speed_mps if speed is not None else distance <= radius_m)
+    dwells = []
+    start = None
+    for i, is_still in enumerate(still + [False]):
+        if is_still and start is None:
+            start = i
+        elif not is_still and start is not None:
+            if seconds[i] - seconds[start] >= min_seconds:
+                run_lat, run_lon = lat[start:i + 1], lon[start:i + 1]
+                centre = sum(run_lat) / len(run_lat), sum(run_lon) / len(run_lon)
+                if max(haversine_m(a, b, *centre) for a, b in zip(run_lat, run_lon)) <= radius_m:
+                    dwells.append((ids[start], ids[i]))
+            start = None
+    return sum(distances), dwells
+
+
+def best_of(repeat, run):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--others', type=int, default=100_000)
+    args = parser.parse_args()
+    if analytics.numpy is None:
+        sys.exit('numpy is not installed')
+
+    rng = random.Random(7)
+    records = list(walk(args.points, rng))
+    records += [{'sessionId': f'other-{i % 500}', 'latitude': 48.8 + rng.random(), 'longitude': 2.3 + rng.random()}
+                for i in range(args.others)]
+    rng.shuffle(records)
+    records.sort(key=lambda record: record.get('timestamp', 0))  # the walker's fixes stay in order
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        for first in range(0, len(records), 10000):
+            store.append_many(records[first:first + 10000])
+
+        py_load, (ids, lat, lon, seconds) = best_of(1, lambda: python_load(store, 'walker'))
+        py_steps, (py_distance, py_dwells) = best_of(1, lambda: python_analyze(ids, lat, lon, seconds))
+        np_load, track = best_of(5, lambda: analytics.load_track(store, 'walker'))
+        np_steps, (totals, _, np_dwells) = best_of(5, lambda: analytics.analyze(track))
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+    assert len(track) == len(ids) and [(d['first_id'], d['last_id']) for d in np_dwells] == py_dwells
+    assert abs(totals['distance_m'] - py_distance) < 1
+    print(f'{len(track):,} fixes in the session, {len(records):,} stored, {len(np_dwells)} dwells')
+    print(f'{"":<8}{"load ms":>10}{"steps ms":>10}')
+    print(f'{"python":<8}{py_load:>10.1f}{py_steps:>10.1f}')
+    print(f'{"numpy":<8}{np_load:>10.1f}{np_steps:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
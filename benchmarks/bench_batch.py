@@ -0,0 +1,74 @@
+"""Points/sec through `/save` (one fix per request) vs `/save/batch`.
+
+    python benchmarks/bench_batch.py [--points 20000] [--batch-size 500]
+
+Drives api/index.py with the Flask test client against a throwaway data dir.
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+# One client posting flat out: measure the handlers, not the rate limiter or load shedding
+os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+os.environ.setdefault('IVNET_SHED_LOAD', '0')
+
+from bench_store import fix  # noqa: E402
+from ivnet import logs  # noqa: E402
+
+# The per-request log line is part of the real cost, but not worth seeing
+logs.setup(open(os.devnull, 'w'))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+def bench_single(client, points):
+    start = time.perf_counter()
+    for i in range(points):
+        response = client.post('/save', json=fix(i), base_url=BASE_URL)
+        assert response.status_code == 200
+    return points / (time.perf_counter() - start)
+
+
+def bench_batch(client, points, batch_size, mimetype):
+    bodies = []
+    for first in range(0, points, batch_size):
+        records = [fix(i) for i in range(first, min(first + batch_size, points))]
+        if mimetype == 'application/x-ndjson':
+            bodies.append('\n'.join(json.dumps(record) for record in records))
+        else:
+            bodies.append(json.dumps(records))
+    start = time.perf_counter()
+    for body in bodies:
+        response = client.post('/save/batch', data=body, content_type=mimetype, base_url=BASE_URL)
+        assert response.status_code == 200 and response.json['failed'] == 0
+    return points / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    client = index.app.test_client()
+    single = bench_single(client, args.points)
+    array = bench_batch(client, args.points, args.batch_size, 'application/json')
+    ndjson = bench_batch(client, args.points, args.batch_size, 'application/x-ndjson')
+    print(f'/save               {single:>12,.0f} points/s')
+    print(f'/save/batch (array) {array:>12,.0f} points/s  ({array / single:.1f}x)')
+    print(f'/save/batch (ndjson){ndjson:>12,.0f} points/s  ({ndjson / single:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
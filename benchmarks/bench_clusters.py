@@ -0,0 +1,78 @@
+"""Map rendering: every fix from /api/locations vs /api/clusters for a viewport.
+
+    python benchmarks/bench_clusters.py [--points 100000] [--queries 20]
+
+Fixes cluster around a few cities. Each query asks for a 1280x800 pixel
+viewport centred on one of them, at several zoom levels; response bytes
+and milliseconds are averaged per query. Also reports what keeping the
+pyramid current costs per stored fix.
+"""
+import argparse
+import atexit
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+
+from bench_spatial import CITIES, synthetic  # noqa: E402
+
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+from ivnet.clusters import ClusterPyramid  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+WIDTH, HEIGHT = 1280, 800
+
+
+def viewport(lat, lon, zoom):
+    """The bbox a WIDTH x HEIGHT map centred on (lat, lon) shows at this zoom."""
+    degrees_per_pixel = 360 / (256 << zoom)
+    half_lon = WIDTH / 2 * degrees_per_pixel
+    half_lat = HEIGHT / 2 * degrees_per_pixel * math.cos(math.radians(lat))
+    return f'{lon - half_lon},{max(lat - half_lat, -90)},{lon + half_lon},{min(lat + half_lat, 90)}'
+
+
+def timed(client, urls):
+    sent = 0
+    start = time.perf_counter()
+    for url in urls:
+        sent += len(client.get(url, base_url=BASE_URL).get_data())
+    return sent / len(urls), (time.perf_counter() - start) / len(urls) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    fixes = list(synthetic(args.points, rng))
+    for first in range(0, len(fixes), 10000):
+        index.locations.append_many(fixes[first:first + 10000])
+
+    start = time.perf_counter()
+    ClusterPyramid(index.locations).wait_ready()
+    print(f'pyramid over {args.points:,} fixes ({index.cluster_pyramid.max_zoom + 1} zoom levels): '
+          f'{(time.perf_counter() - start) / args.points * 1e6:.1f} us/fix')
+
+    client = index.app.test_client()
+    full_bytes, full_ms = timed(client, ['/api/locations'] * max(1, args.queries // 10))
+    print(f'{"/api/locations (all)":<24}{full_bytes:>14,.0f} B{full_ms:>10.1f} ms')
+    for zoom in (2, 6, 10, 14):
+        centres = [rng.choice(CITIES) for _ in range(args.queries)]
+        urls = [f'/api/clusters?zoom={zoom}&bbox={viewport(lat, lon, zoom)}' for lat, lon in centres]
+        size, ms = timed(client, urls)
+        print(f'{"/api/clusters zoom " + str(zoom):<24}{size:>14,.0f} B{ms:>10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""/save and /api/locations under each JSON codec (orjson vs the stdlib).
+
+    python benchmarks/bench_codec.py [--saves 20000] [--points 100000]
+
+Each codec runs in its own process (IVNET_JSON_CODEC=auto|json) against a
+fresh store: /save requests one at a time through the test client, then
+/api/locations pages of 1000 and the full streamed array, plus the raw
+cost of encoding and parsing one fix.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = 'http://localhost:5000'
+
+
+def run(codec, args, results):
+    data_dir = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        os.environ['IVNET_DATA_DIR'] = data_dir
+        os.environ['IVNET_JSON_CODEC'] = codec
+        os.environ['IVNET_THIN'] = '0'  # every posted fix is stored and read back
+        # One client posting flat out: measure the codec, not the rate limiter or load shedding
+        os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+        os.environ.setdefault('IVNET_SHED_LOAD', '0')
+        from bench_store import fix
+        sys.path.insert(0, ROOT)
+        from ivnet import logs
+        logs.setup(open(os.devnull, 'w'))
+        sys.path.insert(0, os.path.join(ROOT, 'api'))
+        import index
+        from ivnet import codec as module
+
+        client = index.app.test_client()
+        bodies = [fix(i) for i in range(args.saves)]
+        start = time.perf_counter()
+        for body in bodies:
+            client.post('/save', json=body, base_url=BASE_URL)
+        save_rate = args.saves / (time.perf_counter() - start)
+
+        index.ingest.append_many([fix(i) for i in range(args.points - args.saves)])
+        index.ingest.sync()
+        start = time.perf_counter()
+        after_id = 0
+        while after_id is not None:
+            page = client.get(f'/api/locations?limit=1000&after_id={after_id}', base_url=BASE_URL).get_json()
+            after_id = page['next_after_id']
+        paged_rate = len(index.locations) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        client.get('/api/locations', base_url=BASE_URL).get_data()
+        stream_rate = len(index.locations) / (time.perf_counter() - start)
+
+        record = index.locations.get(1).to_dict()
+        text = module.dumps(record)
+        start = time.perf_counter()
+        for _ in range(100000):
+            module.dumps(record)
+        encode_us = (time.perf_counter() - start) * 10
+        start = time.perf_counter()
+        for _ in range(100000):
+            module.loads(text)
+        decode_us = (time.perf_counter() - start) * 10
+        results.put((module.NAME, save_rate, paged_rate, stream_rate, encode_us, decode_us))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--saves', type=int, default=20000)
+    parser.add_argument('--points', type=int, default=100000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    print(f'{"codec":<8}{"/save req/s":>13}{"paged fixes/s":>15}{"stream fixes/s":>16}{"encode us":>11}{"parse us":>10}')
+    for codec in ('json', 'auto'):
+        process = context.Process(target=run, args=(codec, args, results))
+        process.start()
+        process.join()
+        name, save_rate, paged_rate, stream_rate, encode_us, decode_us = results.get()
+        print(f'{name:<8}{save_rate:>13,.0f}{paged_rate:>15,.0f}{stream_rate:>16,.0f}{encode_us:>11.2f}{decode_us:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""/dashboard latency (first byte and full page) at growing history sizes.
+
+    python benchmarks/bench_dashboard.py [--sizes 1000,100000,1000000] [--requests 200]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_store import fix  # noqa: E402
+
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+import index  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+def percentile(samples, pct):
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def fill(store, points, batch=10000):
+    for first in range(len(store), points, batch):
+        store.append_many([fix(i) for i in range(first, min(first + batch, points))])
+
+
+def measure(client, requests):
+    first_byte, full = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/dashboard', base_url=BASE_URL, buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        first_byte.append(time.perf_counter() - start)
+        for _ in chunks:
+            pass
+        full.append(time.perf_counter() - start)
+        response.close()
+    return first_byte, full
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    client = index.app.test_client()
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        index.locations = store = SegmentStore(path)
+        print(f'{"points":>10}{"TTFB p50 ms":>14}{"p50 ms":>10}{"p99 ms":>10}')
+        for size in sorted(int(size) for size in args.sizes.split(',')):
+            fill(store, size)
+            first_byte, full = measure(client, args.requests)
+            print(f'{size:>10,}{percentile(first_byte, 50) * 1000:>14.2f}'
+                  f'{percentile(full, 50) * 1000:>10.2f}{percentile(full, 99) * 1000:>10.2f}')
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Polling cost: re-downloading /api/locations vs /api/locations/delta.
+
+    python benchmarks/bench_delta.py [--sizes 1000,10000,100000] [--polls 50] [--new 0,1,10]
+
+Between polls --new fixes are appended; each poll either fetches the full
+history or sends back the delta endpoint's last version. Reports response
+bytes and milliseconds per poll.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+
+from bench_store import fix  # noqa: E402
+
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+def poll(client, store, polls, new, delta):
+    version = None
+    if delta:
+        # Catch up first, as a client would on startup
+        query = {}
+        while True:
+            body = client.get('/api/locations/delta', query_string=query, base_url=BASE_URL).json
+            version = query['version'] = body['version']
+            if not body['more']:
+                break
+    sent = 0
+    elapsed = 0.0
+    for _ in range(polls):
+        if new:
+            store.append_many([fix(i) for i in range(new)])
+        start = time.perf_counter()
+        if delta:
+            response = client.get('/api/locations/delta', query_string={'version': version}, base_url=BASE_URL)
+            if response.status_code == 200:
+                version = response.json['version']
+        else:
+            response = client.get('/api/locations', base_url=BASE_URL)
+        body = response.get_data()
+        elapsed += time.perf_counter() - start
+        sent += len(body)
+    return sent / polls, elapsed / polls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--new', default='0,1,10')
+    args = parser.parse_args()
+
+    client = index.app.test_client()
+    store = index.locations
+    print(f'{"points":>10}{"new/poll":>10}{"full B":>12}{"full ms":>10}{"delta B":>10}{"delta ms":>10}')
+    for size in sorted(int(size) for size in args.sizes.split(',')):
+        if len(store) < size:
+            store.append_many([fix(i) for i in range(len(store), size)])
+        for new in (int(n) for n in args.new.split(',')):
+            full_bytes, full_ms = poll(client, store, args.polls, new, delta=False)
+            delta_bytes, delta_ms = poll(client, store, args.polls, new, delta=True)
+            print(f'{size:>10,}{new:>10}{full_bytes:>12,.0f}{full_ms:>10.2f}{delta_bytes:>10,.0f}{delta_ms:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
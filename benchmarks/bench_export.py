@@ -0,0 +1,70 @@
+"""Streaming export: throughput and peak memory per format.
+
+    python benchmarks/bench_export.py [--points 1000000]
+
+Each export is read chunk by chunk through the test client, as a download
+would be. Peak memory is the most Python memory (tracemalloc) held at once
+while producing a gzipped GeoJSON export; it is measured separately, at a
+few store sizes, because tracing slows everything down.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+
+from bench_store import fix  # noqa: E402
+
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+def download(client, url):
+    start = time.perf_counter()
+    response = client.get(url, base_url=BASE_URL, buffered=False)
+    sent = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return sent, time.perf_counter() - start
+
+
+def fill(store, upto):
+    for first in range(len(store), upto, 10000):
+        store.append_many([fix(i) for i in range(first, min(first + 10000, upto))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--traced', default='1000,10000,100000', help='store sizes to measure peak memory at')
+    args = parser.parse_args()
+
+    store = index.locations
+    client = index.app.test_client()
+    for size in sorted(int(size) for size in args.traced.split(',')):
+        fill(store, size)
+        tracemalloc.start()
+        download(client, '/api/export?format=geojson&gzip=1')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'peak memory exporting {size:>9,} fixes: {peak / 1024:,.0f} KB')
+
+    fill(store, args.points)
+    print(f'{"format":<10}{"gzip":>6}{"MB":>10}{"s":>8}{"fixes/s":>12}')
+    for name in ('ndjson', 'csv', 'geojson'):
+        for compress in (0, 1):
+            sent, elapsed = download(client, f'/api/export?format={name}&gzip={compress}')
+            print(f'{name:<10}{"yes" if compress else "no":>6}{sent / 2 ** 20:>10.1f}{elapsed:>8.2f}{len(store) / elapsed:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Ingest-side cost per fix with 0 to N live SSE viewers attached.
+
+    python benchmarks/bench_live.py [--points 20000] [--batch 32] [--viewers 0,1,100,500]
+
+Fixes are appended in batches of --batch (the write-behind flusher's group
+commit size) while viewer threads read their streams straight from the
+Broadcaster, as the /live route would. "feed us/fix" is the CPU time the
+appending thread spends in the broadcaster (encoding and waking viewers);
+"append us/fix" is wall time per fix, which on a small machine also pays
+for the viewer threads running alongside. "min seen" is the fewest fixes
+any viewer got; the rest were skipped with a gap event.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import fix  # noqa: E402
+from ivnet.live import Broadcaster  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+
+class TimedBroadcaster(Broadcaster):
+    spent = 0.0
+
+    def update(self):
+        # CPU time of the appending thread only; waiting for the GIL while
+        # viewer threads run is their cost, not the feed's
+        start = time.thread_time()
+        super().update()
+        self.spent += time.thread_time() - start
+
+
+def run(points, batch, viewers):
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        feed = TimedBroadcaster(store, max_clients=viewers + 1)
+        last_id = [0] * viewers
+        missed = [0] * viewers
+        ready = threading.Barrier(viewers + 1)
+
+        def viewer(n):
+            stream = feed.connect(0)
+            next(stream)  # the retry: line; the client is counted from here
+            ready.wait()
+            for chunk in stream:
+                if chunk.startswith('event: reset'):
+                    break
+                for gap in re.findall(r'event: gap\ndata: (.*)\n', chunk):
+                    missed[n] += json.loads(gap)['missed']
+                # The last message's id says how far this viewer has got
+                at = chunk.rindex('id: ') + 4
+                last_id[n] = int(chunk[at:chunk.index('\n', at)])
+            stream.close()
+
+        threads = [threading.Thread(target=viewer, args=(n,), daemon=True) for n in range(viewers)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+
+        records = [fix(i) for i in range(points)]
+        start = time.perf_counter()
+        for first in range(0, points, batch):
+            store.append_many(records[first:first + batch])
+        elapsed = time.perf_counter() - start
+
+        time.sleep(0.5)  # let every viewer read to the end
+        store.clear()  # sends `reset`, which ends every viewer
+        for thread in threads:
+            thread.join()
+        store.close()
+        seen = [upto - skipped for upto, skipped in zip(last_id, missed)]
+        return points / elapsed, feed.spent / points * 1e6, min(seen, default=0), sum(1 for n in missed if n)
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--viewers', default='0,1,100,500')
+    args = parser.parse_args()
+
+    print(f'{"viewers":>8}{"feed us/fix":>13}{"append us/fix":>15}{"min seen":>10}{"viewers with gaps":>19}')
+    for viewers in (int(n) for n in args.viewers.split(',')):
+        rate, feed_us, seen, gapped = run(args.points, args.batch, viewers)
+        print(f'{viewers:>8}{feed_us:>13.1f}{1e6 / rate:>15.1f}{seen:>10,}{gapped:>19}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Per-fix logging cost on the request thread: the old print() calls vs ivnet.logs.
+
+    python benchmarks/bench_logging.py [--events 50000]
+
+stdout is redirected to a line-buffered temp file, so every printed line is
+its own write() as it is when Vercel (or any unbuffered runner) collects
+stdout. "request" is the time the calling thread spends per fix; "drained"
+also waits for the writer thread to write everything out.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import fix  # noqa: E402
+from ivnet import logs  # noqa: E402
+
+
+def print_six(data):
+    # What index.py's save_location() used to do for every fix
+    print(f"🔴 NEW LOCATION TRACKED:")
+    print(f"   📍 Coordinates: {data.get('latitude')}, {data.get('longitude')}")
+    print(f"   🕒 Time: {data.get('timestamp')}")
+    print(f"   📱 Device: {data.get('platform')}")
+    print(f"   🌐 IP: {data.get('ip_address')}")
+    print(f"   🆔 Session: {data.get('sessionId')}")
+
+
+def print_one(data):
+    # What api/index.py's save() used to do
+    print(f"Location saved: {data.get('latitude', 'Unknown')}, {data.get('longitude', 'Unknown')}")
+
+
+def structured(sample):
+    log = logs.EventLogger('ivnet.bench', 'info', sample)
+
+    def emit(data):
+        log.sampled('location_tracked', latitude=data.get('latitude'), longitude=data.get('longitude'),
+                    timestamp=data.get('timestamp'), platform=data.get('platform'),
+                    ip_address=data.get('ip_address'), session=data.get('sessionId'))
+    return emit
+
+
+def run(emit, records):
+    logs.setup(sys.stdout)
+    dropped = logs.dropped()
+    start = time.perf_counter()
+    for data in records:
+        emit(data)
+    request = time.perf_counter() - start
+    logs.shutdown()
+    sys.stdout.flush()
+    drained = time.perf_counter() - start
+    return request / len(records) * 1e6, drained / len(records) * 1e6, logs.dropped() - dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000)
+    args = parser.parse_args()
+
+    records = [dict(fix(i), ip_address='203.0.113.7') for i in range(args.events)]
+    variants = (
+        ('print x6 (index.py)', print_six),
+        ('print x1 (api/index.py)', print_one),
+        ('json, every event', structured(1.0)),
+        ('json, 1 in 10', structured(0.1)),
+        ('json, 1 in 100', structured(0.01)),
+    )
+    rows = []
+    console = sys.stdout
+    with tempfile.TemporaryFile('w', buffering=1, encoding='utf-8') as sink:
+        sys.stdout = sink
+        try:
+            for name, emit in variants:
+                rows.append((name,) + run(emit, records))
+        finally:
+            sys.stdout = console
+
+    print(f'{"logging":<26}{"request us/fix":>16}{"drained us/fix":>16}{"dropped":>9}')
+    for name, request, drained, dropped in rows:
+        print(f'{name:<26}{request:>16.2f}{drained:>16.2f}{dropped:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Python-heap cost per fix (tracemalloc): raw dicts vs typed Fix records vs the column store.
+
+    python benchmarks/bench_memory.py [--points 1000000]
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import fix  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+
+def traced(build):
+    tracemalloc.start()
+    try:
+        kept = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return kept, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1_000_000)
+    args = parser.parse_args()
+    points = args.points
+
+    def raw_dicts():
+        # What /save used to keep: the posted dict plus an ISO server timestamp
+        locations = []
+        for i in range(points):
+            data = fix(i)
+            data['server_timestamp'] = datetime.datetime.now().isoformat()
+            locations.append(data)
+        return locations
+
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        def column_store():
+            store = SegmentStore(path)
+            for first in range(0, points, 10000):
+                store.append_many([fix(i) for i in range(first, min(first + 10000, points))])
+            return store
+
+        rows = []
+        for name, build in (('raw dicts', raw_dicts), ('segment store', column_store)):
+            kept, used = traced(build)
+            rows.append((name, used))
+            if isinstance(kept, SegmentStore):
+                store = kept
+        fixes, used = traced(lambda: list(store))
+        rows.append(('Fix records (decoded)', used))
+        on_disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+    print(f'{"representation":<24}{"heap MB":>10}{"bytes/fix":>12}')
+    for name, used in rows:
+        print(f'{name:<24}{used / 2 ** 20:>10.1f}{used / points:>12.1f}')
+    print(f'{"segment files on disk":<24}{on_disk / 2 ** 20:>10.1f}{on_disk / points:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
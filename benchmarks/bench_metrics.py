@@ -0,0 +1,88 @@
+"""Cost of the /metrics instrumentation on the /save hot path, and of a scrape.
+
+    python benchmarks/bench_metrics.py [--requests 20000] [--rounds 5]
+
+The hooks are timed on their own inside a request context (the figure
+that matters), then whole /save requests are timed with the hooks
+installed and removed in alternating rounds, where the difference is
+lost in the noise of a whole request through the test client.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+# One client posting flat out: measure the handlers, not the rate limiter or load shedding
+os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+os.environ.setdefault('IVNET_SHED_LOAD', '0')
+
+from bench_store import fix  # noqa: E402
+
+sys.path.insert(0, ROOT)
+from ivnet import logs  # noqa: E402
+logs.setup(open(os.devnull, 'w'))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+def hooks_us(calls):
+    metrics = index.request_metrics
+    response = index.app.response_class('{"status":"success"}', mimetype='application/json')
+    with index.app.test_request_context('/save', method='POST', base_url=BASE_URL, json=fix(0)):
+        from flask import request
+        request.url_rule = index.app.url_map._rules_by_endpoint['save'][0]
+        start = time.perf_counter()
+        for _ in range(calls):
+            metrics._start()
+            metrics._finish(response)
+        return (time.perf_counter() - start) / calls * 1e6
+
+
+def saves_us(client, requests):
+    bodies = [fix(i) for i in range(requests)]
+    start = time.perf_counter()
+    for body in bodies:
+        client.post('/save', json=body, base_url=BASE_URL)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'before_request + after_request hooks: {min(hooks_us(100000) for _ in range(3)):.2f} us per request')
+
+    app, metrics = index.app, index.request_metrics
+    client = app.test_client()
+    saves_us(client, 2000)  # warm up
+    with_hooks, without_hooks = [], []
+    for _ in range(args.rounds):
+        with_hooks.append(saves_us(client, args.requests))
+        app.before_request_funcs[None].remove(metrics._start)
+        app.after_request_funcs[None].remove(metrics._finish)
+        without_hooks.append(saves_us(client, args.requests))
+        # Back where instrument() put them (the app refuses new hooks once serving)
+        app.before_request_funcs[None].insert(0, metrics._start)
+        app.after_request_funcs[None].insert(0, metrics._finish)
+    print(f'/save with hooks:    {statistics.median(with_hooks):7.1f} us (median of {args.rounds} rounds)')
+    print(f'/save without hooks: {statistics.median(without_hooks):7.1f} us')
+
+    start = time.perf_counter()
+    body = client.get('/metrics', base_url=BASE_URL).get_data()
+    print(f'/metrics scrape: {(time.perf_counter() - start) * 1e3:.2f} ms, {len(body):,} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Cost of one rate-limit check, for a few clients and for a full LRU.
+
+    python benchmarks/bench_ratelimit.py [--checks 200000] [--clients 10000] [--threads 8]
+
+`few` checks the same 100 sessions over and over; `churn` cycles through
+more sessions than the limiter keeps, so every check evicts the stalest
+bucket; `threads` runs `few` from several threads against one limiter.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from ivnet.ratelimit import RateLimiter  # noqa: E402
+
+
+def bench(limiter, keys):
+    start = time.perf_counter()
+    for key in keys:
+        limiter.acquire(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def bench_threads(limiter, keys, threads):
+    workers = [threading.Thread(target=bench, args=(limiter, keys)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (len(keys) * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    few = [('session', f'session-{i % 100}') for i in range(args.checks)]
+    churn = [('session', f'session-{i % (args.clients * 2)}') for i in range(args.checks)]
+    rows = [
+        ('few', bench(RateLimiter(rate=1000, burst=10, max_clients=args.clients), few)),
+        ('churn', bench(RateLimiter(rate=1000, burst=10, max_clients=args.clients), churn)),
+        ('threads', bench_threads(RateLimiter(rate=1000, burst=10, max_clients=args.clients), few, args.threads)),
+    ]
+    print(f'{"pattern":<10}{"us/check":>10}')
+    for name, per_check in rows:
+        print(f'{name:<10}{per_check:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Retention: RSS and append latency under sustained ingest, and clear() at scale.
+
+    python benchmarks/bench_retention.py [--points 2000000] [--retain 200000]
+
+Fixes are appended in batches, as the ingest flusher writes them, with the
+derived indexes subscribed. Without retention RSS grows with the history;
+with the sweeper it levels off once expired segments start being reclaimed
+(after --reclaim-delay seconds instead of the default minute). The batch
+latency percentiles show what the sweeper costs the write path.
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import fix  # noqa: E402
+from ivnet import store as store_module  # noqa: E402
+from ivnet.clusters import ClusterPyramid  # noqa: E402
+from ivnet.retention import Sweeper  # noqa: E402
+from ivnet.sessions import SessionIndex  # noqa: E402
+from ivnet.spatial import GridIndex  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+BATCH = 100
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def ingest(points, retain, samples):
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    store = SegmentStore(path)
+    indexes = [GridIndex(store), ClusterPyramid(store), SessionIndex(store)]
+    sweeper = Sweeper(store, max_points=retain) if retain else None
+    latencies = []
+    rss = []
+    step = max(points // samples // BATCH * BATCH, BATCH)
+    try:
+        for first in range(0, points, BATCH):
+            batch = [fix(i) for i in range(first, first + BATCH)]
+            start = time.perf_counter()
+            store.append_many(batch)
+            latencies.append(time.perf_counter() - start)
+            if (first + BATCH) % step == 0:
+                rss.append(rss_mb())
+        return latencies, rss, store.live
+    finally:
+        if sweeper is not None:
+            sweeper.close()
+        del indexes
+        store.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=2_000_000)
+    parser.add_argument('--retain', type=int, default=200_000)
+    parser.add_argument('--reclaim-delay', type=float, default=1.0)
+    parser.add_argument('--clear-points', type=int, default=1_000_000)
+    args = parser.parse_args()
+    store_module.RECLAIM_DELAY = args.reclaim_delay
+
+    print(f'{"retention":<12}{"kept":>10}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}  RSS MB along the run')
+    for retain in (0, args.retain):
+        latencies, rss, kept = ingest(args.points, retain, samples=8)
+        print(f'{retain or "off":<12}{kept:>10,}'
+              f'{percentile(latencies, 0.5) * 1e3:>9.2f}{percentile(latencies, 0.99) * 1e3:>9.2f}'
+              f'{max(latencies) * 1e3:>9.2f}  ' + ' '.join(f'{mb:.0f}' for mb in rss))
+
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        for first in range(0, args.clear_points, 10000):
+            store.append_many([fix(i) for i in range(first, min(first + 10000, args.clear_points))])
+        start = time.perf_counter()
+        store.clear()
+        cleared = time.perf_counter() - start
+        start = time.perf_counter()
+        store.reclaim(now=time.monotonic() + store_module.RECLAIM_DELAY)
+        reclaimed = time.perf_counter() - start
+        print(f'clear() at {args.clear_points:,} fixes: {cleared * 1e3:.2f} ms '
+              f'(background reclaim of the old generation: {reclaimed * 1e3:.0f} ms)')
+        store.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Per-record cost of validating and normalizing posted fixes.
+
+    python benchmarks/bench_schema.py [--records 100000]
+
+Times `Schema.normalize()` on the bodies the trackers post: a /save fix,
+a /track payload (device info plus fields that get dropped), a fix with
+an oversized userAgent that gets cut, and one that is rejected.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_store import fix  # noqa: E402
+
+sys.path.insert(0, ROOT)
+from ivnet.schema import Schema, SchemaError  # noqa: E402
+
+
+def track(i):
+    record = fix(i)
+    record.update({
+        'sessionId': 'k3j9x0q2a', 'browser': 'Chrome', 'language': 'en-GB', 'cookieEnabled': True,
+        'onLine': True, 'screen': '412x915', 'colorDepth': 24, 'timezone': 'Europe/London',
+        'ipAddress': '203.0.113.7', 'event': 'periodic_update',
+        'location': {'error': 'Location permission denied by user', 'code': 1}, 'debug': [i] * 8,
+    })
+    return record
+
+
+def oversized(i):
+    record = fix(i)
+    record['userAgent'] = 'Mozilla/5.0 ' * 1000
+    return record
+
+
+def rejected(i):
+    record = fix(i)
+    record['latitude'] = 91 + i % 10
+    return record
+
+
+def bench(schema, records):
+    start = time.perf_counter()
+    failed = 0
+    for record in records:
+        try:
+            schema.normalize(record)
+        except SchemaError:
+            failed += 1
+    return (time.perf_counter() - start) / len(records) * 1e6, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    schema = Schema()
+    print(f'{"payload":<12}{"fields":>8}{"kept":>6}{"us/record":>11}{"rejected":>10}')
+    for name, make in (('save', fix), ('track', track), ('oversized', oversized), ('rejected', rejected)):
+        records = [make(i) for i in range(args.records)]
+        try:
+            kept = len(schema.normalize(records[0]))
+        except SchemaError:
+            kept = 0
+        per_record, failed = bench(schema, records)
+        print(f'{name:<12}{len(records[0]):>8}{kept:>6}{per_record:>11.2f}{failed:>10}')
+
+
+if __name__ == '__main__':
+    main()
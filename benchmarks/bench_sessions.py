@@ -0,0 +1,68 @@
+"""Last position per session: SessionIndex vs a full scan of the store.
+
+    python benchmarks/bench_sessions.py [--points 1000000] [--sessions 1000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet.sessions import SessionIndex  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+
+def scan_latest(store):
+    latest = {}
+    for fix in store:
+        session_id = fix.get('sessionId')
+        if session_id is not None:
+            latest[session_id] = (fix.id, fix.latitude, fix.longitude)
+    return latest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--sessions', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        start = time.perf_counter()
+        index = SessionIndex(store)
+        for first in range(0, args.points, 10000):
+            store.append_many([
+                {'sessionId': f'session-{rng.randrange(args.sessions)}',
+                 'latitude': 52.5 + rng.gauss(0, 0.05), 'longitude': 13.4 + rng.gauss(0, 0.05)}
+                for _ in range(min(10000, args.points - first))
+            ])
+        print(f'{args.points:,} fixes from {len(index):,} sessions stored in {time.perf_counter() - start:.2f} s (index kept current)')
+
+        start = time.perf_counter()
+        scanned = scan_latest(store)
+        print(f'full scan, last position per session: {(time.perf_counter() - start) * 1000:10.1f} ms')
+
+        start = time.perf_counter()
+        summaries = index.summaries()
+        print(f'SessionIndex.summaries():              {(time.perf_counter() - start) * 1000:10.1f} ms')
+
+        start = time.perf_counter()
+        for session_id in scanned:
+            index.get(session_id)
+        print(f'SessionIndex.get(), per session:       {(time.perf_counter() - start) / len(scanned) * 1e6:10.1f} us')
+
+        assert {s['sessionId']: s['last_id'] for s in summaries} == {k: v[0] for k, v in scanned.items()}
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
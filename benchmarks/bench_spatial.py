@@ -0,0 +1,79 @@
+"""Area queries: grid index vs a linear scan of every fix.
+
+    python benchmarks/bench_spatial.py [--points 1000000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet.spatial import GridIndex, haversine_m
+from ivnet.store import SegmentStore
+
+# Fixes cluster around a handful of cities, like real traffic does
+CITIES = [(51.507, -0.128), (40.713, -74.006), (35.690, 139.692), (-33.869, 151.209), (48.857, 2.352)]
+
+
+def synthetic(points, rng):
+    for _ in range(points):
+        lat, lon = rng.choice(CITIES)
+        yield {'latitude': lat + rng.gauss(0, 0.1), 'longitude': lon + rng.gauss(0, 0.1)}
+
+
+def timed(queries, run):
+    samples = []
+    results = 0
+    for query in queries:
+        start = time.perf_counter()
+        results += len(run(*query))
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, results / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    fixes = list(synthetic(args.points, rng))
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        for first in range(0, len(fixes), 10000):
+            store.append_many(fixes[first:first + 10000])
+        start = time.perf_counter()
+        index = GridIndex(store)
+        index.wait_ready()
+        print(f'index build over {args.points:,} points: {time.perf_counter() - start:.2f} s')
+
+        centers = [(lat + rng.gauss(0, 0.05), lon + rng.gauss(0, 0.05)) for lat, lon in (rng.choice(CITIES) for _ in range(args.queries))]
+        boxes = [(lat - 0.005, lon - 0.005, lat + 0.005, lon + 0.005) for lat, lon in centers]
+        circles = [(lat, lon, 500.0) for lat, lon in centers]
+
+        def scan_bbox(min_lat, min_lon, max_lat, max_lon):
+            return [fix for fix in fixes if min_lat <= fix['latitude'] <= max_lat and min_lon <= fix['longitude'] <= max_lon]
+
+        def scan_radius(lat, lon, radius_m):
+            return [fix for fix in fixes if haversine_m(lat, lon, fix['latitude'], fix['longitude']) <= radius_m]
+
+        print(f'{"query":<22}{"index p50 ms":>14}{"scan p50 ms":>14}{"avg hits":>10}')
+        for name, queries, indexed, scanned in (('bbox ~1 km', boxes, index.within_bbox, scan_bbox),
+                                                ('radius 500 m', circles, index.within_radius, scan_radius)):
+            index_ms, hits = timed(queries, indexed)
+            scan_ms, _ = timed(queries[:max(5, len(queries) // 20)], scanned)
+            print(f'{name:<22}{index_ms:>14.3f}{scan_ms:>14.1f}{hits:>10.1f}')
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Ingest throughput and RSS: the old list of dicts vs the segment store.
+
+    python benchmarks/bench_store.py [--points 1000000]
+
+Each variant runs in its own process so RSS numbers don't bleed into each other.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet.store import SegmentStore
+
+USER_AGENT = 'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36'
+
+
+def fix(i):
+    return {
+        'latitude': 51.5 + (i % 1000) * 1e-4,
+        'longitude': -0.12 + (i % 997) * 1e-4,
+        'accuracy': 12.0 + i % 30,
+        'altitude': None,
+        'timestamp': '2024-05-01T12:%02d:%02d.%03dZ' % (i // 60000 % 60, i // 1000 % 60, i % 1000),
+        'userAgent': USER_AGENT,
+        'platform': 'Linux armv8l',
+        'protocol': 'https:',
+        'host': 'web.ivnet.me',
+    }
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def run_list(points, results):
+    import datetime
+    locations = []
+    start = time.perf_counter()
+    for i in range(points):
+        data = fix(i)
+        data['server_timestamp'] = datetime.datetime.now().isoformat()
+        locations.append(data)
+    elapsed = time.perf_counter() - start
+    results.put(('list of dicts', points / elapsed, rss_mb(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run_store(points, results):
+    path = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        store = SegmentStore(path)
+        start = time.perf_counter()
+        for i in range(points):
+            store.append(fix(i))
+        elapsed = time.perf_counter() - start
+        store.close()
+
+        start = time.perf_counter()
+        store = SegmentStore(path)
+        reopen = time.perf_counter() - start
+        assert len(store) == points
+        results.put(('segment store', points / elapsed, rss_mb(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+        results.put(('segment store reopen', reopen * 1000, None, None))
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    print(f'{"variant":<28}{"points/s":>12}{"RSS MB":>10}{"peak MB":>10}')
+    for target in (run_list, run_store):
+        process = multiprocessing.Process(target=target, args=(args.points, results))
+        process.start()
+        process.join()
+        while not results.empty():
+            name, rate, rss, peak = results.get()
+            print(f'{name:<28}' + (f'{rate:>12,.0f}{rss:>10.1f}{peak:>10.1f}' if rss is not None else f'{rate:>10.1f} ms'))
+
+
+if __name__ == '__main__':
+    main()
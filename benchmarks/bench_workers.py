@@ -0,0 +1,88 @@
+"""/save throughput with 1, 2, 4 and 8 worker processes sharing one store.
+
+    python benchmarks/bench_workers.py [--per-worker 5000] [--workers 1,2,4,8]
+
+Each worker imports api/index.py in shared mode (IVNET_SHARED=1) and posts
+through its own Flask test client, like gunicorn workers would. After each
+run the store must hold every fix exactly once.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = 'http://localhost:5000'
+
+
+def worker(data_dir, per_worker, n, ready, go, done):
+    os.environ['IVNET_DATA_DIR'] = data_dir
+    os.environ['IVNET_SHARED'] = '1'
+    # One client posting flat out: measure the handlers, not the rate limiter or load shedding
+    os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+    os.environ.setdefault('IVNET_SHED_LOAD', '0')
+    from bench_store import fix
+    from ivnet import logs
+    logs.setup(open(os.devnull, 'w'))
+    sys.path.insert(0, os.path.join(ROOT, 'api'))
+    import index
+
+    client = index.app.test_client()
+    bodies = [fix(n * per_worker + i) for i in range(per_worker)]
+    ready.release()
+    go.wait()
+    for body in bodies:
+        client.post('/save', json=body, base_url=BASE_URL)
+    done.release()
+
+
+def run(workers, per_worker):
+    data_dir = tempfile.mkdtemp(prefix='ivnet-bench-')
+    try:
+        context = multiprocessing.get_context('spawn')
+        ready, done, go = context.Semaphore(0), context.Semaphore(0), context.Event()
+        processes = [context.Process(target=worker, args=(data_dir, per_worker, n, ready, go, done)) for n in range(workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+        start = time.perf_counter()
+        go.set()
+        for _ in processes:
+            done.acquire()
+        elapsed = time.perf_counter() - start
+        for process in processes:
+            process.join()
+
+        sys.path.insert(0, ROOT)
+        from ivnet.store import SegmentStore
+        store = SegmentStore(os.path.join(data_dir, 'locations'), shared=True)
+        stored = len(store)
+        ids = [fix.id for fix in store]
+        store.close()
+        ok = stored == workers * per_worker and ids == list(range(1, stored + 1))
+        return workers * per_worker / elapsed, ok
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-worker', type=int, default=5000)
+    parser.add_argument('--workers', default='1,2,4,8')
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} CPUs')
+    print(f'{"workers":>8}{"fixes/s":>12}{"speedup":>10}  check')
+    base = None
+    for workers in (int(n) for n in args.workers.split(',')):
+        rate, ok = run(workers, args.per_worker)
+        base = base or rate
+        print(f'{workers:>8}{rate:>12,.0f}{rate / base:>9.1f}x  {"ok" if ok else "MISSING OR DUPLICATE FIXES"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""/save latency: synchronous durable writes vs the write-behind queue.
+
+    python benchmarks/bench_writebehind.py [--requests 2000] [--threads 1,8]
+
+Three ways to acknowledge a fix, each driven through api/index.py with the
+Flask test client from N concurrent threads:
+
+  direct   append and msync/fsync inside the request (durable, no queue)
+  enqueue  acknowledge once the fix is buffered (durability="enqueue")
+  flush    acknowledge once the flusher has synced it (durability="flush");
+           concurrent requests share one fsync (group commit)
+"""
+import argparse
+import atexit
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'IVNET_DATA_DIR' not in os.environ:
+    os.environ['IVNET_DATA_DIR'] = tempfile.mkdtemp(prefix='ivnet-bench-')
+    atexit.register(shutil.rmtree, os.environ['IVNET_DATA_DIR'], True)
+# One client posting flat out: measure the handlers, not the rate limiter or load shedding
+os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+os.environ.setdefault('IVNET_SHED_LOAD', '0')
+
+from bench_store import fix  # noqa: E402
+from ivnet import logs  # noqa: E402
+
+logs.setup(open(os.devnull, 'w'))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index  # noqa: E402
+from ivnet.ingest import ShardedIngest  # noqa: E402
+
+BASE_URL = 'http://localhost:5000'
+
+
+class DirectDurable:
+    """Write and sync inside the request, the way a plain file or DB write would."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def append(self, record):
+        return self.append_many([record])[0]
+
+    def append_many(self, records):
+        ids = self.store.append_many(records)
+        self.store.flush()
+        return ids
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def live(self):
+        return self.store.live
+
+    def sync(self, wait=True):
+        pass
+
+    def close(self):
+        pass
+
+
+def run(ingest, requests, threads):
+    # /save writes through store_fixes, bound to the app's own ingest at import
+    index.ingest = ingest
+    index.store_fixes = ingest.append_many
+    per_thread = requests // threads
+    latencies = [[] for _ in range(threads)]
+    start_line = threading.Barrier(threads + 1)
+
+    def client_thread(n):
+        client = index.app.test_client()
+        bodies = [fix(n * per_thread + i) for i in range(per_thread)]
+        times = latencies[n]
+        start_line.wait()
+        for body in bodies:
+            started = time.perf_counter()
+            response = client.post('/save', json=body, base_url=BASE_URL)
+            times.append(time.perf_counter() - started)
+            assert response.status_code == 200
+
+    workers = [threading.Thread(target=client_thread, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    ingest.close()
+    samples = sorted(latency for times in latencies for latency in times)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return statistics.median(samples) * 1000, p99 * 1000, len(samples) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', default='1,8')
+    args = parser.parse_args()
+
+    variants = (
+        ('direct', lambda: DirectDurable(index.locations)),
+        ('enqueue', lambda: ShardedIngest(index.locations, durability='enqueue')),
+        ('flush', lambda: ShardedIngest(index.locations, durability='flush')),
+    )
+    index.ingest.close()
+    print(f'{"mode":<10}{"threads":>8}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}')
+    for threads in (int(n) for n in args.threads.split(',')):
+        for name, make in variants:
+            p50, p99, rate = run(make(), args.requests, threads)
+            print(f'{name:<10}{threads:>8}{p50:>10.3f}{p99:>10.3f}{rate:>10,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""Load test for every route: throughput, p50/p95/p99 latency and peak RSS as JSON.
+
+    python benchmarks/loadtest.py [--scenarios save,dashboard,...] [--concurrency 1,4,16]
+                                  [--requests 2000] [--preload 10000] [--mode client|server]
+                                  [--output results.json] [--baseline previous.json]
+
+Every (scenario, concurrency) pair runs in a fresh process with its own
+empty data directory, preloaded with --preload fixes from synthetic
+devices, so the RSS high-water mark belongs to that run alone. Worker
+threads then send --requests requests in total: each thread plays one
+device (its own sessionId, walking a random track and posting a fix every
+few seconds of simulated time) or one viewer polling a read route.
+
+--mode client drives the Flask app in-process through its test client;
+--mode server serves it with werkzeug's threaded server on 127.0.0.1:5000
+and sends real HTTP requests (the driver shares the process, so its own
+overhead is included). The JSON goes to stdout (or --output) and carries
+the commit, so runs from two commits can be diffed; --baseline prints the
+change against an earlier run to stderr.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = 'localhost:5000'  # api/index.py only serves plain HTTP to localhost:5000
+BASE_URL = 'http://' + HOST
+
+USER_AGENT = 'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36'
+CITIES = [(51.5074, -0.1278), (40.7128, -74.0060), (35.6762, 139.6503), (-33.8688, 151.2093), (48.8566, 2.3522)]
+
+# name: (app, method, path, what each worker thread plays)
+SCENARIOS = {
+    'save': ('api', 'POST', '/save', 'device'),
+    'api-location': ('root', 'POST', '/api/location', 'device'),
+    'dashboard': ('api', 'GET', '/dashboard', 'viewer'),
+    'locations': ('api', 'GET', '/api/locations?limit=100', 'viewer'),
+    'locations-all': ('api', 'GET', '/api/locations', 'viewer'),
+    'test': ('api', 'GET', '/test', 'viewer'),
+    # Devices posting, every tenth request reading the newest page instead
+    'mixed': ('api', None, None, 'mixed'),
+}
+DEFAULT_SCENARIOS = 'save,api-location,dashboard,locations,test,mixed'
+
+
+class Device:
+    """One phone running the tracker page: a session walking a random track."""
+
+    def __init__(self, n, seed):
+        self.random = random.Random(seed * 1000003 + n)
+        self.session_id = f'bench-{seed}-{n}'
+        self.latitude, self.longitude = CITIES[n % len(CITIES)]
+        self.latitude += self.random.uniform(-0.05, 0.05)
+        self.longitude += self.random.uniform(-0.05, 0.05)
+        self.heading = self.random.uniform(0, 2 * math.pi)
+        self.ms = 1_700_000_000_000 + n * 1000
+
+    def fix(self):
+        # Walking pace, one fix every 5-30 s, turning a little each time
+        self.heading += self.random.gauss(0, 0.4)
+        step_m = self.random.uniform(5, 40)
+        self.latitude += step_m * math.cos(self.heading) / 111_320
+        self.longitude += step_m * math.sin(self.heading) / (111_320 * math.cos(math.radians(self.latitude)))
+        self.ms += self.random.randint(5000, 30000)
+        return {
+            'latitude': round(self.latitude, 7),
+            'longitude': round(self.longitude, 7),
+            'accuracy': round(self.random.uniform(4, 25), 1),
+            'altitude': None,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self.ms // 1000)) + '.%03dZ' % (self.ms % 1000),
+            'userAgent': USER_AGENT,
+            'platform': 'Linux armv8l',
+            'protocol': 'https:',
+            'host': 'web.ivnet.me',
+            'sessionId': self.session_id,
+        }
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples."""
+    if not samples:
+        return None
+    return samples[min(max(math.ceil(fraction * len(samples)) - 1, 0), len(samples) - 1)]
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_app(name):
+    if name == 'api':
+        sys.path.insert(0, os.path.join(ROOT, 'api'))
+    else:
+        sys.path.insert(0, ROOT)
+    import index
+    return index.app, index.ingest
+
+
+class ClientDriver:
+    """Sends requests through the app's test client, in this process."""
+
+    def __init__(self, app):
+        self._app = app
+
+    def session(self):
+        client = self._app.test_client()
+
+        def send(method, path, body):
+            response = client.open(path, method=method, json=body, base_url=BASE_URL)
+            response.get_data()
+            response.close()
+            return response.status_code
+        return send
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """Serves the app with werkzeug's threaded server and sends it real HTTP requests."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log line per request
+        self._server = make_server('127.0.0.1', 5000, app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def session(self):
+        def send(method, path, body):
+            # The development server speaks HTTP/1.0: one connection per request
+            connection = http.client.HTTPConnection('127.0.0.1', 5000, timeout=60)
+            headers = {'Host': HOST}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body).encode()
+                headers['Content-Type'] = 'application/json'
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            finally:
+                connection.close()
+        return send
+
+    def close(self):
+        self._server.shutdown()
+
+
+def preload(ingest, points, seed):
+    # Through the app's ingest queue, which hands out the ids
+    devices = [Device(n, seed) for n in range(50)]
+    for first in range(0, points, 10000):
+        ingest.append_many([devices[i % len(devices)].fix() for i in range(first, min(first + 10000, points))])
+    ingest.sync()
+
+
+def worker_requests(role, n, seed):
+    """Yield the `(method, path, body)` requests one worker thread sends, forever."""
+    if role == 'viewer':
+        while True:
+            yield None
+    device = Device(1000 + n, seed)
+    for i in itertools.count(n):
+        if role == 'mixed' and i % 10 == 9:
+            yield 'GET', '/api/locations?latest=50', None
+        else:
+            yield 'POST', None, device.fix()
+
+
+def run_scenario(name, concurrency, args, results):
+    data_dir = tempfile.mkdtemp(prefix='ivnet-load-')
+    try:
+        os.environ['IVNET_DATA_DIR'] = data_dir
+        # Devices post flat out rather than every 30s; measure the routes, not the
+        # rate limiter or load shedding (set both variables to include them)
+        os.environ.setdefault('IVNET_RATE_LIMIT', '0')
+        os.environ.setdefault('IVNET_SHED_LOAD', '0')
+        sys.path.insert(0, ROOT)
+        from ivnet import logs
+        logs.setup(open(os.devnull, 'w'))
+        app_name, method, path, role = SCENARIOS[name]
+        try:
+            app, ingest = load_app(app_name)
+        except (ImportError, SyntaxError) as e:
+            # The root app needs Python 3.12+ (nested quotes in its f-strings)
+            results.put({'scenario': name, 'concurrency': concurrency, 'error': f'{type(e).__name__}: {e}'})
+            return
+        preload(ingest, args.preload, args.seed)
+        driver = (ServerDriver if args.mode == 'server' else ClientDriver)(app)
+        post_path = '/save' if app_name == 'api' else '/api/location'
+
+        per_thread = [args.requests // concurrency + (n < args.requests % concurrency) for n in range(concurrency)]
+        latencies = [[] for _ in range(concurrency)]
+        errors = [0] * concurrency
+        start_line = threading.Barrier(concurrency + 1)
+
+        def work(n):
+            send = driver.session()
+            requests = worker_requests(role, n, args.seed)
+            samples = latencies[n]
+            start_line.wait()
+            for _ in range(per_thread[n]):
+                request = next(requests)
+                if request is None:
+                    request_method, request_path, body = method, path, None
+                else:
+                    request_method, request_path, body = request
+                    request_path = request_path or post_path
+                started = time.perf_counter()
+                try:
+                    status = send(request_method, request_path, body)
+                except Exception:
+                    status = 599
+                samples.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[n] += 1
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        start_line.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        driver.close()
+        ingest.sync()
+
+        samples = sorted(sample for thread_samples in latencies for sample in thread_samples)
+        results.put({
+            'scenario': name,
+            'app': app_name,
+            'route': path or f'{post_path} + /api/locations?latest=50',
+            'concurrency': concurrency,
+            'requests': len(samples),
+            'errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(sum(samples) / len(samples) * 1e3, 3),
+                'p50': round(percentile(samples, 0.50) * 1e3, 3),
+                'p95': round(percentile(samples, 0.95) * 1e3, 3),
+                'p99': round(percentile(samples, 0.99) * 1e3, 3),
+                'max': round(samples[-1] * 1e3, 3),
+            },
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stored': len(ingest.store),  # after thinning
+        })
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print throughput and latency changes against an earlier report to stderr."""
+    before = {(result['scenario'], result['concurrency']): result for result in baseline['results'] if 'error' not in result}
+    print(f'vs {baseline.get("commit") or "baseline"}:', file=sys.stderr)
+    for result in report['results']:
+        old = before.get((result['scenario'], result['concurrency']))
+        if old is None or 'error' in result:
+            continue
+        changes = [f'{"rps":>4} {(result["throughput_rps"] / old["throughput_rps"] - 1) * 100:+6.1f}%']
+        for key in ('p50', 'p99'):
+            changes.append(f'{key:>4} {(result["latency_ms"][key] / old["latency_ms"][key] - 1) * 100:+6.1f}%')
+        print(f'  {result["scenario"]:<14} c={result["concurrency"]:<4}' + '  '.join(changes), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help=f'comma-separated, from: {", ".join(SCENARIOS)}')
+    parser.add_argument('--concurrency', default='1,4,16', help='worker threads, comma-separated')
+    parser.add_argument('--requests', type=int, default=2000, help='per scenario and concurrency')
+    parser.add_argument('--preload', type=int, default=10000, help='fixes stored before each run')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--baseline', help='an earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    names = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(unknown)}')
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': [],
+    }
+    for name in names:
+        for concurrency in (int(value) for value in args.concurrency.split(',')):
+            process = context.Process(target=run_scenario, args=(name, concurrency, args, results))
+            process.start()
+            process.join()
+            if results.empty():
+                report['results'].append({'scenario': name, 'concurrency': concurrency, 'error': f'exit code {process.exitcode}'})
+            while not results.empty():
+                result = results.get()
+                report['results'].append(result)
+                print(f'{name} x{concurrency}: ' + (result.get('error') or
+                      f'{result["throughput_rps"]:,.0f} req/s, p99 {result["latency_ms"]["p99"]:.2f} ms'), file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
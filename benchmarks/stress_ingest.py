@@ -0,0 +1,84 @@
+"""Multi-threaded ingest stress: no lost or duplicated ids, throughput per thread count.
+
+    python benchmarks/stress_ingest.py [--per-thread 20000] [--threads 1,2,4,8,16]
+
+Exits non-zero if any run loses a write, repeats an id, or stores a record
+under an id other than the one its writer was given.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivnet.ingest import ShardedIngest  # noqa: E402
+from ivnet.store import SegmentStore  # noqa: E402
+
+
+def run(threads, per_thread):
+    path = tempfile.mkdtemp(prefix='ivnet-stress-')
+    try:
+        store = SegmentStore(path)
+        # Writers that outrun the flusher wait for it, so every fix is accounted for
+        ingest = ShardedIngest(store, shed_load=False)
+        given = [[] for _ in range(threads)]
+        start_line = threading.Barrier(threads + 1)
+
+        def writer(n):
+            start_line.wait()
+            ids = given[n]
+            for i in range(per_thread):
+                ids.append(ingest.append({'latitude': float(n), 'longitude': float(i), 'platform': f'writer-{n}'}))
+
+        workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        start_line.wait()
+        start = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        ingest.sync()
+        elapsed = time.perf_counter() - start
+
+        total = threads * per_thread
+        all_ids = [location_id for ids in given for location_id in ids]
+        problems = []
+        if len(set(all_ids)) != total:
+            problems.append(f'{total - len(set(all_ids))} duplicated ids')
+        if sorted(all_ids) != list(range(1, total + 1)):
+            problems.append('ids are not exactly 1..N')
+        if len(store) != total:
+            problems.append(f'store holds {len(store)} of {total} fixes')
+        for n, ids in enumerate(given):
+            for i, location_id in enumerate(ids):
+                fix = store.get(location_id)
+                if (fix.latitude, fix.longitude) != (float(n), float(i)):
+                    problems.append(f'id {location_id} holds the wrong record')
+                    break
+        store.close()
+        return total / elapsed, problems
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-thread', type=int, default=20000)
+    parser.add_argument('--threads', default='1,2,4,8,16')
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"threads":>8}{"fixes/s":>12}  result')
+    for threads in (int(n) for n in args.threads.split(',')):
+        rate, problems = run(threads, args.per_thread)
+        failed = failed or bool(problems)
+        print(f'{threads:>8}{rate:>12,.0f}  {"; ".join(problems) or "ok"}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,60 @@
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import HTTPException
+import html
 import json
 from datetime import datetime
+from ivnet import batch, config, views
+from ivnet.codec import JSONProvider
+from ivnet.clusters import ClusterPyramid
+from ivnet.ingest import QueueFull, ShardedIngest
+from ivnet.logs import get_logger
+from ivnet.metrics import RequestMetrics
+from ivnet.query import QueryError
+from ivnet.ratelimit import BatchCharge, RateLimiter
+from ivnet.retention import Sweeper
+from ivnet.schema import Schema, SchemaError, check_length
+from ivnet.sessions import SessionIndex
+from ivnet.spatial import GridIndex
+from ivnet.store import open_store
+from ivnet.thinning import Thinner
 
 app = Flask(__name__)
+# request.get_json(), jsonify and returned dicts go through orjson when installed
+app.json = JSONProvider(app)
+# Bodies over IVNET_MAX_BODY_BYTES are refused with a 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_BODY_BYTES
+# JSON lines on stdout (shows in Vercel logs), written by a background thread
+log = get_logger('tracker')
+# Per-route counts, latency histograms and byte totals for /metrics; its
+# hooks go first so the timing covers the ones below
+request_metrics = RequestMetrics()
+request_metrics.instrument(app)
 
-# Store location data in memory (for demo purposes)
-location_data = []
+# Persistent segment store (survives restarts; see ivnet/store.py)
+location_data = open_store('location_data')
+# All writes go through sharded buffers so concurrent requests never race on ids
+ingest = ShardedIngest(location_data)
+# Grid index for area queries, kept current on every append
+area_index = GridIndex(location_data)
+# Per-zoom map clusters, also kept current on every append
+cluster_pyramid = ClusterPyramid(location_data)
+# Running per-session totals (first/last seen, distance, top speed)
+session_index = SessionIndex(location_data)
+# Expires the oldest fixes past IVNET_RETAIN_POINTS / IVNET_RETAIN_SECONDS (off by default)
+retention = Sweeper(location_data)
+# Near-duplicate fixes from the same session (periodic re-sends) are not stored
+thinner = Thinner()
+store_fixes = thinner.wrap(ingest.append_many)
+# Posted fixes keep only known, well-typed fields, with strings capped (see ivnet/schema.py)
+schema = Schema()
+# Token bucket per session (or address) on the ingest routes; past it, a 429 with Retry-After
+limiter = RateLimiter()
+
+@app.before_request
+def sync_pending_writes():
+    # Reads must see every fix that has already been acknowledged
+    if request.method == 'GET':
+        ingest.sync()
 
 @app.route('/')
 def home():
@@ -315,7 +364,7 @@ def dashboard():
             
             <div class="stats">
                 <div class="stat-item">
-                    <div class="stat-number">{len(location_data)}</div>
+                    <div class="stat-number">{location_data.live}</div>
                     <div>Total Locations</div>
                 </div>
                 <div class="stat-item">
@@ -325,14 +374,14 @@ def dashboard():
             </div>
             
             <div id="locationList">
-                {'<div style="text-align: center; padding: 40px; opacity: 0.8;">📍 No location data yet. Use the tracker to start collecting data!</div>' if len(location_data) == 0 else ''.join([f'''
+                {'<div style="text-align: center; padding: 40px; opacity: 0.8;">📍 No location data yet. Use the tracker to start collecting data!</div>' if not location_data.live else ''.join([f'''
                 <div class="location-item">
-                    <h3>📍 Track #{item.get('id', i+1)}</h3>
-                    <p><strong>📊 Coordinates:</strong> {item.get('latitude', 'Unknown')}, {item.get('longitude', 'Unknown')}</p>
-                    <p><strong>🕒 Time:</strong> {item.get('timestamp', 'Unknown')}</p>
-                    <p><strong>📱 Device:</strong> {item.get('platform', 'Unknown')}</p>
-                    <p><strong>🎯 Accuracy:</strong> {item.get('accuracy', 'Unknown')} meters</p>
-                    <p><strong>🔗 Maps:</strong> <a href="https://www.google.com/maps?q={item.get('latitude', 0)},{item.get('longitude', 0)}" target="_blank" style="color: #ffd700;">View on Google Maps</a></p>
+                    <h3>📍 Track #{html.escape(str(item.get('id', i+1)))}</h3>
+                    <p><strong>📊 Coordinates:</strong> {html.escape(str(item.get('latitude', 'Unknown')))}, {html.escape(str(item.get('longitude', 'Unknown')))}</p>
+                    <p><strong>🕒 Time:</strong> {html.escape(str(item.get('timestamp', 'Unknown')))}</p>
+                    <p><strong>📱 Device:</strong> {html.escape(str(item.get('platform', 'Unknown')))}</p>
+                    <p><strong>🎯 Accuracy:</strong> {html.escape(str(item.get('accuracy', 'Unknown')))} meters</p>
+                    <p><strong>🔗 Maps:</strong> <a href="https://www.google.com/maps?q={html.escape(str(item.get('latitude', 0)))},{html.escape(str(item.get('longitude', 0)))}" target="_blank" style="color: #ffd700;">View on Google Maps</a></p>
                 </div>
                 ''' for i, item in enumerate(reversed(location_data))])}
             </div>
@@ -343,44 +392,127 @@ def dashboard():
 
 @app.route('/api/location', methods=['POST'])
 def save_location():
+    check_length(request.content_length)
     try:
-        data = request.get_json()
+        data = schema.normalize(request.get_json())
+        limiter.check_client(request.environ, data.get('sessionId'))
         
         # Add server-side info
-        data['id'] = len(location_data) + 1
-        data['server_timestamp'] = datetime.now().isoformat()
         data['ip_address'] = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'Unknown'))
         
-        # Store data
-        location_data.append(data)
+        # Store data (the store assigns the id and server timestamp)
+        # A fix that repeats the session's last one gets that fix's id instead
+        data['id'] = store_fixes([data])[0]
         
-        # Print to console (will show in Vercel logs)
-        print(f"🔴 NEW LOCATION TRACKED:")
-        print(f"   📍 Coordinates: {data.get('latitude')}, {data.get('longitude')}")
-        print(f"   🕒 Time: {data.get('timestamp')}")
-        print(f"   📱 Device: {data.get('platform')}")
-        print(f"   🌐 IP: {data.get('ip_address')}")
-        print(f"   🆔 Session: {data.get('sessionId')}")
+        log.sampled('location_tracked', id=data['id'], latitude=data.get('latitude'), longitude=data.get('longitude'),
+                    timestamp=data.get('timestamp'), platform=data.get('platform'),
+                    ip_address=data.get('ip_address'), session=data.get('sessionId'))
         
         return jsonify({'status': 'success', 'id': data['id'], 'message': 'Location saved successfully!'})
+    except SchemaError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except (HTTPException, QueueFull):
+        raise  # malformed JSON, rate limits and a full queue are answered by the handlers below
     except Exception as e:
-        print(f"❌ Error saving location: {e}")
+        log.error('location_save_failed', exc_info=True, error=str(e))
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/locations/batch', methods=['POST'])
+def save_locations_batch():
+    # Accepts a JSON array or an NDJSON body (Content-Type: application/x-ndjson)
+    ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'Unknown'))
+
+    def add_server_info(data):
+        data['ip_address'] = ip_address
+
+    # Each record takes a token from its own session (or the sender's address)
+    charge = BatchCharge(limiter, schema.normalize, request.environ)
+    try:
+        results = batch.ingest(request.stream, request.mimetype, store_fixes, add_server_info, charge)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    saved = sum(1 for result in results if result['status'] == 'success')
+    charge.check(saved)
+    log.info('batch_tracked', saved=saved, received=len(results), ip_address=ip_address)
+    return jsonify({'status': 'success', 'saved': saved, 'failed': len(results) - saved, 'results': results})
+
+@app.errorhandler(QueryError)
+def bad_query(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.errorhandler(400)
+@app.errorhandler(415)
+def bad_request(e):
+    # Unparseable JSON, or a body that isn't application/json
+    return jsonify({'status': 'error', 'message': e.description}), e.code
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({'status': 'error', 'message': e.description}), 413
+
+@app.errorhandler(429)
+def rate_limited(e):
+    return jsonify({'status': 'error', 'message': e.description}), 429, {'Retry-After': str(e.retry_after)}
+
+@app.errorhandler(QueueFull)
+def queue_full(e):
+    # Shed load while the write queue drains; clients retry shortly
+    return jsonify({'status': 'error', 'message': 'Server busy, retry shortly'}), 503, {'Retry-After': '1'}
+
 @app.route('/api/locations', methods=['GET'])
 def get_locations():
-    return jsonify(location_data)
+    # Streams everything by default; ?after_id=&limit=&from=&to= pages through it
+    return views.locations_response(location_data, request.args)
+
+@app.route('/api/export', methods=['GET'])
+def export_locations():
+    # ?format=csv|geojson|ndjson&from=&to=&session=&gzip=
+    return views.export_response(location_data, request.args, request.headers.get('Accept-Encoding'))
+
+@app.route('/api/locations/delta', methods=['GET'])
+def locations_delta():
+    # Polling: ?since=<id> or ?version=<v> (or If-None-Match) returns only newer fixes, 304 if none
+    return views.delta_response(location_data, request.args, request.if_none_match)
+
+@app.route('/api/locations/within', methods=['GET'])
+def locations_within():
+    # ?bbox=min_lon,min_lat,max_lon,max_lat or ?lat=&lon=&radius_m=
+    return views.within_response(location_data, area_index, request.args)
+
+@app.route('/api/clusters', methods=['GET'])
+def get_clusters():
+    # ?zoom=<z>&bbox=min_lon,min_lat,max_lon,max_lat
+    return views.clusters_response(cluster_pyramid, request.args)
+
+@app.route('/api/sessions', methods=['GET'])
+def get_sessions():
+    # ?active_since=<time>&limit=<n>
+    return views.sessions_response(session_index, request.args)
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    return views.session_response(session_index, location_data, session_id)
+
+@app.route('/api/sessions/<session_id>/analytics', methods=['GET'])
+def get_session_analytics(session_id):
+    # ?dwell_speed_mps=&dwell_radius_m=&dwell_min_s=&steps=1 (needs numpy)
+    return views.analytics_response(location_data, session_id, request.args)
 
 @app.route('/api/clear', methods=['POST'])
 def clear_locations():
-    global location_data
-    location_data = []
+    ingest.clear()
+    thinner.clear()
     return jsonify({'status': 'success', 'message': 'All data cleared'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format
+    return views.metrics_response(request_metrics, location_data, ingest, thinner, retention, limiter)
+
 # Test endpoint to check if server is working
 @app.route('/api/test')
 def test():
-    return jsonify({'status': 'online', 'message': 'Server is working!', 'timestamp': datetime.now().isoformat()})
+    return jsonify({'status': 'online', 'message': 'Server is working!', 'timestamp': datetime.now().isoformat(), 'thinning': thinner.stats(), 'retention': retention.stats(), 'rate_limit': limiter.stats()})
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1 @@
+"""Storage and ingest helpers shared by the ivnet tracker apps."""
@@ -0,0 +1,180 @@
+"""Trajectory analytics over one session's fixes, vectorized with NumPy.
+
+`load_track()` pulls a session's fixes straight out of the store's packed
+columns into arrays (one comparison per segment, no `Fix` objects), and
+`analyze()` computes step distances, speeds, bearings and dwells over the
+whole track at once. NumPy is optional: without it `numpy` is None and the
+endpoint answers 501.
+
+Step times come from the client timestamps when every fix has one (an
+offline batch arrives at the server all at once) and from the server
+timestamps otherwise.
+"""
+from .spatial import EARTH_RADIUS_M
+from .store import DELETED_BIT, FIELD_BITS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DWELL_SPEED_MPS = 0.5  # slower steps count as standing still (GPS jitter included)
+DWELL_RADIUS_M = 100.0  # every fix of a dwell lies this close to its centre
+DWELL_MIN_SECONDS = 300.0  # and it lasts at least this long
+
+_NEEDED = FIELD_BITS['sessionId'] | FIELD_BITS['latitude'] | FIELD_BITS['longitude']
+_COLUMNS = ('sessionId', 'present', 'latitude', 'longitude', 'timestamp', 'server_timestamp')
+
+
+class Track:
+    """One session's located fixes as parallel arrays, oldest first."""
+
+    __slots__ = ('ids', 'lat', 'lon', 'seconds')
+
+    def __init__(self, ids, lat, lon, seconds):
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.seconds = seconds  # epoch seconds
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _select(first_id, columns, session):
+    # Everything built from the column buffers is released on return, so
+    # the store can unmap them; the fancy-indexed results are copies
+    present = numpy.frombuffer(columns['present'], dtype=numpy.uint32)
+    mask = numpy.frombuffer(columns['sessionId'], dtype=numpy.uint32) == session
+    mask &= (present & (_NEEDED | DELETED_BIT)) == _NEEDED
+    rows = numpy.flatnonzero(mask)
+    lat = numpy.frombuffer(columns['latitude'], dtype=numpy.float64)[rows]
+    lon = numpy.frombuffer(columns['longitude'], dtype=numpy.float64)[rows]
+    client_ms = numpy.frombuffer(columns['timestamp'], dtype=numpy.float64)[rows]
+    has_client = (present[rows] & FIELD_BITS['timestamp']) != 0
+    server_us = numpy.frombuffer(columns['server_timestamp'], dtype=numpy.int64)[rows]
+    return rows + first_id, lat, lon, numpy.where(has_client, client_ms, numpy.nan), server_us
+
+
+def load_track(store, session_id):
+    """Return the session's located, non-deleted fixes as a `Track`."""
+    session = store.string_id(session_id)
+    parts = []
+    if session is not None:
+        with store.columns(_COLUMNS) as segments:
+            parts = [_select(first_id, columns, session) for first_id, columns in segments]
+    if not parts:
+        empty = numpy.empty(0)
+        return Track(numpy.empty(0, dtype=numpy.int64), empty, empty, empty)
+    ids, lat, lon, client_ms, server_us = (numpy.concatenate(column) for column in zip(*parts))
+    located = ~(numpy.isnan(lat) | numpy.isnan(lon))
+    ids, lat, lon, client_ms, server_us = ids[located], lat[located], lon[located], client_ms[located], server_us[located]
+    if len(client_ms) and not numpy.isnan(client_ms).any():
+        seconds = client_ms / 1e3
+    else:
+        seconds = server_us / 1e6
+    return Track(ids, lat, lon, seconds)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = numpy.radians(lat1), numpy.radians(lat2)
+    dlambda = numpy.radians(lon2 - lon1)
+    a = numpy.sin((phi2 - phi1) / 2) ** 2 + numpy.cos(phi1) * numpy.cos(phi2) * numpy.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def step_geometry(lat, lon):
+    """Return `(distance_m, bearing_deg)` from each point to the next (length n - 1).
+
+    Great-circle distance by haversine and the initial bearing clockwise
+    from north, sharing the trigonometry between the two.
+    """
+    phi = numpy.radians(lat)
+    cos_phi, sin_phi = numpy.cos(phi), numpy.sin(phi)
+    cos1, cos2 = cos_phi[:-1], cos_phi[1:]
+    dlambda = numpy.radians(numpy.diff(lon))
+    half_dlambda = numpy.sin(dlambda / 2) ** 2
+    a = numpy.sin(numpy.diff(phi) / 2) ** 2 + cos1 * cos2 * half_dlambda
+    distance = 2 * EARTH_RADIUS_M * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    # cos(dlambda) = 1 - 2 sin^2(dlambda / 2)
+    x = cos1 * sin_phi[1:] - sin_phi[:-1] * cos2 * (1 - 2 * half_dlambda)
+    y = numpy.sin(dlambda) * cos2
+    return distance, numpy.degrees(numpy.arctan2(y, x)) % 360
+
+
+def dwells(track, still, radius_m=DWELL_RADIUS_M, min_seconds=DWELL_MIN_SECONDS):
+    """Runs of consecutive `still` steps lasting at least `min_seconds` and staying within `radius_m`.
+
+    Returns a list of dicts with the first and last id, start and end
+    (epoch seconds), duration, fix count and centre.
+    """
+    edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], still.astype(numpy.int8), [0]))))
+    # Step i joins fixes i and i + 1, so a run of steps [s, e) covers fixes s..e
+    starts, ends = edges[0::2], edges[1::2]
+    durations = track.seconds[ends] - track.seconds[starts]
+    keep = durations >= min_seconds
+    starts, ends, durations = starts[keep], ends[keep], durations[keep]
+    if not len(starts):
+        return []
+    # Every run at once: the fixes of all runs back to back, reduceat per run
+    counts = ends - starts + 1
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+    rows = numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())
+    lat, lon = track.lat[rows], track.lon[rows]
+    centre_lat = numpy.add.reduceat(lat, offsets) / counts
+    centre_lon = numpy.add.reduceat(lon, offsets) / counts
+    spread = _haversine(lat, lon, numpy.repeat(centre_lat, counts), numpy.repeat(centre_lon, counts))
+    # Slow drift is still movement: the whole stay must fit in the radius
+    inside = numpy.maximum.reduceat(spread, offsets) <= radius_m
+    return [
+        {
+            'first_id': first_id,
+            'last_id': last_id,
+            'start': start,
+            'end': end,
+            'duration_s': round(duration, 1),
+            'count': count,
+            'latitude': latitude,
+            'longitude': longitude,
+        }
+        for first_id, last_id, start, end, duration, count, latitude, longitude in zip(
+            track.ids[starts[inside]].tolist(), track.ids[ends[inside]].tolist(),
+            track.seconds[starts[inside]].tolist(), track.seconds[ends[inside]].tolist(),
+            durations[inside].tolist(), counts[inside].tolist(),
+            centre_lat[inside].tolist(), centre_lon[inside].tolist())
+    ]
+
+
+def analyze(track, speed_mps=DWELL_SPEED_MPS, radius_m=DWELL_RADIUS_M, min_seconds=DWELL_MIN_SECONDS):
+    """Return `(totals, steps, dwells)` for a track.
+
+    `steps` holds the per-step arrays (`id` of the step's end fix,
+    `distance_m`, `seconds`, `speed_mps`, `bearing_deg`); a step with no
+    elapsed time has a NaN speed.
+    """
+    distance, bearing = step_geometry(track.lat, track.lon)
+    elapsed = numpy.diff(track.seconds)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        speed = numpy.where(elapsed > 0, distance / elapsed, numpy.nan)
+    # A step with no elapsed time has no speed; judge it by its length instead
+    still = numpy.where(elapsed > 0, speed <= speed_mps, distance <= radius_m)
+    steps = {
+        'id': track.ids[1:],
+        'distance_m': distance,
+        'seconds': elapsed,
+        'speed_mps': speed,
+        'bearing_deg': bearing,
+    }
+    found = dwells(track, still, radius_m, min_seconds)
+    duration = float(track.seconds[-1] - track.seconds[0]) if len(track) else 0.0
+    total = float(distance.sum())
+    totals = {
+        'points': len(track),
+        'distance_m': round(total, 1),
+        'duration_s': round(duration, 1),
+        'moving_s': round(float(elapsed[~still].sum()), 1),
+        'dwell_s': round(sum((dwell['duration_s'] for dwell in found), 0.0), 1),
+        'max_speed_mps': round(float(numpy.nanmax(speed)), 2) if numpy.isfinite(speed).any() else 0.0,
+        'mean_speed_mps': round(total / duration, 2) if duration > 0 else 0.0,
+    }
+    return totals, steps, found
@@ -0,0 +1,39 @@
+"""Catching a derived index up on the stored history off the request path.
+
+GridIndex, ClusterPyramid and SessionIndex fold in each append as it
+happens, but when the app starts they have the whole history to read, which
+takes seconds at a million fixes. `Backfilled` does that on a background
+thread, BACKFILL_ROWS rows per lock hold, so importing the app only maps the
+segments. Until it has caught up, appends leave their rows to it and
+queries wait for it.
+"""
+import threading
+
+BACKFILL_ROWS = 65536  # rows folded in per lock hold while catching up
+
+
+class Backfilled:
+    """Mixin for an index with an `_update(limit=None)` that returns True while rows remain."""
+
+    def _start_backfill(self, name):
+        self._ready = threading.Event()
+        self._store.subscribe(self.update)
+        threading.Thread(target=self._backfill, name=name, daemon=True).start()
+
+    def _backfill(self):
+        try:
+            while self._update(BACKFILL_ROWS):
+                pass
+        finally:
+            self._ready.set()
+        # Appends between the last chunk and now left their rows to this thread
+        self._update()
+
+    def update(self):
+        """Fold in whatever the store appended or expired since the last call."""
+        if self._ready.is_set():
+            self._update()
+
+    def wait_ready(self, timeout=None):
+        """Block until the history has been read; returns False on timeout."""
+        return self._ready.wait(timeout)
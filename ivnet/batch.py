@@ -0,0 +1,190 @@
+"""Incremental parsing of batched ingest bodies (JSON array or NDJSON)."""
+import codecs
+import json
+import re
+
+from .codec import loads, orjson
+
+CHUNK_SIZE = 64 * 1024
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+# What an element's extent depends on: whole strings (so brackets and commas
+# inside them don't count), a string still open at the end of the buffer,
+# and the brackets and commas themselves
+_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"|[][{},]')
+
+
+class BatchError(ValueError):
+    """The body as a whole is malformed, so no record past this point can be trusted."""
+
+
+def _chunks(stream):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        raw = stream.read(CHUNK_SIZE)
+        if not raw:
+            break
+        yield decoder.decode(raw)
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _iter_ndjson(stream):
+    buffer = ''
+    for text in _chunks(stream):
+        buffer += text
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line
+    yield buffer
+
+
+def iter_ndjson(stream):
+    """Yield `(value, error)` for each non-blank line of an NDJSON stream."""
+    for line in _iter_ndjson(stream):
+        if not line.strip():
+            continue
+        try:
+            yield loads(line), None
+        except ValueError as e:
+            yield None, f'Invalid JSON: {e}'
+
+
+def _element_end(buffer, pos):
+    """End of the array element starting at `pos`, or None if it continues past the buffer."""
+    depth = 0
+    for match in _TOKENS.finditer(buffer, pos):
+        token = match.group()
+        if token in '{[':
+            depth += 1
+        elif token in '}]':
+            if depth == 0:
+                return match.start()  # the array's own ']' (or a stray bracket, which loads rejects)
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif token == ',':
+            if depth == 0:
+                return match.start()
+        elif token == '"':
+            return None
+    return None
+
+
+def _decode_element(buffer, pos):
+    """Decode the array element at `pos`; returns `(value, end)`, or None if it continues past the buffer."""
+    if buffer[pos] == '{':
+        try:
+            if orjson is None:
+                # The stdlib decodes in place, and an object it decodes is complete
+                return _decoder.raw_decode(buffer, pos)
+            # Fixes are flat, so the first '}' usually closes the object; a
+            # slice that parses can only end at the object's own '}'
+            end = buffer.find('}', pos) + 1
+            if end:
+                return loads(buffer[pos:end]), end
+        except ValueError:
+            pass
+    end = _element_end(buffer, pos)
+    if end is None:
+        return None
+    try:
+        return loads(buffer[pos:end]), end
+    except ValueError as e:
+        raise BatchError(f'Invalid JSON: {e}')
+
+
+def iter_json_array(stream):
+    """Yield `(value, None)` for each element of a top-level JSON array.
+
+    Elements are decoded as soon as they are fully buffered, so memory stays
+    bounded by the largest element rather than the whole body. Each element
+    is cut out and decoded on its own by the codec, so array batches are
+    parsed with orjson like NDJSON ones.
+    """
+    buffer = ''
+    pos = 0
+    state = 'start'  # start -> value -> separator -> ... -> end
+    for text in _chunks(stream):
+        buffer = buffer[pos:] + text
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise BatchError('Expected a JSON array')
+                pos += 1
+                state = 'first'
+            elif state in ('first', 'value'):
+                if state == 'first' and char == ']':
+                    pos += 1
+                    state = 'end'
+                    continue
+                decoded = _decode_element(buffer, pos)
+                if decoded is None:
+                    break
+                value, end = decoded
+                pos = end
+                state = 'separator'
+                yield value, None
+            elif state == 'separator':
+                if char == ',':
+                    state = 'value'
+                elif char == ']':
+                    state = 'end'
+                else:
+                    raise BatchError(f'Expected "," or "]" at offset {pos}')
+                pos += 1
+            else:
+                raise BatchError('Unexpected data after the JSON array')
+    if state != 'end':
+        raise BatchError('Truncated JSON array')
+
+
+def iter_records(stream, mimetype):
+    """Yield `(record, error)` pairs from a batch body; exactly one of the two is set."""
+    values = iter_ndjson(stream) if mimetype in NDJSON_TYPES else iter_json_array(stream)
+    for value, error in values:
+        if error is None and not isinstance(value, dict):
+            error = 'Record must be a JSON object'
+        elif error is None and not value:
+            error = 'No data received'
+        yield (None, error) if error else (value, None)
+
+
+def ingest(stream, mimetype, append_many, prepare=None, validate=None):
+    """Parse, validate and store a batch body.
+
+    `validate` returns the record to store or raises ValueError, which
+    fails that record only. Valid records are collected and handed to
+    `append_many` in one call, so the store takes its lock once per batch.
+    Returns the per-record status list in input order.
+    """
+    results = []
+    records = []
+    for index, (record, error) in enumerate(iter_records(stream, mimetype)):
+        if error is None and validate is not None:
+            try:
+                record = validate(record)
+            except ValueError as e:
+                error = str(e)
+        if error:
+            results.append({'index': index, 'status': 'error', 'message': error})
+            continue
+        if prepare is not None:
+            prepare(record)
+        results.append({'index': index, 'status': 'success'})
+        records.append(record)
+    ids = append_many(records) if records else []
+    saved = iter(ids)
+    for result in results:
+        if result['status'] == 'success':
+            result['id'] = next(saved)
+    return results
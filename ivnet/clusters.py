@@ -0,0 +1,182 @@
+"""Multi-zoom point clusters for drawing the stored fixes on a web map.
+
+For every zoom level up to CLUSTER_MAX_ZOOM the Web Mercator world is cut
+into square cells of CELL_PIXELS screen pixels, and each cell keeps the
+count and coordinate sums of the fixes inside it. A new fix updates one
+cell per level, so a viewport query only reads the cells it covers: the
+answer grows with the size of the map on screen, not with the history.
+
+Fixes the store expires are taken back out of their cells on the next
+update; a cell left empty is dropped and its slot reused.
+"""
+import math
+import threading
+from array import array
+
+from . import config
+from .backfill import Backfilled
+from .spatial import _lon_ranges
+
+CELL_PIXELS = 64  # on 256-pixel tiles: 4 x 4 cells per tile
+MAX_LATITUDE = 85.05112878  # Web Mercator's square world ends here
+
+
+def _mercator(lat, lon):
+    """Project to the unit square, x east and y south from the top-left corner."""
+    lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180) / 360
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+class _Level:
+    """The cells of one zoom level: `key -> slot`, plus packed totals per slot.
+
+    A cell's key is `cy << 32 | cx`, its row and column on this level.
+    """
+
+    __slots__ = ('size', 'slots', 'counts', 'lats', 'lons', 'last_ids', 'free')
+
+    def __init__(self, zoom):
+        self.size = (256 << zoom) // CELL_PIXELS  # cells across the world
+        self.slots = {}
+        self.counts = array('I')
+        self.lats = array('d')  # sums, divided by the count when read
+        self.lons = array('d')
+        self.last_ids = array('I')
+        self.free = []  # slots of cells emptied by expiry
+
+    def cell(self, x, y):
+        size = self.size
+        return min(int(x * size), size - 1), min(int(y * size), size - 1)
+
+    def slots_within(self, x0, y0, x1, y1):
+        """Yield the occupied slots in cells x0..x1, y0..y1 (inclusive)."""
+        slots = self.slots
+        # Walk the box when it is small, otherwise walk the (fewer) occupied cells
+        if (y1 - y0 + 1) * (x1 - x0 + 1) <= len(slots):
+            for cy in range(y0, y1 + 1):
+                row = cy << 32
+                for cx in range(x0, x1 + 1):
+                    slot = slots.get(row | cx)
+                    if slot is not None:
+                        yield slot
+        else:
+            for key, slot in slots.items():
+                cy, cx = key >> 32, key & 0xFFFFFFFF
+                if y0 <= cy <= y1 and x0 <= cx <= x1:
+                    yield slot
+
+
+class ClusterPyramid(Backfilled):
+    """Per-zoom cell totals, kept current by subscribing to the store's appends.
+
+    Deleted fixes are counted too, until they expire: a tombstone can land
+    before or after a fix is counted, and expiry has to take back exactly
+    what was added.
+    """
+
+    def __init__(self, store, max_zoom=config.CLUSTER_MAX_ZOOM):
+        self._store = store
+        self.max_zoom = max_zoom
+        self._lock = threading.Lock()
+        self._reset()
+        self._start_backfill('ivnet-cluster-backfill')
+
+    def _reset(self):
+        self._levels = [_Level(zoom) for zoom in range(self.max_zoom + 1)]
+        # Rows already expired are never counted in the first place
+        self._upto = self._removed = self._store.first_id - 1
+        self._generation = self._store.generation
+
+    def _update(self, limit=None):
+        """Count the rows appended since the last call (at most `limit`), and uncount the ones expired."""
+        with self._lock:
+            if self._generation != self._store.generation:
+                self._reset()
+            # Cell sizes halve from one level to the next, so a fix's cell on
+            # every level is its cell on the deepest one shifted right
+            deepest = self._levels[-1]
+            levels = [(shift, level.slots, level.counts, level.lats, level.lons, level.last_ids, level.free)
+                      for shift, level in enumerate(reversed(self._levels))]
+            expired = min(self._store.first_id - 1, self._upto)
+            if expired > self._removed:
+                for _, lat, lon in self._store.coordinates(self._removed, expired, expired=True, deleted=True):
+                    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                        continue
+                    cx, cy = deepest.cell(*_mercator(lat, lon))
+                    for shift, slots, counts, lats, lons, _, free in levels:
+                        key = (cy >> shift) << 32 | cx >> shift
+                        slot = slots[key]
+                        if counts[slot] == 1:
+                            del slots[key]
+                            free.append(slot)
+                        counts[slot] -= 1
+                        lats[slot] -= lat
+                        lons[slot] -= lon
+                self._removed = expired
+            appended = len(self._store)
+            upto = appended if limit is None else min(appended, self._upto + limit)
+            if upto <= self._upto:
+                return False
+            for location_id, lat, lon in self._store.coordinates(self._upto, upto, deleted=True):
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    continue  # not a position on the map
+                cx, cy = deepest.cell(*_mercator(lat, lon))
+                for shift, slots, counts, lats, lons, last_ids, free in levels:
+                    key = (cy >> shift) << 32 | cx >> shift
+                    slot = slots.get(key)
+                    if slot is None:
+                        if free:
+                            slot = slots[key] = free.pop()
+                            counts[slot] = 1
+                            lats[slot] = lat
+                            lons[slot] = lon
+                            last_ids[slot] = location_id
+                        else:
+                            slots[key] = len(counts)
+                            counts.append(1)
+                            lats.append(lat)
+                            lons.append(lon)
+                            last_ids.append(location_id)
+                    else:
+                        counts[slot] += 1
+                        lats[slot] += lat
+                        lons[slot] += lon
+                        last_ids[slot] = location_id
+            self._upto = upto
+            return upto < appended
+
+    def clusters(self, zoom, min_lat, min_lon, max_lat, max_lon, limit):
+        """Return `(clusters, truncated)` for the box at the given zoom (clamped to max_zoom).
+
+        Each cluster is a dict with `count` and the centroid `latitude` and
+        `longitude`; a single fix also carries its `id`. min_lon > max_lon
+        wraps the antimeridian.
+        """
+        zoom = min(zoom, self.max_zoom)
+        if min_lon > max_lon:
+            max_lon += 360
+        found = []
+        truncated = False
+        self._ready.wait()
+        with self._lock:
+            level = self._levels[zoom]
+            for lon0, lon1 in _lon_ranges(min_lon, max_lon):
+                x0, y0 = level.cell(*_mercator(max_lat, lon0))
+                x1, y1 = level.cell(*_mercator(min_lat, lon1))
+                for slot in level.slots_within(x0, y0, x1, y1):
+                    if len(found) == limit:
+                        truncated = True
+                        break
+                    count = level.counts[slot]
+                    cluster = {
+                        'count': count,
+                        'latitude': level.lats[slot] / count,
+                        'longitude': level.lons[slot] / count,
+                    }
+                    if count == 1:
+                        cluster['id'] = level.last_ids[slot]
+                    found.append(cluster)
+        return found, truncated
@@ -0,0 +1,84 @@
+"""JSON encoding and decoding, with orjson when it is installed.
+
+`dumps()` and `loads()` are what the read endpoints, the export and the
+batch parser use, and `JSONProvider` routes Flask's `request.get_json()`,
+`jsonify()` and returned dicts through them too. orjson is optional
+(`pip install orjson`); without it, or with IVNET_JSON_CODEC=json, the
+stdlib `json` module is used. `NAME` says which one is in use.
+
+Both produce compact output with sorted keys. orjson writes non-ASCII
+characters as UTF-8 instead of \\u escapes, and spells some floats
+differently (0.00001 for 1e-05); the values are the same. Anything orjson
+refuses (non-string keys or integers past 64 bits to encode, NaN to parse)
+falls back to the stdlib for that one call, so nothing that worked before
+fails now; but orjson does parse an integer past 64 bits, as a float.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from . import config
+
+orjson = None
+if config.JSON_CODEC != 'json':
+    try:
+        import orjson
+    except ImportError:
+        pass
+
+NAME = 'orjson' if orjson is not None else 'json'
+
+_encode = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SORT_KEYS
+    # Dates and dataclasses go to Flask's `default` (HTTP dates) as before
+    _PROVIDER_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(value):
+        """Compact JSON text with sorted keys."""
+        try:
+            return orjson.dumps(value, option=_OPTIONS).decode()
+        except orjson.JSONEncodeError:
+            return _encode(value)
+
+    def loads(data):
+        """Parse JSON from str or bytes."""
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+else:
+    dumps = _encode
+    loads = json.loads
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding and parsing with the codec above.
+
+    Calls with extra options (e.g. `indent`) are left to the stdlib, as are
+    pretty-printed responses in debug mode.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=_PROVIDER_OPTIONS).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, separators=(',', ':'))
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=_PROVIDER_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
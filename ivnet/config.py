@@ -0,0 +1,102 @@
+"""Runtime settings, read once from the environment."""
+import os
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _data_dir():
+    path = os.environ.get('IVNET_DATA_DIR')
+    if path:
+        return path
+    # The deployment bundle is read-only on Vercel; /tmp is the only writable place
+    if os.environ.get('VERCEL'):
+        return os.path.join(tempfile.gettempdir(), 'ivnet')
+    return os.path.join(ROOT, 'data')
+
+
+DATA_DIR = _data_dir()
+# Vercel's /tmp belongs to one instance and is wiped with it, so fixes stored
+# there are lost on every cold start and never seen by the other instances
+EPHEMERAL = bool(os.environ.get('VERCEL')) and not os.environ.get('IVNET_DATA_DIR')
+
+# Set when several worker processes (e.g. gunicorn -w N) share one data dir
+SHARED = os.environ.get('IVNET_SHARED', '').lower() in ('1', 'true', 'yes')
+
+# Rows per memory-mapped segment file (must be a power of two)
+SEGMENT_ROWS = int(os.environ.get('IVNET_SEGMENT_ROWS', 1 << 16))
+
+# Cell size of the spatial grid index, in degrees (0.01 is roughly 1 km)
+GRID_DEGREES = float(os.environ.get('IVNET_GRID_DEGREES', 0.01))
+
+# Ingest buffering: writer threads spread over this many shard buffers, and a
+# shard holding INGEST_FLUSH_AT records pushes everything pending to the store
+INGEST_SHARDS = int(os.environ.get('IVNET_INGEST_SHARDS', 8))
+INGEST_FLUSH_AT = int(os.environ.get('IVNET_INGEST_FLUSH_AT', 32))
+
+# Write-behind: the background flusher runs at least every INGEST_FLUSH_INTERVAL
+# seconds, and at most INGEST_MAX_PENDING fixes wait in memory. DURABILITY is
+# "enqueue" (acknowledge as soon as a fix is queued) or "flush" (acknowledge
+# once it is on disk). Serverless instances may be frozen or killed between
+# requests, so Vercel defaults to "flush".
+INGEST_FLUSH_INTERVAL = float(os.environ.get('IVNET_FLUSH_INTERVAL_MS', 50)) / 1000
+INGEST_MAX_PENDING = int(os.environ.get('IVNET_MAX_PENDING', 10000))
+DURABILITY = os.environ.get('IVNET_DURABILITY', 'flush' if os.environ.get('VERCEL') else 'enqueue')
+
+# Load shedding: with the queue full (the disk is behind), new fixes are
+# refused with a 503 instead of making the request wait for a flush
+SHED_LOAD = os.environ.get('IVNET_SHED_LOAD', '1').lower() in ('1', 'true', 'yes')
+
+# Retention: keep at most RETAIN_POINTS fixes and/or none older than
+# RETAIN_SECONDS (0 means no limit). A background sweeper drops the oldest
+# fixes a few thousand at a time.
+RETAIN_POINTS = int(os.environ.get('IVNET_RETAIN_POINTS', 0))
+RETAIN_SECONDS = float(os.environ.get('IVNET_RETAIN_SECONDS', 0))
+
+# Ingest limits: bodies over MAX_BODY_BYTES (any request) or MAX_FIX_BYTES
+# (a single fix) are refused with a 413 before they are read, and posted
+# strings are cut to MAX_STRING_LENGTH characters
+MAX_BODY_BYTES = int(os.environ.get('IVNET_MAX_BODY_BYTES', 8 << 20))
+MAX_FIX_BYTES = int(os.environ.get('IVNET_MAX_FIX_BYTES', 16 << 10))
+MAX_STRING_LENGTH = int(os.environ.get('IVNET_MAX_STRING_LENGTH', 512))
+
+# Rate limits on the ingest routes: each session (or client address, for
+# fixes without one) may post RATE_LIMIT fixes per second on average, in
+# bursts of up to RATE_BURST; 0 turns limiting off. Buckets are kept for the
+# RATE_MAX_CLIENTS most recently seen clients.
+RATE_LIMIT = float(os.environ.get('IVNET_RATE_LIMIT', 1))
+RATE_BURST = float(os.environ.get('IVNET_RATE_BURST', 10))
+RATE_MAX_CLIENTS = int(os.environ.get('IVNET_RATE_MAX_CLIENTS', 10000))
+# Every fix also counts against its client address, at RATE_ADDRESS_LIMIT per
+# second in bursts of RATE_ADDRESS_BURST, so a new sessionId per post doesn't
+# buy a fresh bucket. Looser than the per-session limit, since devices behind
+# one NAT share an address; 0 turns it off.
+RATE_ADDRESS_LIMIT = float(os.environ.get('IVNET_RATE_ADDRESS_LIMIT', 20))
+RATE_ADDRESS_BURST = float(os.environ.get('IVNET_RATE_ADDRESS_BURST', 100))
+
+# JSON codec: "auto" uses orjson when it is installed, "json" always the stdlib
+JSON_CODEC = os.environ.get('IVNET_JSON_CODEC', 'auto')
+
+# Structured logs: level for the `ivnet` loggers, and the fraction of
+# per-fix events (one per saved location) that are actually written
+LOG_LEVEL = os.environ.get('IVNET_LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE = float(os.environ.get('IVNET_LOG_SAMPLE', 1.0))
+
+# Live feed (/live): concurrent SSE streams allowed, and how long one stream
+# stays open before the browser is made to reconnect
+LIVE_MAX_CLIENTS = int(os.environ.get('IVNET_LIVE_MAX_CLIENTS', 500))
+LIVE_MAX_SECONDS = float(os.environ.get('IVNET_LIVE_MAX_SECONDS', 300))
+
+# Map clusters (/api/clusters) are kept for zoom levels 0..CLUSTER_MAX_ZOOM;
+# every level costs memory per occupied cell, and 16 is street level
+CLUSTER_MAX_ZOOM = int(os.environ.get('IVNET_CLUSTER_MAX_ZOOM', 16))
+
+# Trajectory thinning at ingest: a session's fix is dropped when it is within
+# THIN_DISTANCE_M (or the fixes' own accuracy radius, if larger) of the last
+# stored one and less than THIN_INTERVAL seconds later. SIMPLIFY_M > 0 also
+# runs Douglas-Peucker with that tolerance over a session when it closes.
+THIN = os.environ.get('IVNET_THIN', '1').lower() in ('1', 'true', 'yes')
+THIN_DISTANCE_M = float(os.environ.get('IVNET_THIN_DISTANCE_M', 10))
+THIN_INTERVAL = float(os.environ.get('IVNET_THIN_INTERVAL_S', 300))
+THIN_MAX_SESSIONS = int(os.environ.get('IVNET_THIN_MAX_SESSIONS', 10000))
+SIMPLIFY_M = float(os.environ.get('IVNET_SIMPLIFY_M', 0))
@@ -0,0 +1,87 @@
+"""Bulk export of stored fixes as CSV, GeoJSON or NDJSON.
+
+Every format is a generator of text chunks encoding a few hundred fixes
+each, read straight from `SegmentStore.scan()`, so an export of any size
+holds only one chunk in memory. `gzip_chunks()` compresses such a stream
+on the fly.
+"""
+import csv
+import io
+import itertools
+import zlib
+
+from .codec import dumps as _encode
+from .records import FIELDS
+
+CHUNK = 256  # fixes encoded per yielded chunk
+GZIP_LEVEL = 6
+
+CSV_COLUMNS = ('id', 'server_timestamp') + FIELDS + ('extra',)
+
+
+def _chunked(fixes):
+    while True:
+        chunk = list(itertools.islice(fixes, CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_chunks(fixes):
+    """One JSON object per line, as /api/locations would return it."""
+    for chunk in _chunked(fixes):
+        yield ''.join(_encode(fix.to_dict()) + '\n' for fix in chunk)
+
+
+def csv_chunks(fixes):
+    """A header row, then one row per fix; other posted fields go in `extra` as JSON."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    for chunk in _chunked(fixes):
+        for fix in chunk:
+            writer.writerow([fix.id, fix.server_timestamp] + [fix.get(name, '') for name in FIELDS] + [fix.extra_json or ''])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # the header of an empty export
+
+
+def _feature(fix):
+    properties = fix.to_dict()
+    latitude = properties.pop('latitude', None)
+    longitude = properties.pop('longitude', None)
+    geometry = None
+    if latitude is not None and longitude is not None:
+        geometry = {'type': 'Point', 'coordinates': [longitude, latitude]}
+    return {'type': 'Feature', 'id': fix.id, 'geometry': geometry, 'properties': properties}
+
+
+def geojson_chunks(fixes):
+    """A FeatureCollection of Points; fixes without coordinates get a null geometry."""
+    yield '{"type":"FeatureCollection","features":['
+    first = True
+    for chunk in _chunked(fixes):
+        body = ','.join(_encode(_feature(fix)) for fix in chunk)
+        yield body if first else ',' + body
+        first = False
+    yield ']}'
+
+
+FORMATS = {
+    # name: (chunk generator, content type, file extension)
+    'csv': (csv_chunks, 'text/csv; charset=utf-8', 'csv'),
+    'geojson': (geojson_chunks, 'application/geo+json', 'geojson'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson', 'ndjson'),
+}
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Gzip a stream of text chunks as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
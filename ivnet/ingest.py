@@ -0,0 +1,302 @@
+"""Thread-safe front door for writing fixes to a SegmentStore.
+
+Ids come from one atomic sequence, but records wait in per-thread shard
+buffers, so concurrent writers only contend on their own shard's lock.
+A background flusher thread moves pending records to the store in id order
+every `flush_interval` seconds, or sooner once a shard holds `flush_at`
+records; each pass is one group commit. Readers call `sync()` to see every
+write acknowledged so far.
+
+`durability` decides when a write is acknowledged: "enqueue" returns as
+soon as the record is buffered (a crash can lose the last interval's
+fixes), "flush" waits until the flusher has written and msynced it, which
+amortizes one fsync over every request that arrived in the meantime.
+Buffers are bounded by `max_pending`; a writer that finds its shard full
+drains it inline, so a slow disk slows writers down instead of growing
+memory. With `shed_load`, writers never drain inline; once `max_pending`
+fixes are queued in all, new ones are refused with QueueFull, so requests
+fail fast instead of stalling behind the disk. `close()` (also run at exit)
+stops the flusher and drains what is left.
+
+When the store is shared between processes, ids come from the store
+itself and are only known once a record is written, so writers can't be
+acknowledged from the queue. Instead each writer queues its records and
+takes the drain lock, and whichever gets it first writes every batch queued
+by then in one append: one flock, and with "flush" one fsync, shared by all
+the requests that arrived meanwhile. The others find theirs already written.
+`max_pending` and `shed_load` apply as above.
+"""
+import atexit
+import itertools
+import threading
+import time
+
+from . import config
+from .logs import get_logger
+
+DURABILITY_MODES = ('enqueue', 'flush')
+
+# A writer waiting for its flush gives up on the flusher after this long and
+# drains inline, so a stuck or failing flusher surfaces as a request error
+# rather than a hang
+_ACK_TIMEOUT = 1.0
+
+log = get_logger('ingest')
+
+
+class QueueFull(RuntimeError):
+    """The write queue is full and load shedding is on; nothing was queued."""
+
+
+class _Batch:
+    """One shared-mode writer's records, waiting for a drain to give them ids."""
+
+    __slots__ = ('records', 'received_us', 'ids', 'error')
+
+    def __init__(self, records, received_us):
+        self.records = records
+        self.received_us = received_us
+        self.ids = None
+        self.error = None
+
+
+class _Shard:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []  # (id, received_us, record)
+
+
+class ShardedIngest:
+    def __init__(self, store, shards=config.INGEST_SHARDS, flush_at=config.INGEST_FLUSH_AT,
+                 max_pending=config.INGEST_MAX_PENDING, flush_interval=config.INGEST_FLUSH_INTERVAL,
+                 durability=config.DURABILITY, shed_load=config.SHED_LOAD):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f'durability must be one of {", ".join(DURABILITY_MODES)}, not {durability!r}')
+        self.store = store
+        self.durability = durability
+        self.shed_load = shed_load
+        self.refused = 0
+        self._shards = [_Shard() for _ in range(shards)]
+        self._flush_at = flush_at
+        self._max_pending = max_pending
+        self._capacity = max(flush_at, max_pending // shards)
+        self._flush_interval = flush_interval
+        self._ids = itertools.count(len(store) + 1)
+        self._drain_lock = threading.Lock()
+        self._local = threading.local()
+        self._assign = itertools.count()
+        self._batches = []  # shared mode: _Batch queue, drained in arrival order
+        self._batches_lock = threading.Lock()
+
+        # Highest id the last drain wrote. Writers in "flush" mode wait on
+        # this; clear() bumps the epoch so they stop waiting for ids that no
+        # longer exist
+        self._flushed = threading.Condition()
+        self._flushed_upto = len(store)
+        self._epoch = 0
+
+        self._wake = threading.Event()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def _shard(self):
+        # Threads are dealt shards round-robin on first use; thread idents
+        # themselves are addresses and would pile onto a few shards
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._assign) % len(self._shards)]
+        return shard
+
+    def append(self, record):
+        """Queue one fix and return its id."""
+        return self.append_many([record])[0]
+
+    def append_many(self, records):
+        """Queue several fixes under one lock and return their ids."""
+        if self.shed_load and not self._closed:
+            self._shed(len(records))
+        if self.store.shared:
+            return self._append_shared(records)
+        self._start_flusher()
+        shard = self._shard()
+        if (not self.shed_load or self._closed) and len(shard.pending) >= self._capacity:
+            # Backpressure: the flusher is behind, so this writer pays for it
+            self.sync()
+        received_us = time.time_ns() // 1000
+        with shard.lock:
+            # Allocating inside the shard lock means a drain, which holds every
+            # shard lock, never sees an id whose record isn't buffered yet
+            ids = [next(self._ids) for _ in records]
+            shard.pending.extend((location_id, received_us, record) for location_id, record in zip(ids, records))
+            full = len(shard.pending) >= self._flush_at
+        if self._closed:
+            self.sync()
+        elif self.durability == 'flush':
+            self._wait_flushed(ids[-1])
+        elif full:
+            self._wake.set()
+        return ids
+
+    def _shed(self, count):
+        pending = self.pending()
+        if pending >= self._max_pending:
+            # Load shedding: writing is behind, so refuse rather than queue more
+            self._wake.set()
+            self.refused += count
+            raise QueueFull(f'{pending} fixes are waiting to be written')
+
+    def _append_shared(self, records):
+        batch = _Batch(records, time.time_ns() // 1000)
+        with self._batches_lock:
+            self._batches.append(batch)
+        with self._drain_lock:
+            # A drain that ran while this writer waited for the lock may have written it
+            if batch.ids is None and batch.error is None:
+                self._drain_batches()
+        if batch.error is not None:
+            raise batch.error
+        return batch.ids
+
+    def _drain_batches(self):
+        # Called with the drain lock held
+        with self._batches_lock:
+            batches, self._batches = self._batches, []
+        if not batches:
+            return
+        records = [record for batch in batches for record in batch.records]
+        received_us = [batch.received_us for batch in batches for _ in batch.records]
+        try:
+            ids = self.store.append_many(records, received_us)
+            if self.durability == 'flush':
+                self.store.flush()
+        except BaseException as error:
+            # Every writer in the group gets the failure; nothing of theirs was acknowledged
+            for batch in batches:
+                batch.error = error
+            return
+        start = 0
+        for batch in batches:
+            batch.ids = ids[start:start + len(batch.records)]
+            start += len(batch.records)
+
+    def _wait_flushed(self, location_id):
+        self._wake.set()
+        deadline = time.monotonic() + _ACK_TIMEOUT
+        with self._flushed:
+            epoch = self._epoch
+            while self._flushed_upto < location_id and self._epoch == epoch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._flushed.wait(remaining)
+            done = self._flushed_upto >= location_id or self._epoch != epoch
+        if not done:
+            self.sync()
+
+    def _start_flusher(self):
+        if self._flusher is not None or self._closed:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name='ivnet-ingest-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._closed:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception:
+                log.error('flush_failed', exc_info=True)
+
+    def _take_pending(self):
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            pending = []
+            for shard in self._shards:
+                pending.extend(shard.pending)
+                shard.pending = []
+        finally:
+            for shard in self._shards:
+                shard.lock.release()
+        return pending
+
+    def sync(self, wait=True):
+        """Write every pending fix to the store, in id order.
+
+        With `wait=False` this returns at once if another thread is already
+        draining (it will pick these records up, or the next drain will).
+        Also picks up fixes other processes wrote to a shared store.
+        """
+        self.store.refresh()
+        if not self._drain_lock.acquire(blocking=wait):
+            return
+        try:
+            if self.store.shared:
+                self._drain_batches()
+                return
+            pending = self._take_pending()
+            if not pending:
+                return
+            pending.sort(key=lambda item: item[0])
+            ids = self.store.append_many([record for _, _, record in pending], [at for _, at, _ in pending])
+            if ids[0] != pending[0][0] or ids[-1] != pending[-1][0]:
+                raise RuntimeError(f'ingest ids {pending[0][0]}..{pending[-1][0]} landed as {ids[0]}..{ids[-1]}')
+            if self.durability == 'flush':
+                self.store.flush()
+            with self._flushed:
+                self._flushed_upto = ids[-1]
+                self._flushed.notify_all()
+        finally:
+            self._drain_lock.release()
+
+    def pending(self):
+        return sum(len(shard.pending) for shard in self._shards) + sum(len(batch.records) for batch in self._batches)
+
+    def __len__(self):
+        """Fixes stored or queued (a snapshot; writers may be adding more)."""
+        return len(self.store) + self.pending()
+
+    @property
+    def live(self):
+        """Like `store.live`, counting queued fixes too: what a read returns once they're written."""
+        return self.store.live + self.pending()
+
+    def clear(self):
+        """Drop stored and queued fixes; ids start again from 1."""
+        with self._drain_lock:
+            for shard in self._shards:
+                shard.lock.acquire()
+            try:
+                for shard in self._shards:
+                    shard.pending = []
+                self.store.clear()
+                self._ids = itertools.count(len(self.store) + 1)
+                with self._flushed:
+                    self._flushed_upto = len(self.store)
+                    self._epoch += 1
+                    self._flushed.notify_all()
+            finally:
+                for shard in self._shards:
+                    shard.lock.release()
+
+    def close(self):
+        """Stop the flusher and write out everything still queued.
+
+        Writes after this still work; they are drained inline.
+        """
+        self._closed = True
+        self._wake.set()
+        with self._flushed:
+            self._flushed.notify_all()
+        flusher = self._flusher
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join()
+        self.sync()
+        self.store.flush()
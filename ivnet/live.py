@@ -0,0 +1,146 @@
+"""Server-Sent Events feed of newly stored fixes.
+
+One `Broadcaster` per store subscribes to its appends and encodes each new
+fix once, as an SSE message in a fixed-size ring. Every connected client
+streams from that ring with nothing but its own cursor, so a fix costs the
+same however many dashboards are watching: one encode and one wake-up.
+
+A client that falls more than a ring behind is not buffered for. It skips
+ahead, gets a single `gap` event saying how many fixes it missed, and
+carries on from the oldest fix still in the ring. Each stream sends at most
+one chunk per COALESCE seconds holding everything that arrived meanwhile,
+so viewer wake-ups are bounded by the number of viewers, not by the ingest
+rate. After a clear clients get a `reset` event.
+"""
+import json
+import threading
+import time
+
+from . import config
+from .views import encode
+
+RING_SIZE = 4096  # several COALESCE windows of fixes at a busy ingest rate
+KEEPALIVE = 15.0  # seconds between comment lines on an idle stream
+SHARED_POLL = 1.0  # how often a waiting client looks for other processes' writes
+RETRY_MS = 2000
+COALESCE = 0.1  # a stream sends at most one chunk per this many seconds
+LINGER = 30.0  # keep filling the ring this long after the last client leaves, for reconnects
+
+
+class Broadcaster:
+    """Fan-out of newly appended fixes to any number of SSE streams."""
+
+    def __init__(self, store, size=RING_SIZE, max_clients=config.LIVE_MAX_CLIENTS,
+                 max_seconds=config.LIVE_MAX_SECONDS):
+        self._store = store
+        self._size = size
+        self._ring = [None] * size
+        self.max_clients = max_clients
+        self._max_seconds = max_seconds
+        self._cond = threading.Condition()
+        self.clients = 0
+        self._idle_since = float('-inf')
+        self._epoch = 0
+        self._generation = store.generation
+        self._upto = len(store)
+        self._first = self._upto + 1  # oldest id whose message is in the ring
+        # Viewers woken by the same update usually want the same span of the
+        # ring, so the last joined span is kept for the next one to ask
+        self._span = (None, None)
+        store.subscribe(self.update)
+
+    def update(self):
+        """Encode fixes appended since the last call and wake the streams."""
+        with self._cond:
+            if self._generation != self._store.generation:
+                self._generation = self._store.generation
+                self._epoch += 1
+                self._upto = 0
+                self._first = 1
+            upto = len(self._store)
+            if upto <= self._upto:
+                self._cond.notify_all()
+                return
+            if not self.clients and time.monotonic() - self._idle_since > LINGER:
+                # Nobody is listening: skip the encoding, remember the ring is empty
+                self._upto = upto
+                self._first = upto + 1
+                return
+            start = max(self._upto, upto - self._size)
+            ring, size = self._ring, self._size
+            # Deleted and expired rows aren't scanned; their slots send nothing
+            for location_id in range(start + 1, upto + 1):
+                ring[location_id % size] = ''
+            for fix in self._store.scan(after_id=start):
+                if fix.id > upto:
+                    break
+                ring[fix.id % size] = f'id: {fix.id}\ndata: {encode(fix)}\n\n'
+            self._first = max(self._first, upto - size + 1)
+            self._upto = upto
+            self._cond.notify_all()
+
+    def connect(self, after_id=None):
+        """Return an SSE stream of fixes with id > `after_id`, or None if the feed is full.
+
+        Without `after_id` the stream starts with the next fix stored.
+        """
+        with self._cond:
+            if self.clients >= self.max_clients:
+                return None
+            if after_id is None or after_id > self._upto:
+                after_id = self._upto
+            epoch = self._epoch
+        return self._stream(epoch, after_id)
+
+    def _collect(self, epoch, cursor):
+        # Called with the condition held
+        if self._epoch != epoch:
+            return 'event: reset\ndata: {}\n\n', self._epoch, 0
+        if cursor >= self._upto:
+            return None, epoch, cursor
+        parts = []
+        if cursor < self._first - 1:
+            missed = self._first - 1 - cursor
+            cursor = self._first - 1
+            parts.append(f'id: {cursor}\nevent: gap\ndata: {json.dumps({"missed": missed})}\n\n')
+        key, body = self._span
+        if key != (epoch, cursor, self._upto):
+            ring, size = self._ring, self._size
+            body = ''.join([ring[location_id % size] for location_id in range(cursor + 1, self._upto + 1)])
+            self._span = ((epoch, cursor, self._upto), body)
+        parts.append(body)
+        return ''.join(parts), epoch, self._upto
+
+    def _stream(self, epoch, cursor):
+        # Browsers reconnect on their own (sending Last-Event-ID), so streams
+        # are closed after a while rather than pinning a worker forever
+        deadline = time.monotonic() + self._max_seconds
+        poll = SHARED_POLL if self._store.shared else KEEPALIVE
+        # Counted from the first read, since a generator that is never
+        # started never runs its finally block either
+        with self._cond:
+            self.clients += 1
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            idle_since = time.monotonic()
+            while time.monotonic() < deadline:
+                with self._cond:
+                    chunk, epoch, cursor = self._collect(epoch, cursor)
+                    if chunk is None:
+                        self._cond.wait(poll)
+                        chunk, epoch, cursor = self._collect(epoch, cursor)
+                if chunk is not None:
+                    idle_since = time.monotonic()
+                    yield chunk
+                    time.sleep(COALESCE)
+                    continue
+                if self._store.shared:
+                    self._store.refresh()
+                if time.monotonic() - idle_since >= KEEPALIVE:
+                    idle_since = time.monotonic()
+                    yield ': keepalive\n\n'
+        finally:
+            with self._cond:
+                self.clients -= 1
+                if not self.clients:
+                    self._idle_since = time.monotonic()
@@ -0,0 +1,155 @@
+"""Structured JSON-lines logging that stays off the request thread.
+
+Request code calls `get_logger(name)` and logs named events with keyword
+fields. Logging an event only appends a tuple to a bounded in-memory queue;
+a writer thread wakes every LOG_INTERVAL seconds (or as soon as the queue is
+half full), formats what has queued up as JSON lines and writes them to
+stdout (which is what Vercel collects) in one call. If the queue is full the
+event is dropped and counted rather than blocking the request.
+
+The stdlib `logging` machinery is not used on purpose: building a
+LogRecord alone costs more than the print() calls this replaces.
+
+Per-fix events go through `EventLogger.sampled()`, which keeps one in every
+1/IVNET_LOG_SAMPLE of them and skips the rest before anything is queued.
+"""
+import atexit
+import collections
+import datetime
+import itertools
+import json
+import sys
+import threading
+import time
+import traceback
+
+from . import config
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+QUEUE_SIZE = 10000
+LOG_INTERVAL = 0.05
+
+_queue = collections.deque()  # (created, level, logger, event, fields, exception)
+_dropped = 0
+_setup_lock = threading.Lock()
+_stream = None
+_stop = None
+_wake = threading.Event()
+_writer = None
+
+
+def format_entry(entry):
+    """One compact JSON object: ts, level, logger, event, then the fields."""
+    created, level, name, event, fields, exception = entry
+    line = {
+        'ts': datetime.datetime.fromtimestamp(created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+        'level': level,
+        'logger': name,
+        'event': event,
+    }
+    line.update(fields)
+    if exception:
+        line['exception'] = exception
+    return json.dumps(line, default=str, separators=(',', ':'))
+
+
+def _drain():
+    lines = []
+    while True:
+        try:
+            entry = _queue.popleft()
+        except IndexError:
+            break
+        lines.append(format_entry(entry))
+    if lines:
+        _stream.write('\n'.join(lines) + '\n')
+        _stream.flush()
+
+
+def _run(stop):
+    while not stop.is_set():
+        _wake.wait(LOG_INTERVAL)
+        _wake.clear()
+        _drain()
+
+
+def setup(stream=None):
+    """Start the writer thread (once), writing to `stream` (default stdout)."""
+    global _stream, _stop, _writer
+    with _setup_lock:
+        if _writer is not None:
+            return
+        _stream = stream or sys.stdout
+        _stop = threading.Event()
+        _writer = threading.Thread(target=_run, args=(_stop,), name='ivnet-log-writer', daemon=True)
+        _writer.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Stop the writer thread and write out everything still queued."""
+    global _writer
+    with _setup_lock:
+        if _writer is None:
+            return
+        _stop.set()
+        _wake.set()
+        _writer.join()
+        _writer = None
+        _drain()
+
+
+def dropped():
+    """Events lost because the queue was full."""
+    return _dropped
+
+
+def _put(entry):
+    global _dropped
+    size = len(_queue)
+    if size >= QUEUE_SIZE:
+        _dropped += 1
+        return
+    _queue.append(entry)
+    if size == QUEUE_SIZE // 2:
+        _wake.set()
+
+
+class EventLogger:
+    """Logs named events with keyword fields for one component."""
+
+    def __init__(self, name, level=config.LOG_LEVEL, sample=config.LOG_SAMPLE):
+        self.name = name
+        self.level = LEVELS[level.lower()]
+        # Keep every Nth sampled event; 0 turns them off entirely
+        self._every = max(1, round(1 / sample)) if sample > 0 else 0
+        self._seen = itertools.count()
+
+    def _log(self, level, event, fields, exc_info=False):
+        if LEVELS[level] < self.level:
+            return
+        # Tracebacks have to be rendered now, while the exception is live
+        exception = traceback.format_exc().rstrip() if exc_info else None
+        _put((time.time(), level, self.name, event, fields, exception))
+
+    def info(self, event, **fields):
+        self._log('info', event, fields)
+
+    def warning(self, event, **fields):
+        self._log('warning', event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log('error', event, fields, exc_info)
+
+    def sampled(self, event, **fields):
+        """Log a high-volume event at info level, subject to IVNET_LOG_SAMPLE."""
+        if not self._every or next(self._seen) % self._every:
+            return
+        if self._every > 1:
+            fields['sample_every'] = self._every
+        self._log('info', event, fields)
+
+
+def get_logger(name):
+    setup()
+    return EventLogger('ivnet.' + name)
@@ -0,0 +1,209 @@
+"""Per-route request metrics, exposed in the Prometheus text format.
+
+`RequestMetrics.instrument(app)` adds a before_request hook that stamps the
+start time and an after_request hook that records, per route rule and
+method: requests by status, a latency histogram, and request and response
+bytes. Like ShardedIngest, threads are dealt a few shards round-robin and
+only ever lock their own, so recording costs an uncontended lock and a
+handful of additions; `exposition()` merges the shards when /metrics is
+scraped.
+
+Latency is the time until the view returned its response. A streamed
+body's bytes are counted as it is sent, once the stream ends.
+"""
+import bisect
+import itertools
+import os
+import resource
+import threading
+import time
+
+from flask import request
+
+METRICS_SHARDS = 8
+# Seconds; the last bucket (+Inf) is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = '<unmatched>'  # route label of requests no rule matched (404s)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Route:
+    __slots__ = ('buckets', 'seconds', 'statuses', 'request_bytes', 'response_bytes')
+
+    def __init__(self, buckets):
+        self.buckets = [0] * (buckets + 1)
+        self.seconds = 0.0
+        self.statuses = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class _Shard:
+    __slots__ = ('lock', 'routes')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}  # (rule, method) -> _Route
+
+
+class RequestMetrics:
+    def __init__(self, shards=METRICS_SHARDS, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._shards = [_Shard() for _ in range(shards)]
+        self._local = threading.local()
+        self._assign = itertools.count()
+
+    def instrument(self, app):
+        """Time every request of `app`; call before registering other hooks so the timing covers them."""
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._assign) % len(self._shards)]
+        return shard
+
+    def _route(self, shard, key):
+        route = shard.routes.get(key)
+        if route is None:
+            route = shard.routes[key] = _Route(len(self.buckets))
+        return route
+
+    # The hot path: each `request.<attr>` through Flask's proxy costs about
+    # as much as the rest of the bookkeeping, so the request object is
+    # resolved once, the start time rides on the thread-local that already
+    # holds the shard, and sizes are read without parsing headers
+
+    def _start(self):
+        self._local.started = time.perf_counter()
+
+    def _finish(self, response):
+        elapsed = time.perf_counter() - getattr(self._local, 'started', 0.0)
+        current = request._get_current_object()
+        rule = current.url_rule
+        key = (UNMATCHED if rule is None else rule.rule, current.method)
+        length = current.environ.get('CONTENT_LENGTH')
+        received = int(length) if length and length.isdigit() else 0
+        if not response.is_streamed:
+            sent = sum(map(len, response.response))
+        else:
+            sent = response.content_length
+            if sent is None:
+                response.response = self._counted(key, response.iter_encoded(), response.response)
+                sent = 0
+        status = response.status_code
+        shard = self._shard()
+        with shard.lock:
+            route = shard.routes.get(key) or self._route(shard, key)
+            route.buckets[bisect.bisect_left(self.buckets, elapsed)] += 1
+            route.seconds += elapsed
+            route.statuses[status] = route.statuses.get(status, 0) + 1
+            route.request_bytes += received
+            route.response_bytes += sent
+        return response
+
+    def _counted(self, key, chunks, body):
+        sent = 0
+        try:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            # Closing the original body runs its cleanup (e.g. a live stream's)
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+            shard = self._shard()
+            with shard.lock:
+                self._route(shard, key).response_bytes += sent
+
+    def _merged(self):
+        merged = {}
+        for shard in self._shards:
+            with shard.lock:
+                for key, route in shard.routes.items():
+                    total = merged.get(key)
+                    if total is None:
+                        total = merged[key] = _Route(len(self.buckets))
+                    total.buckets = [a + b for a, b in zip(total.buckets, route.buckets)]
+                    total.seconds += route.seconds
+                    for status, count in route.statuses.items():
+                        total.statuses[status] = total.statuses.get(status, 0) + count
+                    total.request_bytes += route.request_bytes
+                    total.response_bytes += route.response_bytes
+        return sorted(merged.items())
+
+    def families(self):
+        """The request metric families, for `exposition()`."""
+        requests, durations, received, sent = [], [], [], []
+        for (rule, method), route in self._merged():
+            labels = {'route': rule, 'method': method}
+            for status, count in sorted(route.statuses.items()):
+                requests.append((dict(labels, status=str(status)), count))
+            durations.append((labels, (self.buckets, route.buckets, route.seconds)))
+            received.append((labels, route.request_bytes))
+            sent.append((labels, route.response_bytes))
+        return [
+            ('ivnet_http_requests_total', 'counter', 'Requests handled, by route, method and status.', requests),
+            ('ivnet_http_request_duration_seconds', 'histogram', 'Time until the view returned its response.', durations),
+            ('ivnet_http_request_bytes_total', 'counter', 'Request body bytes received.', received),
+            ('ivnet_http_response_bytes_total', 'counter', 'Response body bytes sent.', sent),
+        ]
+
+
+def process_families():
+    """Resident memory (current and peak) and CPU time of this process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    families = [
+        ('process_cpu_seconds_total', 'counter', 'User and system CPU time spent.', usage.ru_utime + usage.ru_stime),
+        # ru_maxrss is in kilobytes on Linux
+        ('process_resident_memory_max_bytes', 'gauge', 'Peak resident memory.', usage.ru_maxrss * 1024),
+    ]
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return families
+    families.insert(1, ('process_resident_memory_bytes', 'gauge', 'Resident memory.', pages * os.sysconf('SC_PAGE_SIZE')))
+    return families
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def exposition(families):
+    """Render `(name, type, help, value)` families as Prometheus text.
+
+    `value` is a number, or a list of `(labels, number)`; for a histogram
+    the number is `(bounds, bucket counts, sum)` with one count past the
+    last bound.
+    """
+    lines = []
+    for name, kind, help_text, value in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        samples = value if isinstance(value, list) else [({}, value)]
+        for labels, number in samples:
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(number)}')
+                continue
+            bounds, counts, total = number
+            cumulative = 0
+            for bound, count in zip(bounds + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=_number(float(bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,64 @@
+"""Query-string parsing shared by the read endpoints."""
+import datetime
+import math
+
+
+class QueryError(ValueError):
+    """A query parameter is missing or malformed; reported to the client as a 400."""
+
+
+def get_int(args, name, default=None, minimum=0, maximum=None):
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise QueryError(f'{name} must be an integer') from None
+    if number < minimum:
+        raise QueryError(f'{name} must be >= {minimum}')
+    return number if maximum is None else min(number, maximum)
+
+
+def get_float(args, name, default=None, minimum=None, maximum=None):
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise QueryError(f'{name} must be a number') from None
+    if not math.isfinite(number) or minimum is not None and number < minimum or maximum is not None and number > maximum:
+        if minimum is not None and maximum is not None:
+            raise QueryError(f'{name} must be between {minimum} and {maximum}')
+        if minimum is not None:
+            raise QueryError(f'{name} must be >= {minimum}')
+        if maximum is not None:
+            raise QueryError(f'{name} must be <= {maximum}')
+        raise QueryError(f'{name} must be a finite number')
+    return number
+
+
+def get_bool(args, name):
+    return args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def get_time(args, name):
+    """Parse epoch seconds or an ISO-8601 timestamp into epoch microseconds."""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        if not math.isfinite(seconds):
+            raise QueryError(f'{name} must be a finite number of epoch seconds')
+        return round(seconds * 1000000)
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise QueryError(f'{name} must be epoch seconds or an ISO-8601 timestamp') from None
+    # Naive times are server-local, matching how server_timestamp is rendered
+    return round(moment.timestamp() * 1000000)
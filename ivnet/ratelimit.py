@@ -0,0 +1,146 @@
+"""Per-client token buckets for the ingest routes.
+
+Each client (a session id, or the client's address for requests without
+one) has a bucket of up to `burst` tokens that refills at `rate` per
+second, and each fix posted takes a token. Each fix also takes a token
+from a looser bucket for the address it came from, so a client that makes
+up a new sessionId for every post is still held to the address's rate, and
+can't push real sessions out of the table faster than that either. Buckets
+are refilled lazily from the time since they were last touched, so a check
+is O(1), and they live in an OrderedDict in least-recently-seen order, so
+once `max_clients` are tracked the stalest one is evicted in O(1) too. An
+evicted client starts again with a full bucket, which only ever errs on the
+side of letting a fix in.
+"""
+import collections
+import math
+import threading
+import time
+
+from werkzeug.exceptions import TooManyRequests
+
+from . import config
+
+
+def client_address(environ):
+    """The address a request came from, as the proxy reported it."""
+    return environ.get('HTTP_X_FORWARDED_FOR', environ.get('REMOTE_ADDR', 'Unknown'))
+
+
+def client_key(environ, session_id=None):
+    """The bucket a request counts against: the session posting, else the sender's address."""
+    if session_id:
+        return ('session', session_id)
+    return ('address', client_address(environ))
+
+
+class RateLimiter:
+    def __init__(self, rate=config.RATE_LIMIT, burst=config.RATE_BURST, max_clients=config.RATE_MAX_CLIENTS,
+                 address_rate=config.RATE_ADDRESS_LIMIT, address_burst=config.RATE_ADDRESS_BURST,
+                 clock=time.monotonic):
+        self.enabled = rate > 0
+        self.rate = rate
+        self.burst = burst
+        self.address_rate = address_rate
+        self.address_burst = address_burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = collections.OrderedDict()  # key -> (tokens, last refill); least recently seen first
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def _tokens(self, key, rate, burst, now):
+        # Returns (tokens, tracked?); called with the lock held
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return burst, False
+        self._buckets.move_to_end(key)
+        return min(burst, bucket[0] + (now - bucket[1]) * rate), True
+
+    def _take(self, key, tokens, tracked, now):
+        if not tracked and len(self._buckets) >= self.max_clients:
+            self._buckets.popitem(last=False)
+        self._buckets[key] = (tokens, now)
+
+    def acquire(self, key, cost=1, address=None):
+        """Take `cost` tokens from `key`'s bucket; returns 0 if it had them, else the seconds until it will.
+
+        With `address`, the tokens are also taken from that address's looser
+        bucket, and only if both have them.
+        """
+        if not self.enabled:
+            return 0.0
+        now = self._clock()
+        capped = address is not None and self.address_rate > 0
+        with self._lock:
+            tokens, tracked = self._tokens(key, self.rate, self.burst, now)
+            wait = (cost - tokens) / self.rate
+            if capped:
+                address_key = ('per-address', address)
+                address_tokens, address_tracked = self._tokens(address_key, self.address_rate, self.address_burst, now)
+                wait = max(wait, (cost - address_tokens) / self.address_rate)
+            if wait <= 0:
+                self._take(key, tokens - cost, tracked, now)
+                if capped:
+                    self._take(address_key, address_tokens - cost, address_tracked, now)
+                self.allowed += 1
+                return 0.0
+            # A refused client that had no bucket still has a full one: nothing to remember
+            if tracked:
+                self._buckets[key] = (tokens, now)
+            if capped and address_tracked:
+                self._buckets[address_key] = (address_tokens, now)
+            self.limited += 1
+        return wait
+
+    def check(self, key, cost=1, address=None):
+        """Like `acquire`, but raise a 429 with Retry-After when `key` (or `address`) is over its rate."""
+        wait = self.acquire(key, cost, address)
+        if wait:
+            retry_after = math.ceil(wait)
+            raise TooManyRequests(f'Rate limit exceeded, retry in {retry_after}s', retry_after=retry_after)
+
+    def check_client(self, environ, session_id=None):
+        """`check` one posted fix against its session's bucket and its address's."""
+        self.check(client_key(environ, session_id), address=client_address(environ))
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'address_rate': self.address_rate,
+            'address_burst': self.address_burst,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'clients': len(self._buckets),
+        }
+
+
+class BatchCharge:
+    """Validates a batch's records one at a time, charging each to its own client.
+
+    A record over its client's rate fails in the batch results like any
+    invalid one. If that leaves nothing saved, `check()` turns the batch
+    into a 429 with the longest wait as Retry-After.
+    """
+
+    def __init__(self, limiter, normalize, environ):
+        self.limiter = limiter
+        self.normalize = normalize
+        self.environ = environ
+        self.wait = 0.0
+
+    def __call__(self, record):
+        fix = self.normalize(record)
+        wait = self.limiter.acquire(client_key(self.environ, fix.get('sessionId')),
+                                    address=client_address(self.environ))
+        if wait:
+            self.wait = max(self.wait, wait)
+            raise ValueError(f'Rate limit exceeded, retry in {math.ceil(wait)}s')
+        return fix
+
+    def check(self, saved):
+        if self.wait and not saved:
+            retry_after = math.ceil(self.wait)
+            raise TooManyRequests(f'Rate limit exceeded, retry in {retry_after}s', retry_after=retry_after)
@@ -0,0 +1,72 @@
+"""Typed in-memory form of a stored fix."""
+import datetime
+
+from .codec import loads
+
+FLOAT_FIELDS = ('latitude', 'longitude', 'accuracy', 'altitude', 'timestamp')
+STRING_FIELDS = ('userAgent', 'platform', 'language', 'sessionId', 'protocol', 'host', 'ip_address')
+FIELDS = FLOAT_FIELDS + STRING_FIELDS
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+_MISSING = object()
+
+
+def ms_to_iso(ms):
+    """Format epoch milliseconds the way JS `Date.toISOString()` does."""
+    moment = EPOCH + ms * MILLISECOND
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (moment.microsecond // 1000)
+
+
+def us_to_iso(us):
+    """Format epoch microseconds as a local `datetime.isoformat()` string."""
+    seconds, micros = divmod(us, 1000000)
+    return datetime.datetime.fromtimestamp(seconds).replace(microsecond=micros).isoformat()
+
+
+class Fix:
+    """One location fix decoded from the store.
+
+    Known fields live in slots (numbers, and strings shared with the store's
+    dictionary); a field the client never sent is simply an unset slot.
+    Anything else the client posted stays as its compact JSON text until
+    asked for.
+    """
+
+    __slots__ = FIELDS + ('id', 'server_us', 'extra_json')
+
+    def __init__(self, location_id, server_us, extra_json=None):
+        self.id = location_id
+        self.server_us = server_us
+        self.extra_json = extra_json
+
+    @property
+    def server_timestamp(self):
+        return us_to_iso(self.server_us)
+
+    @property
+    def extra(self):
+        return loads(self.extra_json) if self.extra_json else {}
+
+    def get(self, key, default=None):
+        """Dict-style lookup, so templates written against the raw dicts keep working."""
+        if key == 'id':
+            return self.id
+        if key == 'server_timestamp':
+            return self.server_timestamp
+        value = getattr(self, key, _MISSING) if key in FIELDS else _MISSING
+        if value is _MISSING:
+            return self.extra.get(key, default) if self.extra_json else default
+        return value
+
+    def to_dict(self):
+        """The JSON object for this fix: what the client posted plus `id` and `server_timestamp`."""
+        record = self.extra
+        for name in FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                record[name] = value
+        record['id'] = self.id
+        record['server_timestamp'] = self.server_timestamp
+        return record
@@ -0,0 +1,88 @@
+"""Background retention sweeper for a SegmentStore.
+
+`Sweeper` keeps the store within RETAIN_POINTS fixes and/or RETAIN_SECONDS
+of age. Each pass expires at most SWEEP_BATCH of the oldest fixes (moving
+the store's first-retained-row pointer, plus whatever the derived indexes
+do when notified), so one pass never holds up ingest for long; a sweeper
+that is behind runs its next pass right away instead of waiting for the
+interval. Every pass also lets the store reclaim the segments and cleared
+generations whose grace period has run out, which is what actually frees
+their memory and disk.
+"""
+import atexit
+import threading
+import time
+
+from . import config
+from .logs import get_logger
+
+SWEEP_INTERVAL = 1.0  # seconds between passes when nothing is due
+SWEEP_BATCH = 256  # fixes expired per pass at most; each pass holds the indexes' locks
+
+log = get_logger('retention')
+
+
+class Sweeper:
+    """Expires the oldest fixes past the retention limits, a batch at a time."""
+
+    def __init__(self, store, max_points=config.RETAIN_POINTS, max_seconds=config.RETAIN_SECONDS,
+                 batch=SWEEP_BATCH, interval=SWEEP_INTERVAL):
+        self.store = store
+        self.max_points = max_points
+        self.max_seconds = max_seconds
+        self.batch = batch
+        self.interval = interval
+        self.expired = 0
+        self.reclaimed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ivnet-retention', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def due(self):
+        """The highest id the limits say should go now (0 if none)."""
+        store = self.store
+        upto = 0
+        if self.max_points:
+            upto = len(store) - self.max_points
+        if self.max_seconds:
+            cutoff = time.time_ns() // 1000 - round(self.max_seconds * 1000000)
+            # The first retained row at or after the cutoff; everything before it is too old
+            upto = max(upto, store.time_range(since=cutoff)[0])
+        return upto
+
+    def sweep(self):
+        """Run one pass; returns how many fixes it expired."""
+        expired = 0
+        upto = min(self.due(), self.store.first_id - 1 + self.batch)
+        if upto >= self.store.first_id:
+            expired = self.store.expire(upto)
+            self.expired += expired
+        self.reclaimed += self.store.reclaim()
+        return expired
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                expired = self.sweep()
+            except Exception:
+                log.error('sweep_failed', exc_info=True)
+                expired = 0
+            # Behind: go again at once; the GIL switch interval keeps request
+            # threads running in between passes
+            if expired < self.batch:
+                self._stop.wait(self.interval)
+
+    def stats(self):
+        return {
+            'max_points': self.max_points,
+            'max_seconds': self.max_seconds,
+            'expired': self.expired,
+            'reclaimed': self.reclaimed,
+            'first_id': self.store.first_id,
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,140 @@
+"""Validation and normalization of posted fixes.
+
+`Schema.normalize()` checks a posted object against the fields the store
+has columns for, plus the few other fields the tracker pages send
+(`EXTRA_FIELDS`), and returns a new dict with only those: numbers as
+posted, strings cut to `max_string` characters. Anything else is dropped.
+A wrong type or an out-of-range coordinate raises SchemaError, which the
+apps report as a 400 (in a batch, as that record's error).
+
+The checks are built once per field, so normalizing a fix costs one dict
+lookup and one call per posted field. Body sizes are bounded before any
+of this runs: Flask's MAX_CONTENT_LENGTH for every request, and
+`check_length()` for the single-fix endpoints.
+"""
+import math
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from . import config
+from .records import FLOAT_FIELDS, STRING_FIELDS
+
+# Other fields the tracker pages post, kept as the fix's extras; the rest is dropped
+EXTRA_FIELDS = {
+    'event': str,
+    'browser': str,
+    'screen': str,
+    'timezone': str,
+    'ipAddress': str,
+    'cookieEnabled': bool,
+    'onLine': bool,
+    'colorDepth': float,
+}
+
+# Inclusive bounds of the float fields that have them
+RANGES = {
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0),
+    'accuracy': (0.0, math.inf),
+}
+
+_NUMBERS = (int, float)  # exact types, so booleans don't pass as numbers
+
+
+class SchemaError(ValueError):
+    """A posted fix has a field of the wrong type or out of range."""
+
+
+def _number(name, low=-math.inf, high=math.inf):
+    if low == -math.inf and high == math.inf:
+        message = f'{name} must be a finite number'
+    elif high == math.inf:
+        message = f'{name} must be a number >= {low:g}'
+    else:
+        message = f'{name} must be a number between {low:g} and {high:g}'
+
+    def check(value):
+        if value is None:
+            return None
+        if type(value) in _NUMBERS:
+            try:
+                number = float(value)
+            except OverflowError:
+                raise SchemaError(message) from None
+            if low <= number <= high and math.isfinite(number):
+                return value
+        raise SchemaError(message)
+    return check
+
+
+def _string(name, max_length):
+    def check(value):
+        if value is None or type(value) is str and len(value) <= max_length:
+            return value
+        if type(value) is str:
+            return value[:max_length]
+        raise SchemaError(f'{name} must be a string')
+    return check
+
+
+def _timestamp(name, max_length):
+    # Epoch milliseconds, or an ISO string (the store keeps toISOString() ones typed)
+    number, string = _number(name), _string(name, max_length)
+
+    def check(value):
+        if type(value) is str:
+            return string(value)
+        try:
+            return number(value)
+        except SchemaError:
+            raise SchemaError(f'{name} must be a number or a string') from None
+    return check
+
+
+def _boolean(name):
+    def check(value):
+        if value is None or type(value) is bool:
+            return value
+        raise SchemaError(f'{name} must be true or false')
+    return check
+
+
+class Schema:
+    def __init__(self, max_string=config.MAX_STRING_LENGTH, extra_fields=EXTRA_FIELDS):
+        self.max_string = max_string
+        checks = {}
+        for name in FLOAT_FIELDS:
+            checks[name] = _number(name, *RANGES.get(name, ()))
+        for name in STRING_FIELDS:
+            checks[name] = _string(name, max_string)
+        checks['timestamp'] = _timestamp('timestamp', max_string)
+        for name, kind in extra_fields.items():
+            if kind is bool:
+                checks[name] = _boolean(name)
+            elif kind is float:
+                checks[name] = _number(name)
+            else:
+                checks[name] = _string(name, max_string)
+        self._checks = checks
+
+    def normalize(self, record):
+        """Return the known fields of `record`, checked and with long strings cut."""
+        if not isinstance(record, dict):
+            raise SchemaError('Record must be a JSON object')
+        checks = self._checks
+        fix = {}
+        for key, value in record.items():
+            check = checks.get(key)
+            if check is not None:
+                fix[key] = check(value)
+        if ('latitude' in fix) != ('longitude' in fix):
+            raise SchemaError('latitude and longitude must be sent together')
+        if not fix:
+            raise SchemaError('No known fields received')
+        return fix
+
+
+def check_length(content_length, limit=config.MAX_FIX_BYTES):
+    """Refuse a body declared larger than `limit` bytes, before it is read."""
+    if content_length is not None and content_length > limit:
+        raise RequestEntityTooLarge(f'Request body is larger than {limit} bytes')
@@ -0,0 +1,127 @@
+"""Per-session summaries kept current as fixes are stored.
+
+Every fix the tracker pages post carries a `sessionId`. `SessionIndex`
+folds each newly stored fix into its session's running totals (first and
+last seen, the last fix, how many fixes, distance covered, top speed), so
+listing sessions costs O(sessions) and looking one up costs O(1), however
+long the history.
+
+First and last seen are server times, since client clocks can be off.
+Speed between two fixes uses the client timestamps when both have one (a
+batch uploaded after going offline arrives all at once) and the server
+times otherwise. Distance and speed only use fixes with coordinates.
+Totals are not reduced when fixes are deleted later; `last_id` then may
+name a fix that is gone. Likewise expired fixes stay in the totals until
+the store has expired a session's last fix, which drops the session.
+"""
+import threading
+from collections import OrderedDict
+
+from .backfill import Backfilled
+from .records import us_to_iso
+from .spatial import haversine_m
+
+
+class _Summary:
+    __slots__ = ('first_us', 'last_us', 'last_id', 'count', 'distance_m', 'max_speed',
+                 'latitude', 'longitude', 'located_us', 'located_ms')
+
+    def __init__(self, server_us):
+        self.first_us = server_us
+        self.count = 0
+        self.distance_m = 0.0
+        self.max_speed = 0.0
+        self.latitude = self.longitude = self.located_us = self.located_ms = None
+
+
+class SessionIndex(Backfilled):
+    """Running per-session totals, kept current by subscribing to the store's appends."""
+
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self._reset()
+        self._start_backfill('ivnet-session-backfill')
+
+    def _reset(self):
+        self._sessions = OrderedDict()  # least recently seen first
+        self._upto = self._store.first_id - 1
+        self._generation = self._store.generation
+
+    def _update(self, limit=None):
+        """Fold in the rows appended since the last call (at most `limit`), and drop expired sessions."""
+        with self._lock:
+            if self._generation != self._store.generation:
+                self._reset()
+            sessions = self._sessions
+            first_id = self._store.first_id
+            while sessions and next(iter(sessions.values())).last_id < first_id:
+                sessions.popitem(last=False)
+            appended = len(self._store)
+            upto = appended if limit is None else min(appended, self._upto + limit)
+            if upto <= self._upto:
+                return False
+            points = self._store.session_points(self._upto, upto)
+            for location_id, server_us, session_id, latitude, longitude, timestamp in points:
+                summary = sessions.get(session_id)
+                if summary is None:
+                    summary = sessions[session_id] = _Summary(server_us)
+                else:
+                    sessions.move_to_end(session_id)
+                summary.count += 1
+                summary.last_us = server_us
+                summary.last_id = location_id
+                if latitude is None:
+                    continue
+                if summary.latitude is not None:
+                    step = haversine_m(summary.latitude, summary.longitude, latitude, longitude)
+                    summary.distance_m += step
+                    if timestamp is not None and summary.located_ms is not None:
+                        elapsed = (timestamp - summary.located_ms) / 1e3
+                    else:
+                        elapsed = (server_us - summary.located_us) / 1e6
+                    if elapsed > 0 and step / elapsed > summary.max_speed:
+                        summary.max_speed = step / elapsed
+                summary.latitude, summary.longitude = latitude, longitude
+                summary.located_us, summary.located_ms = server_us, timestamp
+            self._upto = upto
+            return upto < appended
+
+    def __len__(self):
+        self._ready.wait()
+        return len(self._sessions)
+
+    @staticmethod
+    def _to_dict(session_id, summary):
+        return {
+            'sessionId': session_id,
+            'first_seen': us_to_iso(summary.first_us),
+            'last_seen': us_to_iso(summary.last_us),
+            'count': summary.count,
+            'distance_m': round(summary.distance_m, 1),
+            'max_speed_mps': round(summary.max_speed, 2),
+            'last_id': summary.last_id,
+            'latitude': summary.latitude,
+            'longitude': summary.longitude,
+        }
+
+    def summaries(self, since=None, limit=None):
+        """Session summaries, most recently seen first.
+
+        `since` (epoch microseconds) keeps the sessions seen at or after it.
+        """
+        self._ready.wait()
+        with self._lock:
+            found = [(summary.last_us, session_id, summary) for session_id, summary in self._sessions.items()
+                     if since is None or summary.last_us >= since]
+            found.sort(key=lambda item: item[0], reverse=True)
+            if limit is not None:
+                found = found[:limit]
+            return [self._to_dict(session_id, summary) for _, session_id, summary in found]
+
+    def get(self, session_id):
+        """One session's summary, or None if it never stored a fix."""
+        self._ready.wait()
+        with self._lock:
+            summary = self._sessions.get(session_id)
+            return None if summary is None else self._to_dict(session_id, summary)
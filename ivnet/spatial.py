@@ -0,0 +1,170 @@
+"""Uniform latitude/longitude grid over stored fixes for area queries.
+
+Each cell keeps packed arrays of the ids and coordinates that fall in it, so
+a query only touches the cells overlapping the requested area and its cost
+follows the number of nearby fixes rather than the whole history.
+
+Fixes the store expires are skipped by queries at once and cut out of the
+cells a few hundred cells per update, so the index shrinks with the store
+without one long pass.
+"""
+import bisect
+import math
+import threading
+from array import array
+
+from . import config
+from .backfill import Backfilled
+
+TRIM_CELLS = 256  # cells trimmed of expired fixes per update
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _lon_ranges(min_lon, max_lon):
+    """Split a longitude span into ranges that don't cross the antimeridian."""
+    if max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    min_lon = (min_lon + 180) % 360 - 180
+    max_lon = (max_lon + 180) % 360 - 180
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+class _Cell:
+    __slots__ = ('ids', 'lats', 'lons')
+
+    def __init__(self):
+        self.ids = array('I')
+        self.lats = array('d')
+        self.lons = array('d')
+
+
+class GridIndex(Backfilled):
+    """Spatial index kept current by subscribing to the store's appends."""
+
+    def __init__(self, store, cell_degrees=config.GRID_DEGREES):
+        self._store = store
+        self._cell = cell_degrees
+        self._lock = threading.Lock()
+        self._reset()
+        self._start_backfill('ivnet-grid-backfill')
+
+    def _reset(self):
+        self._cells = {}
+        # Rows already expired are never indexed in the first place
+        self._upto = self._trimmed = self._store.first_id - 1
+        self._generation = self._store.generation
+        self._trim_keys = []  # cells still to trim in the current round
+
+    def _update(self, limit=None):
+        """Index the rows appended since the last call (at most `limit`), and trim a few cells of expired rows."""
+        with self._lock:
+            if self._generation != self._store.generation:
+                self._reset()
+            self._trim()
+            appended = len(self._store)
+            upto = appended if limit is None else min(appended, self._upto + limit)
+            if upto <= self._upto:
+                return False
+            cells = self._cells
+            size = self._cell
+            for location_id, lat, lon in self._store.coordinates(self._upto, upto):
+                key = (math.floor(lat / size), math.floor(lon / size))
+                cell = cells.get(key)
+                if cell is None:
+                    cell = cells[key] = _Cell()
+                cell.ids.append(location_id)
+                cell.lats.append(lat)
+                cell.lons.append(lon)
+            self._upto = upto
+            return upto < appended
+
+    def _trim(self):
+        keys = self._trim_keys
+        if not keys:
+            expired = self._store.first_id - 1
+            if expired <= self._trimmed:
+                return
+            self._trimmed = expired  # the round's cutoff: ids <= this are cut
+            keys = self._trim_keys = list(self._cells)
+        cells = self._cells
+        for _ in range(min(TRIM_CELLS, len(keys))):
+            key = keys.pop()
+            cell = cells.get(key)
+            if cell is None:
+                continue
+            # Ids are appended in order, so the expired ones are a prefix
+            cut = bisect.bisect_right(cell.ids, self._trimmed)
+            if cut == len(cell.ids):
+                del cells[key]
+            elif cut:
+                del cell.ids[:cut], cell.lats[:cut], cell.lons[:cut]
+
+    def _candidate_cells(self, min_lat, min_lon, max_lat, max_lon):
+        size = self._cell
+        y0, y1 = math.floor(min_lat / size), math.floor(max_lat / size)
+        x0, x1 = math.floor(min_lon / size), math.floor(max_lon / size)
+        # Walk the box when it is small, otherwise walk the (fewer) occupied cells
+        if (y1 - y0 + 1) * (x1 - x0 + 1) <= len(self._cells):
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    cell = self._cells.get((y, x))
+                    if cell is not None:
+                        yield cell
+        else:
+            for (y, x), cell in self._cells.items():
+                if y0 <= y <= y1 and x0 <= x <= x1:
+                    yield cell
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Return the sorted ids of fixes inside the box (min_lon > max_lon wraps the antimeridian)."""
+        if min_lon > max_lon:
+            max_lon += 360
+        first = self._store.first_id
+        found = []
+        self._ready.wait()
+        with self._lock:
+            for lon0, lon1 in _lon_ranges(min_lon, max_lon):
+                for cell in self._candidate_cells(min_lat, lon0, max_lat, lon1):
+                    for location_id, lat, lon in zip(cell.ids, cell.lats, cell.lons):
+                        if min_lat <= lat <= max_lat and lon0 <= lon <= lon1 and location_id >= first:
+                            found.append(location_id)
+        found.sort()
+        return found
+
+    def within_radius(self, lat, lon, radius_m):
+        """Return `(id, distance_m)` pairs within `radius_m` of a point, nearest first."""
+        dlat = radius_m / METERS_PER_DEGREE
+        min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+        if cos_lat * 180 <= dlat:
+            # Near a pole (or huge radius): every longitude may be in range
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            dlon = dlat / cos_lat
+            min_lon, max_lon = lon - dlon, lon + dlon
+        first = self._store.first_id
+        found = []
+        self._ready.wait()
+        with self._lock:
+            for lon0, lon1 in _lon_ranges(min_lon, max_lon):
+                for cell in self._candidate_cells(min_lat, lon0, max_lat, lon1):
+                    for location_id, cell_lat, cell_lon in zip(cell.ids, cell.lats, cell.lons):
+                        if min_lat <= cell_lat <= max_lat and location_id >= first:
+                            distance = haversine_m(lat, lon, cell_lat, cell_lon)
+                            if distance <= radius_m:
+                                found.append((distance, location_id))
+        found.sort()
+        return [(location_id, distance) for distance, location_id in found]
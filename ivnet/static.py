@@ -0,0 +1,92 @@
+"""Constant responses built once at import time, with precompressed variants.
+
+`serve()` picks brotli, gzip or identity from `Accept-Encoding` and answers
+a matching `If-None-Match` with 304. Brotli needs the optional `brotli`
+package; without it only gzip and identity are offered.
+"""
+import gzip
+import hashlib
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preference order when the client accepts several codings equally
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+class StaticAsset:
+    """One constant body plus its compressed encodings and strong ETags."""
+
+    def __init__(self, body, content_type):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Strong validators must differ per content-coding
+        self.variants = {'identity': (body, f'"{digest}"')}
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            self.variants['gzip'] = (compressed, f'"{digest}-gz"')
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.variants['br'] = (compressed, f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+
+def _accepted_encodings(header):
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def accepts(header, coding):
+    """Whether an Accept-Encoding header allows `coding`."""
+    accepted = _accepted_encodings(header or '')
+    return accepted.get(coding, accepted.get('*', 0.0)) > 0
+
+
+def negotiate(asset, header):
+    accepted = _accepted_encodings(header or '')
+    wildcard = accepted.get('*')
+    best, best_q = 'identity', 0.0
+    for coding in ENCODINGS:
+        if coding not in asset.variants:
+            continue
+        q = accepted.get(coding, wildcard if wildcard is not None else (1.0 if coding == 'identity' else 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def serve(asset):
+    """Return the best representation of `asset` for the current request."""
+    coding = negotiate(asset, request.headers.get('Accept-Encoding'))
+    body, etag = asset.variants[coding]
+    headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if coding != 'identity':
+        headers['Content-Encoding'] = coding
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if '*' in tags or tags & asset.etags:
+            return Response(status=304, headers=headers)
+    return Response(body, headers=headers, content_type=asset.content_type)
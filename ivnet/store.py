@@ -0,0 +1,835 @@
+"""Append-only location store backed by fixed-size memory-mapped segments.
+
+Each fix is split into packed numeric columns and dictionary-encoded string
+columns. A segment is a plain file holding SEGMENT_ROWS rows; opening the
+store maps the existing segments instead of parsing them, and an append
+writes one row in place.
+"""
+import bisect
+import contextlib
+import datetime
+import fcntl
+import itertools
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+
+from . import config
+from .records import EPOCH, FIELDS, FLOAT_FIELDS, MILLISECOND, STRING_FIELDS, Fix, ms_to_iso
+
+MAGIC = b'IVSEG001'
+HEADER = struct.Struct('<8sII')  # magic, capacity, count
+HEADER_SIZE = 64
+COUNT_OFFSET = 12
+
+# control.bin: shared by every process that opens the store
+CONTROL = struct.Struct('<8sIQQ')  # magic, generation, deleted rows, first retained row
+CONTROL_MAGIC = b'IVCTL001'
+CONTROL_SIZE = 64
+
+# Segment layout, one packed column after another: (name, array typecode)
+COLUMNS = (
+    [(name, 'd') for name in FLOAT_FIELDS]
+    + [('server_timestamp', 'q'), ('present', 'I')]
+    + [(name, 'I') for name in STRING_FIELDS]
+    + [('extra', 'I')]
+)
+ROW_SIZE = sum(struct.calcsize(code) for _, code in COLUMNS)
+
+# Bits of the per-row `present` column
+FIELD_BITS = {name: 1 << bit for bit, name in enumerate(FIELDS)}
+DELETED_BIT = 1 << 29  # tombstone: the row keeps its id but is skipped by reads
+EXTRA_BIT = 1 << 30
+ISO_TIMESTAMP_BIT = 1 << 31
+# Set when the number was posted as an int, so it reads back as one
+INT_BITS = {name: 1 << (16 + bit) for bit, name in enumerate(FLOAT_FIELDS)}
+
+NULL_STRING = 0xFFFFFFFF
+SERVER_FIELDS = ('id', 'server_timestamp')
+
+LENGTH = struct.Struct('<I')
+
+# Segments dropped by expire() or clear() stay mapped at least this long,
+# so `coordinates(..., expired=True)` can still see the rows that left; after
+# that reclaim() unmaps them once no read that started before is running
+RECLAIM_DELAY = 60.0
+
+
+def _iso_to_ms(value):
+    """Parse a JS `Date.toISOString()` string, or None if it wouldn't round-trip."""
+    # Exact shape check first: fromisoformat alone also accepts other spellings
+    if len(value) != 24 or value[10] != 'T' or value[19] != '.' or value[23] != 'Z':
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value[:23])
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        return None
+    return (parsed - EPOCH) // MILLISECOND
+
+
+class _Segment:
+    """One mapped segment file exposing its columns as typed memoryviews."""
+
+    def __init__(self, path, rows, create=False):
+        size = HEADER_SIZE + rows * ROW_SIZE
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT | os.O_EXCL if create else 0), 0o644)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            elif os.fstat(fd).st_size != size:
+                raise ValueError(f'{path}: expected {size} bytes for {rows} rows per segment')
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if create:
+            HEADER.pack_into(self._mm, 0, MAGIC, rows, 0)
+        magic, capacity, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or capacity != rows:
+            self._mm.close()
+            raise ValueError(f'{path}: not a segment with {rows} rows')
+
+        self.path = path
+        self._views = []
+        view = memoryview(self._mm)
+        offset = HEADER_SIZE
+        for name, code in COLUMNS:
+            length = rows * struct.calcsize(code)
+            column = view[offset:offset + length].cast(code)
+            setattr(self, name, column)
+            self._views.append(column)
+            offset += length
+        self._views.append(view)
+
+    @property
+    def count(self):
+        return LENGTH.unpack_from(self._mm, COUNT_OFFSET)[0]
+
+    @count.setter
+    def count(self, value):
+        LENGTH.pack_into(self._mm, COUNT_OFFSET, value)
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mm.close()
+
+
+class _StringTable:
+    """Append-only string dictionary persisted as length-prefixed UTF-8."""
+
+    def __init__(self, path):
+        self._ids = {}
+        self._values = []
+        self._path = path
+        self._offset = 0
+        self._file = open(path, 'ab')
+        self.refresh()
+        # A torn trailing entry from a crash is dropped and overwritten
+        if self._file.tell() != self._offset:
+            self._file.truncate(self._offset)
+
+    def refresh(self):
+        """Load entries appended since the last call (by this or another process)."""
+        size = os.path.getsize(self._path)
+        if size == self._offset:
+            return
+        with open(self._path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        offset = 0
+        while offset + LENGTH.size <= len(data):
+            (length,) = LENGTH.unpack_from(data, offset)
+            end = offset + LENGTH.size + length
+            if end > len(data):
+                break
+            self._add(data[offset + LENGTH.size:end].decode('utf-8', 'surrogatepass'))
+            offset = end
+        self._offset += offset
+
+    def _add(self, value):
+        index = len(self._values)
+        self._values.append(value)
+        self._ids[value] = index
+        return index
+
+    def encode(self, value):
+        index = self._ids.get(value)
+        if index is None:
+            index = self._add(value)
+            raw = value.encode('utf-8', 'surrogatepass')
+            self._file.write(LENGTH.pack(len(raw)) + raw)
+            self._file.flush()
+            self._offset += LENGTH.size + len(raw)
+        return index
+
+    def decode(self, index):
+        return None if index == NULL_STRING else self._values[index]
+
+    def __len__(self):
+        return len(self._values)
+
+    def flush(self):
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class SegmentStore:
+    """Columnar, append-only store of location fixes.
+
+    Rows are addressed by their 1-based id. Reads return `Fix` records;
+    `Fix.to_dict()` gives back the JSON the client posted plus `id` and
+    `server_timestamp`.
+
+    `delete()` tombstones rows rather than removing them: ids are never
+    reused, and every read skips deleted rows. `expire()` drops the oldest
+    rows by moving the first retained row forward; segments left wholly
+    behind it are unmapped and deleted later by `reclaim()`. `clear()` just
+    starts a new generation directory, leaving the old one to `reclaim()`
+    too, so neither has to touch the files while writers wait.
+
+    With `shared=True` several processes may open the same directory:
+    appends serialize on an flock of the control file, and `refresh()`
+    picks up rows, segments and strings written by the other processes.
+    """
+
+    def __init__(self, path, segment_rows=config.SEGMENT_ROWS, shared=config.SHARED):
+        if segment_rows & (segment_rows - 1):
+            raise ValueError('segment_rows must be a power of two')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_rows = segment_rows
+        self.shared = shared
+        self._shift = segment_rows.bit_length() - 1
+        self._mask = segment_rows - 1
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._retired = []  # (due, kind, payload) waiting for reclaim()
+        self._unmapping = []  # (epoch, kind, payload) dropped by reclaim(), waiting for older reads to end
+        self._epoch = 0  # bumped by every reclaim() that drops something
+        self._readers = []  # the epoch each read in progress started in
+        self._control_fd = os.open(os.path.join(path, 'control.bin'), os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock(fcntl.LOCK_EX):
+            if os.fstat(self._control_fd).st_size < CONTROL_SIZE:
+                os.ftruncate(self._control_fd, CONTROL_SIZE)
+            self._control = mmap.mmap(self._control_fd, CONTROL_SIZE)
+            magic = CONTROL.unpack_from(self._control, 0)[0]
+            if magic != CONTROL_MAGIC:
+                CONTROL.pack_into(self._control, 0, CONTROL_MAGIC, 0, 0, 0)
+            self._open()
+            # Generations a crash left behind before reclaim() got to them
+            for name in os.listdir(path):
+                if name.startswith('gen-') and os.path.join(path, name) != self._dir:
+                    self._retired.append((0.0, 'generation', ([], None, os.path.join(path, name))))
+            if self._dir != path:
+                self._retired.append((0.0, 'generation', ([], None, path)))
+
+    @property
+    def generation(self):
+        """Bumped by clear(), in every process, so derived indexes know to start over."""
+        return CONTROL.unpack_from(self._control, 0)[1]
+
+    @property
+    def deleted(self):
+        """Retained rows removed with `delete()`."""
+        return CONTROL.unpack_from(self._control, 0)[2]
+
+    @property
+    def first_id(self):
+        """The oldest id still retained; `expire()` moves it forward."""
+        return self._head + 1
+
+    @property
+    def live(self):
+        """Fixes a full read returns: retained rows that weren't deleted."""
+        return self._count - self._head - self.deleted
+
+    def _set_control(self, deleted, head):
+        CONTROL.pack_into(self._control, 0, CONTROL_MAGIC, self.generation, deleted, head)
+
+    def _generation_dir(self, generation):
+        # Generation 0 lives in the store directory itself, as it always has
+        if not generation:
+            return self.path
+        return os.path.join(self.path, f'gen-{generation:08d}')
+
+    @contextlib.contextmanager
+    def _file_lock(self, operation):
+        if not self.shared:
+            yield
+            return
+        fcntl.flock(self._control_fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._control_fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _writing(self):
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            if self.shared:
+                self._catch_up()
+            yield
+
+    def _open(self):
+        self._opened_generation = self.generation
+        self._dir = self._generation_dir(self._opened_generation)
+        os.makedirs(self._dir, exist_ok=True)
+        self._strings = _StringTable(os.path.join(self._dir, 'strings.dat'))
+        head = CONTROL.unpack_from(self._control, 0)[3]
+        # Segments before the first file on disk were expired and reclaimed; they stay None
+        names = sorted(name for name in os.listdir(self._dir) if name.startswith('seg-') and name.endswith('.bin'))
+        first = int(names[0][4:12]) if names else head >> self._shift
+        self._segments = [None] * first
+        for index, name in enumerate(names, first):
+            if name != self._segment_name(index):
+                raise ValueError(f'{self._dir}: missing segment {self._segment_name(index)}')
+            self._segments.append(_Segment(os.path.join(self._dir, name), self.segment_rows))
+        self._head = first * self.segment_rows if names else head
+        self._count = self._head
+        self._last_server_us = 0
+        self._dirty = set()  # segment indexes written since the last flush()
+        if names:
+            self._count = (len(self._segments) - 1) * self.segment_rows + self._segments[-1].count
+        # Retires expired segments whose files outlived the last process
+        self._advance_head(head)
+        if self._count > self._head:
+            self._last_server_us = self._server_us(self._count - 1)
+
+    def _catch_up(self):
+        """Map whatever other processes appended or expired; caller holds the locks."""
+        if self.generation != self._opened_generation:
+            self._retire_generation()
+            self._open()
+            return
+        self._advance_head(CONTROL.unpack_from(self._control, 0)[3])
+        while True:
+            full = len(self._segments) * self.segment_rows
+            last = self._segments[-1] if self._segments else None
+            count = full - self.segment_rows + last.count if last is not None else full
+            path = os.path.join(self._dir, self._segment_name(len(self._segments)))
+            if count == full and os.path.exists(path):
+                self._segments.append(_Segment(path, self.segment_rows))
+                continue
+            break
+        # Rows are counted before strings are loaded: a row only becomes
+        # visible after the strings it refers to were written
+        self._strings.refresh()
+        if count > self._count:
+            self._count = count
+            self._last_server_us = max(self._last_server_us, self._server_us(count - 1))
+
+    def _advance_head(self, head):
+        """Move the first retained row forward and retire the segments left behind it."""
+        if head <= self._head:
+            return
+        due = time.monotonic() + RECLAIM_DELAY
+        for index in range(self._head >> self._shift, head >> self._shift):
+            if self._segments[index] is not None:
+                self._retired.append((due, 'segment', index))
+        self._head = head
+
+    def _retire_generation(self):
+        due = time.monotonic() + RECLAIM_DELAY
+        # Its expired segments go with the rest of the generation
+        self._retired = [item for item in self._retired if item[1] != 'segment']
+        self._retired.append((due, 'generation', (self._segments, self._strings, self._dir)))
+        self._segments = []
+        self._dirty = set()
+
+    def refresh(self):
+        """Pick up fixes appended or expired by other processes (no-op unless shared)."""
+        if not self.shared:
+            return
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            before = (self._opened_generation, self._count, self._head)
+            self._catch_up()
+            changed = before != (self._opened_generation, self._count, self._head)
+        if changed:
+            self._notify()
+
+    @staticmethod
+    def _segment_name(index):
+        return f'seg-{index:08d}.bin'
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, listener):
+        """Call `listener()` after every append or clear, outside the store lock."""
+        self._listeners.append(listener)
+
+    def _notify(self):
+        for listener in self._listeners:
+            listener()
+
+    def append(self, record):
+        """Store one fix and return its id."""
+        with self._writing():
+            location_id = self._append(record, self._now_us())
+        self._notify()
+        return location_id
+
+    def append_many(self, records, received_us=None):
+        """Store several fixes in one critical section and return their ids.
+
+        `received_us` optionally gives each record's arrival time (epoch
+        microseconds) when it was buffered before reaching the store.
+        """
+        with self._writing():
+            if received_us is None:
+                server_us = self._now_us()
+                ids = [self._append(record, server_us) for record in records]
+            else:
+                ids = [self._append(record, self._now_us(at)) for record, at in zip(records, received_us)]
+        self._notify()
+        return ids
+
+    def _now_us(self, at=None):
+        # Never step backwards, so the server_timestamp column stays sorted
+        # and time ranges can be found by binary search (see `time_range`)
+        if at is None:
+            at = time.time_ns() // 1000
+        self._last_server_us = max(at, self._last_server_us)
+        return self._last_server_us
+
+    def _append(self, record, server_us):
+        row = self._count
+        index, i = row >> self._shift, row & self._mask
+        if index == len(self._segments):
+            path = os.path.join(self._dir, self._segment_name(index))
+            self._segments.append(_Segment(path, self.segment_rows, create=True))
+        segment = self._segments[index]
+        self._dirty.add(index)
+
+        present = 0
+        extra = {}
+        for key, value in record.items():
+            if key in SERVER_FIELDS:
+                continue
+            bit = FIELD_BITS.get(key)
+            if bit is None:
+                extra[key] = value
+            elif key in STRING_FIELDS:
+                if value is None:
+                    getattr(segment, key)[i] = NULL_STRING
+                elif isinstance(value, str):
+                    getattr(segment, key)[i] = self._strings.encode(value)
+                else:
+                    extra[key] = value
+                    continue
+                present |= bit
+            else:
+                number = None
+                if value is None:
+                    number = math.nan
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    number = float(value)
+                    if isinstance(value, int) and number == value:
+                        present |= INT_BITS[key]
+                elif key == 'timestamp' and isinstance(value, str):
+                    number = _iso_to_ms(value)
+                    if number is not None:
+                        present |= ISO_TIMESTAMP_BIT
+                if number is None:
+                    extra[key] = value
+                    continue
+                getattr(segment, key)[i] = number
+                present |= bit
+        if extra:
+            segment.extra[i] = self._strings.encode(json.dumps(extra, sort_keys=True, separators=(',', ':')))
+            present |= EXTRA_BIT
+        segment.server_timestamp[i] = server_us
+        segment.present[i] = present
+
+        # Bumping the header count is what makes the row visible after a restart
+        segment.count = i + 1
+        self._count = row + 1
+        return row + 1
+
+    def flush(self):
+        """Force appended rows and strings to disk (msync/fsync).
+
+        Without this the OS still writes them back on its own schedule; they
+        survive a process crash, just not a machine crash.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Strings are only added by _append, which also dirties a segment
+        if not self._dirty:
+            return
+        for index in sorted(self._dirty):
+            self._segments[index].flush()
+        self._dirty.clear()
+        self._strings.flush()
+
+    def delete(self, location_ids):
+        """Tombstone the given fixes; ids are never reused. Returns how many were deleted."""
+        with self._writing():
+            deleted = 0
+            for location_id in location_ids:
+                row = location_id - 1
+                if not self._head <= row < self._count:
+                    continue
+                segment = self._segments[row >> self._shift]
+                i = row & self._mask
+                if not segment.present[i] & DELETED_BIT:
+                    segment.present[i] |= DELETED_BIT
+                    self._dirty.add(row >> self._shift)
+                    deleted += 1
+            self._set_control(self.deleted + deleted, self._head)
+        return deleted
+
+    def expire(self, upto_id):
+        """Drop every fix with id <= `upto_id` (ids are not reused); returns how many rows went.
+
+        Only the first-retained-row pointer moves, so this is cheap however
+        many rows it drops. Listeners are notified afterwards; the dropped
+        rows stay readable through `coordinates(..., expired=True)` until
+        `reclaim()` unmaps their segments.
+        """
+        with self._writing():
+            head = min(upto_id, self._count)
+            if head <= self._head:
+                return 0
+            # Tombstones among the dropped rows no longer count as deleted
+            tombstones = sum(1 for row in range(self._head, head) if self._deleted(self._segments, row))
+            dropped = head - self._head
+            self._advance_head(head)
+            self._set_control(self.deleted - tombstones, head)
+        self._notify()
+        return dropped
+
+    def reclaim(self, now=None):
+        """Unmap and delete the segments and generations retired more than RECLAIM_DELAY ago.
+
+        Anything a read still in progress may reach is left for a later call.
+        Returns how many were reclaimed; run from a background thread (see
+        ivnet/retention.py).
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            due = [item for item in self._retired if item[0] <= now]
+            if due:
+                self._retired = [item for item in self._retired if item[0] > now]
+                # Reads in progress hold the old list, so swap in a copy rather than
+                # blanking the entries they may still be reading through
+                segments = list(self._segments)
+                for _, kind, payload in due:
+                    if kind == 'segment':
+                        self._unmapping.append((self._epoch, kind, segments[payload]))
+                        segments[payload] = None
+                        self._dirty.discard(payload)
+                    else:
+                        self._unmapping.append((self._epoch, kind, payload))
+                self._segments = segments
+                self._epoch += 1
+            # Only what no running read can reach any more gets unmapped
+            oldest = min(self._readers, default=self._epoch)
+            done = [item for item in self._unmapping if item[0] < oldest]
+            self._unmapping = [item for item in self._unmapping if item[0] >= oldest]
+        # Unmapping and unlinking happen outside the lock, so writers never wait on them
+        for _, kind, payload in done:
+            if kind == 'segment':
+                payload.close()
+                # Another process sharing the directory may have got there first
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(payload.path)
+            else:
+                segments, strings, path = payload
+                for segment in segments:
+                    if segment is not None:
+                        segment.close()
+                if strings is not None:
+                    strings.close()
+                self._remove_generation(path)
+        return len(done)
+
+    def _remove_generation(self, path):
+        if path != self.path:
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        # Generation 0's files sit next to control.bin and the other generations
+        for name in os.listdir(path):
+            if name.startswith('seg-') or name == 'strings.dat':
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(path, name))
+
+    # Readers take the segment list and string table once, when they start,
+    # and read only through those: clear() and reclaim() swap in new ones,
+    # and nothing a read in progress holds is unmapped until it finishes
+
+    @contextlib.contextmanager
+    def _reading(self):
+        with self._lock:
+            epoch = self._epoch
+            self._readers.append(epoch)
+            snapshot = self._segments, self._strings, self._head, self._count
+        try:
+            yield snapshot
+        finally:
+            # Without the lock: an abandoned reader is closed whenever it is
+            # collected, possibly while this thread already holds it
+            self._readers.remove(epoch)
+
+    def _deleted(self, segments, row):
+        return segments[row >> self._shift].present[row & self._mask] & DELETED_BIT
+
+    def get(self, location_id):
+        """Return the fix with the given id."""
+        row = location_id - 1
+        with self._reading() as (segments, strings, head, count):
+            if not head <= row < count or self._deleted(segments, row):
+                raise KeyError(location_id)
+            return self._read(segments, strings, row)
+
+    def _read(self, segments, strings, row):
+        segment = segments[row >> self._shift]
+        i = row & self._mask
+        present = segment.present[i]
+        fix = Fix(row + 1, segment.server_timestamp[i])
+        if present & EXTRA_BIT:
+            fix.extra_json = strings.decode(segment.extra[i])
+        for name in FLOAT_FIELDS:
+            if present & FIELD_BITS[name]:
+                value = getattr(segment, name)[i]
+                if math.isnan(value):
+                    value = None
+                elif present & INT_BITS[name]:
+                    value = int(value)
+                setattr(fix, name, value)
+        if present & ISO_TIMESTAMP_BIT:
+            fix.timestamp = ms_to_iso(int(fix.timestamp))
+        for name in STRING_FIELDS:
+            if present & FIELD_BITS[name]:
+                setattr(fix, name, strings.decode(getattr(segment, name)[i]))
+        return fix
+
+    def _server_us(self, row, segments=None):
+        if segments is None:
+            segments = self._segments
+        return segments[row >> self._shift].server_timestamp[row & self._mask]
+
+    def time_range(self, since=None, until=None):
+        """Return the `(start, stop)` row span whose server timestamps fall in [since, until).
+
+        Timestamps are epoch microseconds; the span is found by binary search
+        over the packed column, without decoding any row.
+        """
+        with self._reading() as (segments, _, head, count):
+            return self._time_range(segments, head, count, since, until)
+
+    def _time_range(self, segments, head, count, since, until):
+        times = _ServerTimes(self, segments, head, count)
+        start = 0 if since is None else bisect.bisect_left(times, since)
+        stop = len(times) if until is None else bisect.bisect_left(times, until)
+        return head + start, head + max(start, stop)
+
+    def scan(self, after_id=0, since=None, until=None, session_id=None):
+        """Yield fixes with id > `after_id`, oldest first.
+
+        `since`/`until` bound the server timestamp (epoch microseconds) to
+        the half-open window [since, until). With `session_id` only that
+        session's fixes are read; the others are skipped on their packed
+        sessionId column.
+        """
+        with self._reading() as (segments, strings, head, count):
+            start, stop = self._time_range(segments, head, count, since, until)
+            if session_id is None:
+                for row in range(max(after_id, start), stop):
+                    if not self._deleted(segments, row):
+                        yield self._read(segments, strings, row)
+                return
+            wanted = strings._ids.get(session_id)
+            if wanted is None:
+                return
+            has_session = FIELD_BITS['sessionId']
+            for row in range(max(after_id, start), stop):
+                segment = segments[row >> self._shift]
+                i = row & self._mask
+                if segment.present[i] & (has_session | DELETED_BIT) == has_session and segment.sessionId[i] == wanted:
+                    yield self._read(segments, strings, row)
+
+    def coordinates(self, after_id=0, upto_id=None, expired=False, deleted=False):
+        """Yield `(id, latitude, longitude)` for ids in (after_id, upto_id] that have both.
+
+        With `expired=True` rows dropped by `expire()` are read as well, as
+        long as `reclaim()` hasn't unmapped them yet; with `deleted=True` so
+        are tombstoned ones.
+        """
+        both = FIELD_BITS['latitude'] | FIELD_BITS['longitude']
+        mask = both if deleted else both | DELETED_BIT
+        with self._reading() as (segments, _, head, count):
+            stop = count if upto_id is None else min(upto_id, count)
+            for row in range(max(after_id, 0 if expired else head), stop):
+                segment = segments[row >> self._shift]
+                if segment is None:
+                    continue
+                i = row & self._mask
+                if segment.present[i] & mask == both:
+                    latitude, longitude = segment.latitude[i], segment.longitude[i]
+                    if not (math.isnan(latitude) or math.isnan(longitude)):
+                        yield row + 1, latitude, longitude
+
+    def session_points(self, after_id=0, upto_id=None):
+        """Yield `(id, server_us, sessionId, latitude, longitude, timestamp)` for ids in (after_id, upto_id] with a sessionId.
+
+        Coordinates are None when the fix has none; `timestamp` is the
+        client's time in epoch milliseconds, or None.
+        """
+        has_session = FIELD_BITS['sessionId']
+        both = FIELD_BITS['latitude'] | FIELD_BITS['longitude']
+        has_timestamp = FIELD_BITS['timestamp']
+        with self._reading() as (segments, strings, head, count):
+            decode = strings.decode
+            stop = count if upto_id is None else min(upto_id, count)
+            for row in range(max(after_id, head), stop):
+                segment = segments[row >> self._shift]
+                i = row & self._mask
+                present = segment.present[i]
+                if present & (has_session | DELETED_BIT) != has_session:
+                    continue
+                session_id = decode(segment.sessionId[i])
+                if session_id is None:
+                    continue
+                latitude = longitude = None
+                if present & both == both:
+                    latitude, longitude = segment.latitude[i], segment.longitude[i]
+                    if math.isnan(latitude) or math.isnan(longitude):
+                        latitude = longitude = None
+                timestamp = segment.timestamp[i] if present & has_timestamp else None
+                if timestamp is not None and math.isnan(timestamp):
+                    timestamp = None
+                yield row + 1, segment.server_timestamp[i], session_id, latitude, longitude, timestamp
+
+    def string_id(self, value):
+        """The dictionary index of a string column value, or None if no fix has it."""
+        return self._strings._ids.get(value)
+
+    @contextlib.contextmanager
+    def columns(self, names):
+        """Hold the store still and yield `(first_id, {name: column})` per segment.
+
+        Each column is a typed memoryview over the rows in use, for bulk
+        readers (e.g. NumPy via `frombuffer`). The views are only valid
+        inside the `with` block, and appends wait until it ends.
+        """
+        with self._lock:
+            views = []
+            for index in range(self._head >> self._shift, len(self._segments)):
+                segment = self._segments[index]
+                first = index * self.segment_rows
+                start = max(self._head - first, 0)
+                used = min(self._count - first, self.segment_rows)
+                if used > start:
+                    views.append((first + start + 1, {name: getattr(segment, name)[start:used] for name in names}))
+            try:
+                yield views
+            finally:
+                for _, columns in views:
+                    for column in columns.values():
+                        column.release()
+
+    def latest(self, limit, offset=0):
+        """Yield up to `limit` fixes newest first, after skipping the `offset` newest.
+
+        Only the rows that are returned get read, however long the history.
+        Deleted fixes don't count towards `offset`.
+        """
+        with self._reading() as (segments, strings, head, count):
+            if not self.deleted:
+                stop = count - offset
+                for row in range(stop - 1, max(stop - limit, head) - 1, -1):
+                    yield self._read(segments, strings, row)
+                return
+            rows = (row for row in range(count - 1, head - 1, -1) if not self._deleted(segments, row))
+            for row in itertools.islice(rows, offset, offset + limit):
+                yield self._read(segments, strings, row)
+
+    def __iter__(self):
+        with self._reading() as (segments, strings, head, count):
+            for row in range(head, count):
+                if not self._deleted(segments, row):
+                    yield self._read(segments, strings, row)
+
+    def __reversed__(self):
+        with self._reading() as (segments, strings, head, count):
+            for row in range(count - 1, head - 1, -1):
+                if not self._deleted(segments, row):
+                    yield self._read(segments, strings, row)
+
+    def clear(self):
+        """Drop every stored fix; ids start again from 1.
+
+        O(1): the next generation starts in a fresh directory, and the old
+        one is deleted by a later `reclaim()`.
+        """
+        with self._writing():
+            # No flush: the old generation's files are about to be deleted
+            self._retire_generation()
+            CONTROL.pack_into(self._control, 0, CONTROL_MAGIC, self.generation + 1, 0, 0)
+            self._open()
+        self._notify()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            for segment in self._segments:
+                if segment is not None:
+                    segment.close()
+            self._segments = []
+            self._strings.close()
+            # Nothing reads through this store any more, so retired mappings can go now
+            retired, self._retired = self._retired, []
+            unmapping, self._unmapping = self._unmapping, []
+        for _, kind, payload in unmapping:
+            if kind == 'segment':
+                payload.close()
+        for _, kind, payload in retired + unmapping:
+            if kind == 'generation':
+                segments, strings, _ = payload
+                for segment in segments:
+                    if segment is not None:
+                        segment.close()
+                if strings is not None:
+                    strings.close()
+        self._control.close()
+        os.close(self._control_fd)
+
+
+class _ServerTimes:
+    """Read-only sequence over the retained rows' server_timestamp column, for `bisect`."""
+
+    __slots__ = ('_store', '_segments', '_head', '_count')
+
+    def __init__(self, store, segments, head, count):
+        self._store = store
+        self._segments = segments
+        self._head = head
+        self._count = count - head
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self._store._server_us(self._head + index, self._segments)
+
+
+def open_store(name):
+    """Open (or create) the named store under the configured data directory."""
+    return SegmentStore(os.path.join(config.DATA_DIR, name))
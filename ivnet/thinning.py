@@ -0,0 +1,221 @@
+"""Ingest-time thinning of each session's trajectory.
+
+The tracker page re-sends its last fix every 30 seconds and on every
+visibility change, so a device that isn't moving produces a stream of
+near-identical points. `Thinner.wrap(append_many)` stores a session's fix
+only if it is further from the session's last stored fix than
+THIN_DISTANCE_M, or than the larger of the two fixes' accuracy radii (two
+fixes inside each other's error circle can't be told apart), or if
+THIN_INTERVAL seconds have passed since that fix, so an idle device still
+shows it is alive. The interval is measured between the two fixes' client
+timestamps when both have one (a batch uploaded after going offline
+arrives all at once) and between their arrival times otherwise. A dropped fix is answered with the id of the stored fix
+it repeats. Fixes without a sessionId or coordinates are always stored.
+
+With SIMPLIFY_M set, `close(session_id)` also runs Douglas-Peucker over the
+fixes the session stored and returns the ids that can be deleted without
+moving its path by more than that many meters.
+"""
+import collections
+import math
+import threading
+import time
+
+from . import config
+from .spatial import METERS_PER_DEGREE, haversine_m
+from .store import _iso_to_ms
+
+MAX_PATH = 10000  # fixes remembered per session for simplification
+
+
+class _Session:
+    __slots__ = ('latitude', 'longitude', 'accuracy', 'at', 'timestamp_ms', 'last_id', 'path')
+
+    def __init__(self):
+        self.last_id = None
+        self.path = []  # (id, latitude, longitude) of stored fixes, if simplifying
+
+
+def _point(record):
+    """`(latitude, longitude, accuracy)` of a record, or None without usable coordinates."""
+    latitude, longitude = record.get('latitude'), record.get('longitude')
+    for value in (latitude, longitude):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return None
+    accuracy = record.get('accuracy')
+    if isinstance(accuracy, bool) or not isinstance(accuracy, (int, float)) or not accuracy >= 0:
+        accuracy = 0.0
+    return latitude, longitude, accuracy
+
+
+def _timestamp_ms(record):
+    """The client's time for a record in epoch milliseconds, or None."""
+    timestamp = record.get('timestamp')
+    if isinstance(timestamp, str):
+        return _iso_to_ms(timestamp)
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)) or not math.isfinite(timestamp):
+        return None
+    return timestamp
+
+
+def douglas_peucker(points, tolerance_m):
+    """Return a keep flag per `(latitude, longitude)` point; the ends are always kept."""
+    keep = [False] * len(points)
+    if not points:
+        return keep
+    keep[0] = keep[-1] = True
+    # Flat projection around the first point: fine over the few km a session covers
+    lat0 = points[0][0]
+    scale = math.cos(math.radians(lat0))
+    xy = [((lon - points[0][1]) * scale * METERS_PER_DEGREE, (lat - lat0) * METERS_PER_DEGREE) for lat, lon in points]
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        farthest, worst = first, -1.0
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                distance = math.hypot(x - x1, y - y1)
+            if distance > worst:
+                farthest, worst = i, distance
+        if worst > tolerance_m:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return keep
+
+
+class Thinner:
+    """Per-session near-duplicate filter in front of an `append_many`."""
+
+    def __init__(self, enabled=config.THIN, distance_m=config.THIN_DISTANCE_M, interval=config.THIN_INTERVAL,
+                 simplify_m=config.SIMPLIFY_M, max_sessions=config.THIN_MAX_SESSIONS, clock=time.monotonic):
+        self.enabled = enabled
+        self.distance_m = distance_m
+        self.interval = interval
+        self.simplify_m = simplify_m
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = collections.OrderedDict()  # least recently seen first
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.dropped = 0
+        self.simplified = 0
+
+    def _decide(self, record, now):
+        # Returns (session or None, store it?, the session's state before);
+        # called with the lock held
+        self.seen += 1
+        session_id = record.get('sessionId')
+        point = _point(record)
+        if not isinstance(session_id, str) or point is None:
+            return None, True, None
+        latitude, longitude, accuracy = point
+        timestamp_ms = _timestamp_ms(record)
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            previous = None
+        else:
+            self._sessions.move_to_end(session_id)
+            if timestamp_ms is not None and session.timestamp_ms is not None:
+                elapsed = abs(timestamp_ms - session.timestamp_ms) / 1e3
+            else:
+                elapsed = now - session.at
+            if elapsed < self.interval:
+                threshold = max(self.distance_m, accuracy, session.accuracy)
+                if haversine_m(session.latitude, session.longitude, latitude, longitude) <= threshold:
+                    self.dropped += 1
+                    return session, False, None
+            previous = (session.latitude, session.longitude, session.accuracy, session.at, session.timestamp_ms,
+                        session.last_id)
+        session.latitude, session.longitude, session.accuracy = point
+        session.at, session.timestamp_ms = now, timestamp_ms
+        session.last_id = None  # until the store hands out its id
+        return session, True, previous
+
+    def _undo(self, records, decisions, now):
+        # The append failed, so nothing in `records` was stored: put each
+        # session back as it was, unless another request has moved it on
+        for record, (session, keep, previous) in zip(reversed(records), reversed(decisions)):
+            self.seen -= 1
+            if not keep:
+                self.dropped -= 1
+                continue
+            if session is None or session.at != now or session.last_id is not None:
+                continue
+            if previous is None:
+                if self._sessions.get(record['sessionId']) is session:
+                    del self._sessions[record['sessionId']]
+            else:
+                (session.latitude, session.longitude, session.accuracy, session.at, session.timestamp_ms,
+                 session.last_id) = previous
+
+    def wrap(self, append_many):
+        """Return an `append_many` that only stores the fixes thinning keeps."""
+        if not self.enabled:
+            return append_many
+
+        def thinned_append_many(records):
+            now = self._clock()
+            with self._lock:
+                decisions = [self._decide(record, now) for record in records]
+            kept = [record for record, (_, keep, _) in zip(records, decisions) if keep]
+            try:
+                stored = iter(append_many(kept) if kept else ())
+            except BaseException:
+                # e.g. QueueFull: the client will retry, and the retry must not look like a repeat
+                with self._lock:
+                    self._undo(records, decisions, now)
+                raise
+            ids = []
+            with self._lock:
+                for record, (session, keep, _) in zip(records, decisions):
+                    if not keep:
+                        # The id of the fix this one repeats (None if that is still being stored)
+                        ids.append(session.last_id)
+                        continue
+                    location_id = next(stored)
+                    ids.append(location_id)
+                    if session is not None:
+                        session.last_id = location_id
+                        if self.simplify_m and len(session.path) < MAX_PATH:
+                            session.path.append((location_id, record['latitude'], record['longitude']))
+            return ids
+
+        return thinned_append_many
+
+    def close(self, session_id):
+        """Forget a finished session; returns the ids simplification says can be deleted."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None or not self.simplify_m or len(session.path) < 3:
+            return []
+        keep = douglas_peucker([(lat, lon) for _, lat, lon in session.path], self.simplify_m)
+        doomed = [location_id for (location_id, _, _), kept in zip(session.path, keep) if not kept]
+        with self._lock:
+            self.simplified += len(doomed)
+        return doomed
+
+    def clear(self):
+        """Forget every session, e.g. after the store was cleared."""
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        return {
+            'seen': self.seen,
+            'stored': self.seen - self.dropped,
+            'dropped': self.dropped,
+            'simplified': self.simplified,
+            'sessions': len(self._sessions),
+        }
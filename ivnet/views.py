@@ -0,0 +1,310 @@
+"""Response builders for the location read endpoints, shared by both apps."""
+import itertools
+
+from flask import Response, jsonify
+
+from . import analytics, export, logs, metrics
+from .codec import dumps
+from .query import QueryError, get_bool, get_float, get_int, get_time
+from .static import accepts
+
+MAX_PAGE_SIZE = 1000
+MAX_AREA_RESULTS = 10000
+MAX_CLUSTERS = 5000
+STREAM_CHUNK = 256  # fixes encoded per yielded chunk
+
+
+def encode(fix):
+    # Same codec, key order and escaping as jsonify, so streamed output matches it byte for byte
+    return dumps(fix.to_dict())
+
+
+def stream_json_array(fixes):
+    """Yield a JSON array a few hundred fixes at a time."""
+    yield '['
+    first = True
+    while True:
+        chunk = list(itertools.islice(fixes, STREAM_CHUNK))
+        if not chunk:
+            break
+        body = ','.join(map(encode, chunk))
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+
+
+def locations_response(store, args):
+    """GET /api/locations.
+
+    Without `limit` (or with `stream=1`) the matching fixes are streamed as
+    one JSON array. With `limit` a single page is returned together with the
+    cursor for the next one:
+
+        ?after_id=<id>&limit=<n>&from=<time>&to=<time>
+
+    `?latest=<n>` returns the newest n fixes, newest first, reading only
+    those rows.
+    """
+    latest = get_int(args, 'latest', minimum=1, maximum=MAX_PAGE_SIZE)
+    if latest is not None:
+        return jsonify([fix.to_dict() for fix in store.latest(latest)])
+
+    after_id = get_int(args, 'after_id', 0)
+    since = get_time(args, 'from')
+    until = get_time(args, 'to')
+    fixes = store.scan(after_id, since, until)
+
+    limit = get_int(args, 'limit', minimum=1, maximum=MAX_PAGE_SIZE)
+    if limit is None or get_bool(args, 'stream'):
+        if limit is not None:
+            fixes = itertools.islice(fixes, limit)
+        return Response(stream_json_array(fixes), mimetype='application/json')
+
+    page = list(itertools.islice(fixes, limit))
+    next_after_id = page[-1].id if len(page) == limit else None
+    return jsonify({'locations': [fix.to_dict() for fix in page], 'count': len(page), 'next_after_id': next_after_id})
+
+
+def _parse_version(version):
+    generation, _, upto = version.partition('.')
+    if not (generation.isdigit() and upto.isdigit()):
+        raise QueryError('version must look like <generation>.<id>, as returned by this endpoint')
+    return int(generation), int(upto)
+
+
+def export_response(store, args, accept_encoding=None):
+    """GET /api/export: every matching fix as one streamed download.
+
+        ?format=csv|geojson|ndjson   (default ndjson)
+        ?from=<time>&to=<time>       server-time window
+        ?session=<sessionId>         one session only
+        ?gzip=0|1                    compress; by default whenever the
+                                     client accepts gzip
+
+    The body is generated chunk by chunk while it is sent, so memory use
+    doesn't grow with the size of the export.
+    """
+    name = args.get('format', 'ndjson').lower()
+    if name not in export.FORMATS:
+        raise QueryError(f'format must be one of {", ".join(sorted(export.FORMATS))}')
+    chunks, content_type, extension = export.FORMATS[name]
+    fixes = store.scan(0, get_time(args, 'from'), get_time(args, 'to'), args.get('session') or None)
+    body = chunks(fixes)
+    compress = get_bool(args, 'gzip') if args.get('gzip') else accepts(accept_encoding, 'gzip')
+    if compress:
+        body = export.gzip_chunks(body)
+    response = Response(body, content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="locations.{extension}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def delta_response(store, args, if_none_match=None):
+    """GET /api/locations/delta: only the fixes a polling client hasn't seen.
+
+        ?since=<id>            fixes with id > since
+        ?version=<g>.<id>      the `version` from the previous response
+                               (or send it back as If-None-Match)
+
+    The response carries a new `version` (also as the ETag). When nothing
+    was added since the client's version the answer is 304 Not Modified;
+    after a clear `reset` is true and the fixes start again from id 1.
+    Responses hold at most `limit` fixes; `more` says to ask again at once.
+    """
+    limit = get_int(args, 'limit', MAX_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    generation, count = store.generation, len(store)
+    version = args.get('version')
+    if not version and if_none_match:
+        version = next(iter(if_none_match), None)
+    if version:
+        client_generation, since = _parse_version(version)
+        conditional = True
+    else:
+        client_generation, since = generation, get_int(args, 'since', 0)
+        conditional = False
+
+    reset = client_generation != generation or since > count
+    if reset:
+        since = 0
+    elif since == count and conditional:
+        response = Response(status=304)
+        response.set_etag(f'{generation}.{count}')
+        return response
+
+    page = list(itertools.islice(store.scan(since), limit))
+    upto = page[-1].id if page else since
+    response = jsonify({
+        'locations': [fix.to_dict() for fix in page],
+        'count': len(page),
+        'version': f'{generation}.{upto}',
+        'more': upto < count,
+        'reset': reset,
+    })
+    response.set_etag(f'{generation}.{upto}')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _parse_bbox(bbox):
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in bbox.split(','))
+    except ValueError:
+        raise QueryError('bbox must be min_lon,min_lat,max_lon,max_lat') from None
+    if not -90 <= min_lat <= max_lat <= 90:
+        raise QueryError('bbox latitudes must satisfy -90 <= min_lat <= max_lat <= 90')
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise QueryError('bbox longitudes must be between -180 and 180')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def within_response(store, index, args):
+    """GET /api/locations/within?bbox=min_lon,min_lat,max_lon,max_lat
+    or GET /api/locations/within?lat=&lon=&radius_m=
+    """
+    limit = get_int(args, 'limit', MAX_AREA_RESULTS, minimum=1, maximum=MAX_AREA_RESULTS)
+    bbox = args.get('bbox')
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = _parse_bbox(bbox)
+        matches = [(location_id, None) for location_id in index.within_bbox(min_lat, min_lon, max_lat, max_lon)]
+    else:
+        lat = get_float(args, 'lat', minimum=-90, maximum=90)
+        lon = get_float(args, 'lon', minimum=-180, maximum=180)
+        radius_m = get_float(args, 'radius_m', minimum=0, maximum=20037509)
+        if lat is None or lon is None or radius_m is None:
+            raise QueryError('pass either bbox or lat, lon and radius_m')
+        matches = index.within_radius(lat, lon, radius_m)
+
+    locations = []
+    for location_id, distance in matches[:limit]:
+        try:
+            record = store.get(location_id).to_dict()
+        except KeyError:
+            continue  # deleted since it was indexed
+        if distance is not None:
+            record['distance_m'] = round(distance, 1)
+        locations.append(record)
+    return jsonify({'locations': locations, 'count': len(locations), 'truncated': len(matches) > limit})
+
+
+def clusters_response(pyramid, args):
+    """GET /api/clusters?zoom=<z>&bbox=min_lon,min_lat,max_lon,max_lat
+
+    One entry per occupied map cell (64 screen pixels square at that zoom)
+    in the viewport, with its fix count and centroid. Zooms past the
+    deepest level kept are answered from that level.
+    """
+    zoom = get_int(args, 'zoom', minimum=0)
+    bbox = args.get('bbox')
+    if zoom is None or not bbox:
+        raise QueryError('pass zoom and bbox=min_lon,min_lat,max_lon,max_lat')
+    limit = get_int(args, 'limit', MAX_CLUSTERS, minimum=1, maximum=MAX_CLUSTERS)
+    min_lon, min_lat, max_lon, max_lat = _parse_bbox(bbox)
+    clusters, truncated = pyramid.clusters(zoom, min_lat, min_lon, max_lat, max_lon, limit)
+    return jsonify({
+        'clusters': clusters,
+        'count': len(clusters),
+        'zoom': min(zoom, pyramid.max_zoom),
+        'truncated': truncated,
+    })
+
+
+def sessions_response(sessions, args):
+    """GET /api/sessions: one summary per session, most recently seen first.
+
+        ?active_since=<time>   only sessions seen at or after this time
+        ?limit=<n>             at most n sessions
+    """
+    since = get_time(args, 'active_since')
+    limit = get_int(args, 'limit', minimum=1)
+    found = sessions.summaries(since, limit)
+    return jsonify({'sessions': found, 'count': len(found), 'total': len(sessions)})
+
+
+def session_response(sessions, store, session_id):
+    """GET /api/sessions/<sessionId>: one session's summary plus its last fix."""
+    summary = sessions.get(session_id)
+    if summary is None:
+        return jsonify({'status': 'error', 'message': 'unknown session'}), 404
+    try:
+        summary['last_fix'] = store.get(summary['last_id']).to_dict()
+    except KeyError:
+        summary['last_fix'] = None  # deleted since
+    return jsonify(summary)
+
+
+def analytics_response(store, session_id, args):
+    """GET /api/sessions/<sessionId>/analytics: distance, speed and dwell totals.
+
+        ?dwell_speed_mps=<v>   slower steps count as standing still
+        ?dwell_radius_m=<m>    a dwell's fixes all lie this close to its centre
+        ?dwell_min_s=<s>       shortest stay reported as a dwell
+        ?steps=1               also return the per-step arrays
+    """
+    if analytics.numpy is None:
+        return jsonify({'status': 'error', 'message': 'analytics need numpy (pip install numpy)'}), 501
+    speed_mps = get_float(args, 'dwell_speed_mps', analytics.DWELL_SPEED_MPS, minimum=0)
+    radius_m = get_float(args, 'dwell_radius_m', analytics.DWELL_RADIUS_M, minimum=0)
+    min_seconds = get_float(args, 'dwell_min_s', analytics.DWELL_MIN_SECONDS, minimum=0)
+    track = analytics.load_track(store, session_id)
+    if not len(track):
+        return jsonify({'status': 'error', 'message': 'unknown session or no located fixes'}), 404
+    totals, steps, dwells = analytics.analyze(track, speed_mps, radius_m, min_seconds)
+    body = {'sessionId': session_id, **totals, 'dwells': dwells}
+    if get_bool(args, 'steps'):
+        body['steps'] = {
+            'id': steps['id'].tolist(),
+            'distance_m': steps['distance_m'].round(2).tolist(),
+            'seconds': steps['seconds'].round(3).tolist(),
+            # NaN isn't JSON: a step with no elapsed time has no speed
+            'speed_mps': [None if speed != speed else speed for speed in steps['speed_mps'].round(3).tolist()],
+            'bearing_deg': steps['bearing_deg'].round(1).tolist(),
+        }
+    return jsonify(body)
+
+
+def live_response(broadcaster, args, last_event_id=None):
+    """GET /live: Server-Sent Events, one `message` per new fix.
+
+    Resumes after `Last-Event-ID` (sent by the browser on reconnect) or
+    `?after_id=`; otherwise starts with the next fix stored.
+    """
+    after_id = get_int(args, 'after_id')
+    if last_event_id and last_event_id.isdigit():
+        after_id = int(last_event_id)
+    stream = broadcaster.connect(after_id)
+    if stream is None:
+        return jsonify({'status': 'error', 'message': 'too many live viewers, try again later'}), 503
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_response(request_metrics, store, ingest, thinner, retention, limiter, broadcaster=None):
+    """GET /metrics: request metrics plus store, ingest, thinning, retention, rate limit and process gauges."""
+    thinning = thinner.stats()
+    rate_limit = limiter.stats()
+    families = request_metrics.families() + [
+        ('ivnet_store_fixes', 'gauge', 'Fixes a full read returns (not deleted or expired).', store.live),
+        ('ivnet_store_last_id', 'gauge', 'Id of the newest stored fix.', len(store)),
+        ('ivnet_store_first_id', 'gauge', 'Oldest id still retained.', store.first_id),
+        ('ivnet_store_deleted', 'gauge', 'Retained fixes removed by deletion.', store.deleted),
+        ('ivnet_ingest_pending', 'gauge', 'Fixes acknowledged but not yet written to the store.', ingest.pending()),
+        ('ivnet_ingest_refused_total', 'counter', 'Fixes refused with a 503 while the write queue was full.', ingest.refused),
+        ('ivnet_thinning_seen_total', 'counter', 'Fixes offered to the thinner.', thinning['seen']),
+        ('ivnet_thinning_dropped_total', 'counter', 'Fixes not stored as repeats.', thinning['dropped']),
+        ('ivnet_thinning_simplified_total', 'counter', 'Fixes deleted by path simplification.', thinning['simplified']),
+        ('ivnet_thinning_sessions', 'gauge', 'Sessions the thinner is tracking.', thinning['sessions']),
+        ('ivnet_retention_expired_total', 'counter', 'Fixes expired by the retention sweeper.', retention.expired),
+        ('ivnet_retention_reclaimed_total', 'counter', 'Segments and generations unmapped and deleted.', retention.reclaimed),
+        ('ivnet_rate_limit_allowed_total', 'counter', 'Ingest requests the rate limiter let through.', rate_limit['allowed']),
+        ('ivnet_rate_limit_limited_total', 'counter', 'Ingest requests refused with a 429.', rate_limit['limited']),
+        ('ivnet_rate_limit_clients', 'gauge', 'Clients the rate limiter is tracking.', rate_limit['clients']),
+        ('ivnet_log_events_dropped_total', 'counter', 'Log events lost to a full queue.', logs.dropped()),
+    ]
+    if broadcaster is not None:
+        families.append(('ivnet_live_clients', 'gauge', 'Open /live streams.', broadcaster.clients))
+    return Response(metrics.exposition(families + metrics.process_families()), content_type=metrics.CONTENT_TYPE)